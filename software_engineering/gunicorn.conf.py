@@ -0,0 +1,54 @@
+# Gunicorn settings for the production profile. Run from any directory:
+#   gunicorn --config software_engineering/gunicorn.conf.py
+# https://docs.gunicorn.org/en/stable/settings.html
+import glob
+import os
+import tempfile
+
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE", "software_engineering.production_settings"
+)
+# Each worker keeps its own metrics; /metrics adds up their files here.
+os.environ.setdefault(
+    "API_METRICS_DIR",
+    os.path.join(tempfile.gettempdir(), "software-engineering-metrics"),
+)
+
+# The project directory, where wsgi_app is imported from.
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = "software_engineering.wsgi:application"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:9999")
+
+# Each thread keeps its own database connection (CONN_MAX_AGE), so the
+# database sees up to workers * threads connections.
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+
+# Import Django once and fork the workers from it: faster startup and
+# memory shared between workers.
+preload_app = True
+
+# Recycle workers now and then, so a leak cannot grow without bound.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+
+
+def on_starting(server):
+    # Totals start from zero with each server, as in a single process.
+    for pattern in ("*.json", "*.lock"):
+        for path in glob.glob(os.path.join(os.environ["API_METRICS_DIR"], pattern)):
+            os.remove(path)
+
+
+def worker_exit(server, worker):
+    # Writes what the worker recorded since its last write.
+    from django.conf import settings
+    from myapp.metrics import get_shared_directory
+
+    shared = get_shared_directory(settings.API_METRICS_DIR)
+    if shared is not None:
+        shared.flush()
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Product, Customer, Order
+from .models import Product, Customer, Order, OrderTransition
 
 admin.site.register(Product)
 admin.site.register(Customer)
 admin.site.register(Order)
+admin.site.register(OrderTransition)
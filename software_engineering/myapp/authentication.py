@@ -0,0 +1,49 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .cache import user_cache
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    simplejwt's JWTAuthentication with users resolved through user_cache.
+    Cached users go through the same active and revocation checks as
+    freshly loaded ones.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, user)
+        return self.check_user(user, validated_token)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def check_user(self, user, validated_token):
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Cached users carry the digest instead of the password hash.
+            password_digest = getattr(user, "password_digest", None)
+            if password_digest is None:
+                password_digest = get_md5_hash_password(user.password)
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_digest:
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
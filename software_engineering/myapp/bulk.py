@@ -0,0 +1,67 @@
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+
+class BulkMixin:
+    @action(detail=False, methods=["post"])
+    def bulk(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        instances = serializer.save()
+        return Response(
+            self.get_bulk_representation(instances), status=status.HTTP_201_CREATED
+        )
+
+    @bulk.mapping.put
+    def bulk_update(self, request, *args, **kwargs):
+        instances = self.get_bulk_instances(request.data)
+        serializer = self.get_serializer(
+            instances,
+            data=request.data,
+            many=True,
+            partial=request.method == "PATCH",
+        )
+        serializer.is_valid(raise_exception=True)
+        instances = serializer.save()
+        return Response(self.get_bulk_representation(instances))
+
+    @bulk.mapping.patch
+    def bulk_partial_update(self, request, *args, **kwargs):
+        return self.bulk_update(request, *args, **kwargs)
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return Response(
+                {"non_field_errors": ["Expected a list of ids."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        instances = self.get_bulk_instances([{"id": pk} for pk in request.data])
+        found = {str(instance.pk) for instance in instances}
+        errors = [
+            {} if str(pk) in found else {"id": ["Not found."]} for pk in request.data
+        ]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        self.get_queryset().filter(pk__in=found).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_bulk_instances(self, data):
+        if not isinstance(data, list):
+            return []
+        pks = []
+        for item in data:
+            try:
+                pks.append(int(item["id"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return list(self.get_queryset().filter(pk__in=pks))
+
+    def get_bulk_representation(self, instances):
+        # Re-read through get_queryset() so related data is prefetched for
+        # every saved row at once, then keep the request's order.
+        loaded = self.get_queryset().in_bulk([instance.pk for instance in instances])
+        return self.get_serializer(
+            [loaded[instance.pk] for instance in instances], many=True
+        ).data
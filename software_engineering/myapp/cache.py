@@ -0,0 +1,173 @@
+import hashlib
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from . import metrics
+
+
+class ReadCache:
+    """
+    Versioned read-through cache: entries are keyed by a namespace version,
+    so invalidating a namespace is a single increment and stale entries are
+    left to the backend's TTL and size-based eviction. Hits and misses are
+    counted in myapp.metrics, labelled with the namespace.
+    """
+
+    def __init__(self, namespace, alias=None, timeout=None):
+        self.namespace = namespace
+        self.alias = alias or settings.API_CACHE_ALIAS
+        self.timeout = timeout if timeout is not None else settings.API_CACHE_TIMEOUT
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def version_key(self):
+        return f"{self.namespace}:version"
+
+    def get_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            # Start from the clock rather than 1, so a version key that was
+            # evicted never comes back to a number with live entries.
+            self.cache.add(self.version_key, time.time_ns(), timeout=None)
+            version = self.cache.get(self.version_key)
+        return version
+
+    def make_key(self, value):
+        digest = hashlib.md5(value.encode()).hexdigest()
+        return f"{self.namespace}:{self.get_version()}:{digest}"
+
+    def get(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            metrics.read_cache_misses.inc(cache=self.namespace)
+        else:
+            metrics.read_cache_hits.inc(cache=self.namespace)
+        return value
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=self.timeout)
+
+    def invalidate(self):
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.set(self.version_key, time.time_ns(), timeout=None)
+
+    def invalidate_on_commit(self):
+        # Bump now for this transaction's own reads, and again on commit so
+        # responses cached from other connections before the commit are dropped.
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+    def stats(self):
+        return {
+            "hits": metrics.read_cache_hits.value(cache=self.namespace),
+            "misses": metrics.read_cache_misses.value(cache=self.namespace),
+        }
+
+
+product_cache = ReadCache("products")
+
+
+class UserCache:
+    """
+    Users by id for JWTAuthentication, so authenticated requests skip the
+    user lookup. Entries expire after API_USER_CACHE_TIMEOUT and are dropped
+    whenever the user is saved or deleted.
+
+    Only `fields` are cached, plus the digest of the password hash that
+    simplejwt compares with a token's revocation claim; cached users load
+    any other field on first access. The drop on save only reaches the cache
+    of the process that saved, so with several worker processes the cache
+    must be shared by all of them (see production_settings).
+    """
+
+    fields = ("id", "username", "is_active", "is_staff", "is_superuser")
+
+    def __init__(self, namespace, alias=None, timeout=None):
+        self.namespace = namespace
+        self.alias = alias or settings.API_CACHE_ALIAS
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return settings.API_USER_CACHE_TIMEOUT
+
+    def make_key(self, user_id):
+        return f"{self.namespace}:{user_id}"
+
+    def get(self, user_id):
+        if not self.get_timeout():
+            return None
+        return self.load(self.cache.get(self.make_key(user_id)))
+
+    def set(self, user_id, user):
+        if timeout := self.get_timeout():
+            self.cache.set(self.make_key(user_id), self.dump(user), timeout=timeout)
+
+    def dump(self, user):
+        return (
+            {name: getattr(user, name) for name in self.fields},
+            get_md5_hash_password(user.password),
+        )
+
+    def load(self, entry):
+        if entry is None:
+            return None
+        values, password_digest = entry
+        model = get_user_model()
+        # from_db() takes the values in the model's field order.
+        names = [
+            field.attname
+            for field in model._meta.concrete_fields
+            if field.attname in values
+        ]
+        user = model.from_db(None, names, [values[name] for name in names])
+        user.password_digest = password_digest
+        return user
+
+    def invalidate_on_commit(self, user_id):
+        # Same double drop as ReadCache: a request on another connection may
+        # cache the old row between now and the commit.
+        key = self.make_key(user_id)
+        self.cache.delete(key)
+        transaction.on_commit(lambda: self.cache.delete(key))
+
+
+user_cache = UserCache("users")
+
+
+class CachedReadMixin:
+    read_cache = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        # Staff get offset pagination for the same URI (AdminOffsetPagination).
+        audience = "staff" if request.user.is_staff else "user"
+        key = self.read_cache.make_key(f"{audience}:{request.build_absolute_uri()}")
+        data = self.read_cache.get(key)
+        if data is not None:
+            return Response(data, headers={"X-Cache": "HIT"})
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.read_cache.set(key, response.data)
+        response["X-Cache"] = "MISS"
+        return response
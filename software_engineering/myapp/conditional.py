@@ -0,0 +1,106 @@
+import hashlib
+from django.db.models import Count, Manager, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for list and retrieve. Validators come from
+    the updated_at columns, so a matching If-None-Match or If-Modified-Since
+    gets a 304 before anything is serialized.
+    """
+
+    last_modified_field = "updated_at"
+
+    def get_last_modified_fields(self):
+        # Related paths such as "customer__updated_at" can be added by views
+        # whose representation includes related rows.
+        return [self.last_modified_field]
+
+    def list(self, request, *args, **kwargs):
+        # Deletions do not move Max(updated_at), so collections only get an
+        # ETag, which also covers the row count.
+        etag = self.make_etag(request, *self.get_list_validators())
+        return self.conditional_response(
+            request, etag, None, super().list, *args, **kwargs
+        )
+
+    def get_list_validators(self):
+        fields = self.get_last_modified_fields()
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        aggregates = queryset.aggregate(
+            count=Count("pk", distinct=len(fields) > 1),
+            **{
+                f"last_modified_{index}": Max(field)
+                for index, field in enumerate(fields)
+            },
+        )
+        count = aggregates.pop("count")
+        return [count, _latest(aggregates.values())]
+
+    def retrieve(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        last_modified = _latest(
+            value
+            for field in self.get_last_modified_fields()
+            for value in _resolve_path(self.object, field.split("__"))
+        )
+        etag = self.make_etag(request, self.object.pk, last_modified)
+        return self.conditional_response(
+            request, etag, last_modified, super().retrieve, *args, **kwargs
+        )
+
+    def get_object(self):
+        if getattr(self, "object", None) is not None:
+            return self.object
+        return super().get_object()
+
+    def make_etag(self, request, *parts):
+        # The URL and media type are part of the key because query parameters
+        # (page, search, expand) and renderers change the representation.
+        value = "|".join(
+            str(part)
+            for part in (
+                request.get_full_path(),
+                request.accepted_renderer.media_type,
+                *parts,
+            )
+        )
+        return quote_etag(hashlib.md5(value.encode()).hexdigest())
+
+    def conditional_response(
+        self, request, etag, last_modified, handler, *args, **kwargs
+    ):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            if response.status_code == 304:
+                response["ETag"] = etag
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+        return response
+
+
+def _resolve_path(instance, path):
+    if instance is None:
+        return []
+    value = getattr(instance, path[0])
+    if isinstance(value, Manager):
+        return [
+            result
+            for related in value.all()
+            for result in _resolve_path(related, path[1:])
+        ]
+    if len(path) == 1:
+        return [value]
+    return _resolve_path(value, path[1:])
+
+
+def _latest(values):
+    return max((value for value in values if value is not None), default=None)
@@ -0,0 +1,37 @@
+from itertools import islice
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from .renderers import CSVRenderer, NDJSONRenderer
+from .serializers import ValuesSerializer
+
+
+class ExportMixin:
+    export_chunk_size = 2000
+
+    @action(
+        detail=False,
+        methods=["get"],
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+        pagination_class=None,
+    )
+    def export(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).order_by("pk")
+        renderer = request.accepted_renderer
+        fields = list(self.get_serializer().fields)
+        response = StreamingHttpResponse(
+            renderer.render_rows(self.iter_export_rows(queryset), fields),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{self.basename}s.{renderer.format}"'
+        )
+        return response
+
+    def iter_export_rows(self, queryset):
+        # iterator() streams values() rows from a server-side cursor and each
+        # chunk loads its related items at once, so memory is bounded by the
+        # chunk.
+        serializer = ValuesSerializer(self.get_serializer())
+        rows = serializer.values(queryset).iterator(chunk_size=self.export_chunk_size)
+        while chunk := list(islice(rows, self.export_chunk_size)):
+            yield from serializer.to_representation(chunk)
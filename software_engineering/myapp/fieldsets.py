@@ -0,0 +1,54 @@
+from django.core.exceptions import FieldDoesNotExist
+
+
+class SparseFieldsetMixin:
+    """
+    ?fields= and ?omit= for list, retrieve and export. The serializer only
+    keeps the selected fields, so list and export only select their columns
+    through ValuesSerializer, and retrieve loads them with .only(). Views
+    check is_field_selected() before joining or prefetching a relation.
+    """
+
+    fields_query_param = "fields"
+    omit_query_param = "omit"
+    sparse_actions = ("list", "retrieve", "export")
+
+    def get_field_selection(self):
+        if self.request is None or getattr(self, "action", None) not in (
+            self.sparse_actions
+        ):
+            return None, []
+        selected = self.get_field_names(self.fields_query_param)
+        return selected, self.get_field_names(self.omit_query_param) or []
+
+    def get_field_names(self, param):
+        value = self.request.query_params.get(param, "")
+        return [name for name in map(str.strip, value.split(",")) if name] or None
+
+    def is_field_selected(self, name):
+        selected, omitted = self.get_field_selection()
+        return (selected is None or name in selected) and name not in omitted
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"], context["omit"] = self.get_field_selection()
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != "retrieve" or self.get_field_selection() == (None, []):
+            return queryset
+        return queryset.only(*self.get_loaded_fields(queryset.model))
+
+    def get_loaded_fields(self, model):
+        # The conditional GET validator is always needed.
+        names = {model._meta.pk.name, getattr(self, "last_modified_field", None)}
+        for field in self.get_serializer().fields.values():
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                names.add(model_field.name)
+        names.discard(None)
+        return sorted(names)
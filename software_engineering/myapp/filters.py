@@ -0,0 +1,188 @@
+from functools import reduce
+from operator import add
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, Exists, FloatField, OuterRef, Value, When
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend, OrderingFilter, SearchFilter
+from .models import Order
+
+
+class RankedSearchFilter(SearchFilter):
+    """
+    SearchFilter whose icontains matching is served by the trigram GIN index
+    on UPPER(name). With ?rank=true PostgreSQL also orders matches: prefix
+    matches first, then by trigram word similarity. Ranking scores every
+    match, so it stays opt-in. Other databases get plain SearchFilter
+    behaviour.
+    """
+
+    rank_param = "rank"
+    rank_field = "search_rank"
+
+    def filter_queryset(self, request, queryset, view):
+        queryset = super().filter_queryset(request, queryset, view)
+        if not self.is_ranked(request, queryset, view):
+            return queryset
+        rank = self.get_rank(
+            self.get_search_fields(view, request), self.get_search_terms(request)
+        )
+        return queryset.annotate(**{self.rank_field: rank})
+
+    def get_rank(self, search_fields, search_terms):
+        ranks = []
+        for search_field in search_fields:
+            field_name = search_field.lstrip("".join(self.lookup_prefixes))
+            for term in search_terms:
+                prefix = Case(
+                    When(**{f"{field_name}__istartswith": term}, then=Value(1.0)),
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                )
+                ranks.append(prefix + TrigramWordSimilarity(term, field_name))
+        return reduce(add, ranks)
+
+    def get_ordering(self, request, queryset, view):
+        # Picked up by KeysetPagination, which needs a unique trailing field.
+        if self.is_ranked(request, queryset, view):
+            return (f"-{self.rank_field}", "id")
+        return None
+
+    def is_ranked(self, request, queryset, view):
+        return (
+            request.query_params.get(self.rank_param) in ("1", "true")
+            and bool(self.get_search_fields(view, request))
+            and bool(self.get_search_terms(request))
+            and self.supports_ranking(queryset)
+        )
+
+    def supports_ranking(self, queryset):
+        return connections[queryset.db].vendor == "postgresql"
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.rank_param,
+                "required": False,
+                "in": "query",
+                "description": "Order search results by relevance.",
+                "schema": {"type": "boolean"},
+            }
+        ]
+
+
+class KeysetOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that ends every requested ordering on "id", so
+    KeysetPagination can page over it. The tie-breaker follows the direction
+    of the leading field, letting a (field, id) index be scanned either way.
+    A view's `ordering_sources` maps ordering_fields names to the model
+    fields behind them, like serializer field sources.
+    """
+
+    unique_field = "id"
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        sources = getattr(view, "ordering_sources", {})
+        ordering = [self.get_source(term, sources) for term in ordering]
+        if not any(term.lstrip("-") == self.unique_field for term in ordering):
+            direction = "-" if ordering[0].startswith("-") else ""
+            ordering.append(f"{direction}{self.unique_field}")
+        return tuple(ordering)
+
+    def get_source(self, term, sources):
+        name = term.lstrip("-")
+        return term[: len(term) - len(name)] + sources.get(name, name)
+
+
+class OrderFilter(BaseFilterBackend):
+    """
+    Filters orders on ?status=, ?customer= and ?product= (comma-separated
+    for several) and on an inclusive ?date_after= / ?date_before= range.
+    Each filter pairs with an Order index that also serves the default
+    (date, id) ordering: (status, date, id), the partial index on open
+    statuses and (customer, date, id). Products are matched with EXISTS, so
+    an order is listed once however many of them it contains.
+    """
+
+    # (query parameter, lookup, field, description); "__in" lookups take lists.
+    filters = (
+        (
+            "status",
+            "status__in",
+            serializers.ChoiceField(Order.STATUS_CHOICES),
+            "Comma-separated order statuses.",
+        ),
+        (
+            "customer",
+            "customer_id__in",
+            serializers.IntegerField(),
+            "Comma-separated customer ids.",
+        ),
+        (
+            "product",
+            "product_id__in",
+            serializers.IntegerField(),
+            "Comma-separated product ids.",
+        ),
+        (
+            "date_after",
+            "date__gte",
+            serializers.DateField(),
+            "Earliest order date, inclusive.",
+        ),
+        (
+            "date_before",
+            "date__lte",
+            serializers.DateField(),
+            "Latest order date, inclusive.",
+        ),
+    )
+
+    def is_filtering(self, request):
+        return any(request.query_params.get(param) for param, *_ in self.filters)
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        for param, lookup, field, _ in self.filters:
+            value = request.query_params.get(param)
+            if value:
+                lookups[lookup] = self.parse(param, value, lookup, field)
+
+        products = lookups.pop("product_id__in", None)
+        if products is not None:
+            queryset = queryset.filter(
+                Exists(
+                    Order.products.through.objects.filter(
+                        order_id=OuterRef("pk"), product_id__in=products
+                    )
+                )
+            )
+        return queryset.filter(**lookups)
+
+    def parse(self, param, value, lookup, field):
+        try:
+            if lookup.endswith("__in"):
+                return [field.run_validation(item.strip()) for item in value.split(",")]
+            return field.run_validation(value)
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({param: exc.detail})
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": param,
+                "required": False,
+                "in": "query",
+                "description": description,
+                "schema": (
+                    {"type": "string", "format": "date"}
+                    if isinstance(field, serializers.DateField)
+                    else {"type": "string"}
+                ),
+            }
+            for param, _, field, description in self.filters
+        ]
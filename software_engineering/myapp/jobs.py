@@ -0,0 +1,251 @@
+import io
+import json
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, QueryDict
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .models import Job
+from .serializers import JobSerializer
+
+logger = logging.getLogger(__name__)
+
+FILENAME_RE = re.compile(r'filename="([^"]+)"')
+
+# How often an idle worker deletes expired jobs, in seconds.
+EXPIRE_INTERVAL = 60
+
+
+class DeferredActionMixin:
+    """
+    Lets a client send `Prefer: respond-async` to have one of the
+    deferred_actions run by a run_workers process instead of in the request.
+    The request is authenticated and permission-checked as usual, stored as
+    a Job and answered with 202 Accepted and the /api/jobs/{id}/ URL to poll.
+    The worker replays it as the same user, so the job ends with the status
+    and body the request would have had.
+    """
+
+    deferred_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.deferred_actions and prefers_async(request):
+            # dispatch() looks the handler up once initial() has passed.
+            setattr(self, request.method.lower(), self.defer)
+
+    def defer(self, request, *args, **kwargs):
+        data = request.data
+        if isinstance(data, QueryDict):
+            data = data.dict()
+        job = Job.objects.create(
+            user=request.user if request.user.is_authenticated else None,
+            request={
+                "method": request.method,
+                "path": request.path,
+                "query_string": request.META.get("QUERY_STRING", ""),
+                "host": request.get_host(),
+                "scheme": request.scheme,
+                "accept": request.META.get("HTTP_ACCEPT", ""),
+            },
+            data=data or None,
+        )
+        # The job is answered in one of the API's formats, not in the
+        # action's own, such as CSV or NDJSON for exports. Negotiation raises
+        # Http404 for a ?format= it has no renderer for.
+        renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+        try:
+            request.accepted_renderer, request.accepted_media_type = (
+                self.get_content_negotiator().select_renderer(request, renderers)
+            )
+        except (Http404, NotAcceptable):
+            request.accepted_renderer = renderers[0]
+            request.accepted_media_type = renderers[0].media_type
+        serializer = JobSerializer(job, context={"request": request})
+        return Response(
+            serializer.data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={
+                "Location": serializer.data["url"],
+                "Preference-Applied": "respond-async",
+            },
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.action in self.deferred_actions:
+            patch_vary_headers(response, ("Prefer",))
+        return response
+
+
+def prefers_async(request):
+    preferences = request.headers.get("Prefer", "").replace(";", ",").split(",")
+    return "respond-async" in map(str.strip, preferences)
+
+
+def claim_job():
+    """
+    Marks the oldest queued job running and returns it, or None. SKIP LOCKED
+    lets any number of workers claim at once without waiting on each other.
+    Jobs left running past JOB_LEASE_SECONDS lost their worker; they are
+    claimed again until JOB_MAX_ATTEMPTS, then failed.
+    """
+    while True:
+        now = timezone.now()
+        expired = now - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        with transaction.atomic():
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status="queued") | Q(status="running", started_at__lt=expired)
+                )
+                .order_by("id")
+                .first()
+            )
+            if job is None:
+                return None
+            if job.status == "running" and job.attempts >= settings.JOB_MAX_ATTEMPTS:
+                job.status = "failed"
+                job.error = "The worker running this job stopped."
+                job.finished_at = now
+                job.save(update_fields=["status", "error", "finished_at"])
+                continue
+            job.status = "running"
+            job.started_at = now
+            job.attempts += 1
+            job.save(update_fields=["status", "started_at", "attempts"])
+            return job
+
+
+def run_job(job):
+    try:
+        response = replay(job)
+        if response.streaming:
+            job.result_file, job.result = write_result_file(job, response)
+        else:
+            job.result = getattr(response, "data", None)
+        job.status_code = response.status_code
+        job.status = "succeeded" if response.status_code < 400 else "failed"
+    except Exception as exc:
+        logger.exception("Job %s failed", job.pk)
+        job.status = "failed"
+        job.error = f"{type(exc).__name__}: {exc}"
+    job.finished_at = timezone.now()
+    job.save(
+        update_fields=[
+            "status",
+            "status_code",
+            "result",
+            "result_file",
+            "error",
+            "finished_at",
+        ]
+    )
+    return job
+
+
+def replay(job):
+    # Rebuilds the request the way a WSGI server would, authenticated as
+    # the job's user through DRF's forced authentication.
+    body = b""
+    if job.data is not None:
+        body = json.dumps(job.data, cls=DjangoJSONEncoder).encode()
+    request = WSGIRequest(
+        {
+            "REQUEST_METHOD": job.request["method"],
+            "PATH_INFO": job.request["path"],
+            "QUERY_STRING": job.request["query_string"],
+            "HTTP_HOST": job.request["host"],
+            "HTTP_ACCEPT": job.request["accept"] or "*/*",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "SERVER_NAME": job.request["host"].split(":")[0],
+            "SERVER_PORT": "443" if job.request["scheme"] == "https" else "80",
+            "wsgi.url_scheme": job.request["scheme"],
+            "wsgi.input": io.BytesIO(body),
+        }
+    )
+    request._force_auth_user = job.user
+    request.deferred_job = job
+    match = resolve(request.path_info)
+    request.resolver_match = match
+    return match.func(request, *match.args, **match.kwargs)
+
+
+def write_result_file(job, response):
+    match = FILENAME_RE.search(response.get("Content-Disposition", ""))
+    filename = match.group(1) if match else "result"
+    name = f"job-{job.pk}-{filename}"
+    os.makedirs(settings.JOB_RESULT_DIR, exist_ok=True)
+    with open(os.path.join(settings.JOB_RESULT_DIR, name), "wb") as file:
+        for chunk in response.streaming_content:
+            file.write(chunk)
+    return name, {"content_type": response["Content-Type"], "filename": filename}
+
+
+def expire_jobs():
+    """
+    Deletes the jobs that finished more than JOB_RESULT_TTL seconds ago. The
+    post_delete receiver removes their result files once the delete commits.
+    Returns the number of jobs deleted.
+    """
+    expired = timezone.now() - timedelta(seconds=settings.JOB_RESULT_TTL)
+    deleted, _ = Job.objects.filter(finished_at__lt=expired).delete()
+    return deleted
+
+
+def run_worker(poll_interval, burst=False, shutdown=None):
+    """
+    Claims and runs jobs until SIGINT or SIGTERM, letting the current job
+    finish, or with `burst` until the queue is empty. `shutdown`, an Event
+    shared with a parent process, stops it the same way. While the queue is
+    empty it deletes expired jobs, every EXPIRE_INTERVAL seconds. Returns the
+    number of jobs run.
+    """
+    stopping = threading.Event()
+    handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            handlers[signum] = signal.signal(signum, lambda *args: stopping.set())
+
+    processed = 0
+    next_expiry = 0
+    try:
+        while not stopping.is_set() and not (shutdown and shutdown.is_set()):
+            # Bracketed like a request, so CONN_MAX_AGE and connection health
+            # checks apply between jobs.
+            request_started.send(sender=Job)
+            try:
+                job = claim_job()
+                if job is not None:
+                    run_job(job)
+                    processed += 1
+                elif time.monotonic() >= next_expiry:
+                    expire_jobs()
+                    next_expiry = time.monotonic() + EXPIRE_INTERVAL
+            finally:
+                request_finished.send(sender=Job)
+            if job is None:
+                if burst:
+                    break
+                (shutdown or stopping).wait(poll_interval)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    return processed
@@ -0,0 +1,385 @@
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from django import get_version
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from myapp.models import Product, Customer, Order
+
+SEARCH_TERMS = ["product 1", "product 42", "99", "7"]
+# High enough that no scenario is throttled, while still paying for the check.
+THROTTLE_RATE = "1000000/s"
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed the database at a given scale and benchmark every API endpoint, "
+        "in-process through the test client and concurrently through a local "
+        "WSGI server. Seeding replaces the existing data; use --no-seed to "
+        "reuse it. Throttle rates are raised for the run. Fails when a "
+        "request is throttled or a result regresses past --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=10_000)
+        parser.add_argument("--customers", type=int, default=1_000)
+        parser.add_argument("--orders", type=int, default=50_000)
+        parser.add_argument("--products-per-order", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--no-seed", action="store_true")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--mode", choices=["inprocess", "server", "both"], default="both"
+        )
+        parser.add_argument(
+            "--host",
+            default="localhost",
+            help="Host header to send; it must be in ALLOWED_HOSTS.",
+        )
+        parser.add_argument(
+            "--username",
+            help="Existing user to send requests as; the first superuser by default.",
+        )
+        parser.add_argument(
+            "--password",
+            help="The user's password, to also benchmark obtaining a token.",
+        )
+        parser.add_argument("--output", help="Write the results as JSON here.")
+        parser.add_argument("--baseline", help="JSON results to compare against.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed relative slowdown before a result counts as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        # Looked up first, so a missing user does not cost a seeding run.
+        self.get_user(options["username"])
+        if not options["no_seed"]:
+            call_command(
+                "populate_sample_data",
+                products=options["products"],
+                customers=options["customers"],
+                orders=options["orders"],
+                products_per_order=options["products_per_order"],
+                seed=options["seed"],
+                copy=connection.vendor == "postgresql",
+                stdout=self.stdout,
+            )
+        self.rng = random.Random(options["seed"])
+        self.host = options["host"]
+        self.product_ids = list(Product.objects.values_list("id", flat=True)[:1000])
+        self.customer_ids = list(Customer.objects.values_list("id", flat=True)[:1000])
+        self.order_ids = list(Order.objects.values_list("id", flat=True)[:1000])
+        if not (self.product_ids and self.customer_ids and self.order_ids):
+            raise CommandError(
+                "Benchmarks need at least one product, customer and order."
+            )
+        self.authenticate(self.get_user(options["username"]), options["password"])
+
+        modes = (
+            ["inprocess", "server"] if options["mode"] == "both" else [options["mode"]]
+        )
+        results = {
+            "meta": {
+                "created": timezone.now().isoformat(),
+                "django": get_version(),
+                "database": connection.vendor,
+                "products": Product.objects.count(),
+                "customers": Customer.objects.count(),
+                "orders": Order.objects.count(),
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+            },
+            "results": {},
+        }
+        rates = settings.REST_FRAMEWORK.get("DEFAULT_THROTTLE_RATES", {})
+        with override_settings(
+            REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK,
+                "DEFAULT_THROTTLE_RATES": {scope: THROTTLE_RATE for scope in rates},
+            }
+        ):
+            for mode in modes:
+                if mode == "inprocess":
+                    runs = self.run_in_process(options["requests"])
+                else:
+                    runs = self.run_server(options["requests"], options["concurrency"])
+                results["results"][mode] = runs
+                self.write_table(mode, runs)
+        # 429s return before the view runs, so their timings would flatter it.
+        throttled = [
+            f"{mode} {name}"
+            for mode, runs in results["results"].items()
+            for name, run in runs.items()
+            if run["throttled"]
+        ]
+        if throttled:
+            raise CommandError(
+                f"Requests were throttled in {', '.join(throttled)}; "
+                "raise the API_THROTTLE_*_RATE settings."
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                regressions = self.compare(
+                    json.load(baseline), results, options["tolerance"]
+                )
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} results regressed past the baseline."
+                )
+            self.stdout.write(
+                self.style.SUCCESS("No regressions against the baseline.")
+            )
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by("pk").first()
+        if user is None:
+            raise CommandError("No such user; pass --username or create a superuser.")
+        return user
+
+    def authenticate(self, user, password):
+        refresh = RefreshToken.for_user(user)
+        self.refresh_token = str(refresh)
+        self.access_token = str(refresh.access_token)
+        self.credentials = None
+        if password is not None:
+            self.credentials = {"username": user.username, "password": password}
+            response = APIClient(HTTP_HOST=self.host).post(
+                reverse("token_obtain_pair"), self.credentials, format="json"
+            )
+            if response.status_code != 200:
+                raise CommandError("--password is not the user's password.")
+
+    def scenarios(self):
+        # name -> callable returning (method, path, body)
+        rng = self.rng
+        today = timezone.localdate().isoformat()
+        scenarios = {
+            "products-list": lambda: ("GET", reverse("product-list"), None),
+            "products-retrieve": lambda: (
+                "GET",
+                reverse("product-detail", args=[rng.choice(self.product_ids)]),
+                None,
+            ),
+            "products-search": lambda: (
+                "GET",
+                f"{reverse('product-list')}?{urlencode({'search': rng.choice(SEARCH_TERMS)})}",
+                None,
+            ),
+            "products-create": lambda: (
+                "POST",
+                reverse("product-list"),
+                {"name": "Benchmark product", "price": "9.99", "available": True},
+            ),
+            "customers-list": lambda: ("GET", reverse("customer-list"), None),
+            "customers-retrieve": lambda: (
+                "GET",
+                reverse("customer-detail", args=[rng.choice(self.customer_ids)]),
+                None,
+            ),
+            "customers-create": lambda: (
+                "POST",
+                reverse("customer-list"),
+                {"name": "Benchmark customer", "address": "1 Main St"},
+            ),
+            "orders-list": lambda: ("GET", reverse("order-list"), None),
+            "orders-retrieve": lambda: (
+                "GET",
+                reverse("order-detail", args=[rng.choice(self.order_ids)]),
+                None,
+            ),
+            "orders-create": lambda: (
+                "POST",
+                reverse("order-list"),
+                {
+                    "customer": rng.choice(self.customer_ids),
+                    "products": rng.sample(self.product_ids, 2),
+                    "date": today,
+                    "status": "New",
+                },
+            ),
+            "token-refresh": lambda: (
+                "POST",
+                reverse("token_refresh"),
+                {"refresh": self.refresh_token},
+            ),
+        }
+        if self.credentials is not None:
+            scenarios["token-obtain"] = lambda: (
+                "POST",
+                reverse("token_obtain_pair"),
+                self.credentials,
+            )
+        return scenarios
+
+    def run_in_process(self, requests):
+        client = APIClient(HTTP_HOST=self.host)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        runs = {}
+        for name, build in self.scenarios().items():
+            timings, queries, errors, throttled = [], [], 0, 0
+            started = time.perf_counter()
+            for _ in range(requests):
+                method, path, body = build()
+                with CaptureQueriesContext(connection) as captured:
+                    request_started = time.perf_counter()
+                    response = client.generic(
+                        method,
+                        path,
+                        json.dumps(body) if body is not None else "",
+                        content_type="application/json",
+                    )
+                    timings.append(time.perf_counter() - request_started)
+                queries.append(len(captured))
+                errors += response.status_code >= 400
+                throttled += response.status_code == 429
+            runs[name] = self.summarize(
+                timings, time.perf_counter() - started, errors, throttled, queries
+            )
+        return runs
+
+    def run_server(self, requests, concurrency):
+        server = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler)
+        server.set_app(WSGIHandler())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Content-Type": "application/json",
+            "Host": f"{self.host}:{server.server_port}",
+        }
+
+        def send(request):
+            method, path, body = request
+            data = json.dumps(body).encode() if body is not None else None
+            http_request = urllib.request.Request(
+                base_url + path, data=data, headers=headers, method=method
+            )
+            request_started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(http_request) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as exc:
+                status = exc.code
+            except OSError as exc:
+                raise CommandError(f"{method} {path} failed: {exc}") from exc
+            return time.perf_counter() - request_started, status
+
+        runs = {}
+        try:
+            with ThreadPoolExecutor(concurrency) as executor:
+                for name, build in self.scenarios().items():
+                    batch = [build() for _ in range(requests)]
+                    started = time.perf_counter()
+                    outcomes = list(executor.map(send, batch))
+                    runs[name] = self.summarize(
+                        [timing for timing, _ in outcomes],
+                        time.perf_counter() - started,
+                        sum(status >= 400 for _, status in outcomes),
+                        sum(status == 429 for _, status in outcomes),
+                    )
+        finally:
+            server.shutdown()
+            server.server_close()
+        return runs
+
+    def summarize(self, timings, elapsed, errors, throttled, queries=None):
+        timings_ms = [timing * 1000 for timing in timings]
+        if len(timings_ms) > 1:
+            cuts = statistics.quantiles(timings_ms, n=100, method="inclusive")
+        else:
+            cuts = timings_ms * 99
+        return {
+            "requests": len(timings_ms),
+            "errors": errors,
+            "throttled": throttled,
+            "throughput_rps": round(len(timings_ms) / elapsed, 2) if elapsed else 0,
+            "p50_ms": round(statistics.median(timings_ms), 3),
+            "p95_ms": round(cuts[94], 3),
+            "p99_ms": round(cuts[98], 3),
+            "queries_per_request": (
+                round(statistics.mean(queries), 2) if queries else None
+            ),
+            "max_queries": max(queries) if queries else None,
+        }
+
+    def compare(self, baseline, results, tolerance):
+        regressions = []
+        for mode, runs in results["results"].items():
+            for name, run in runs.items():
+                before = baseline.get("results", {}).get(mode, {}).get(name)
+                if before is None:
+                    continue
+                label = f"{mode} {name}"
+                if run["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                    regressions.append(
+                        f"{label}: p95 {run['p95_ms']} ms, baseline {before['p95_ms']} ms"
+                    )
+                if run["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+                    regressions.append(
+                        f"{label}: {run['throughput_rps']} req/s, "
+                        f"baseline {before['throughput_rps']} req/s"
+                    )
+                # Means move with the cache hit ratio; the worst case does not.
+                if (
+                    run["max_queries"] is not None
+                    and before.get("max_queries") is not None
+                    and run["max_queries"] > before["max_queries"]
+                ):
+                    regressions.append(
+                        f"{label}: {run['max_queries']} queries per request, "
+                        f"baseline {before['max_queries']}"
+                    )
+                if run["errors"] > before["errors"]:
+                    regressions.append(
+                        f"{label}: {run['errors']} errors, baseline {before['errors']}"
+                    )
+        return regressions
+
+    def write_table(self, mode, runs):
+        self.stdout.write(
+            f"\n{mode:<20}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'queries':>9}{'errors':>8}"
+        )
+        for name, run in runs.items():
+            queries = run["queries_per_request"]
+            self.stdout.write(
+                f"{name:<20}{run['throughput_rps']:>10.1f}{run['p50_ms']:>10.2f}"
+                f"{run['p95_ms']:>10.2f}{run['p99_ms']:>10.2f}"
+                f"{'-' if queries is None else queries:>9}{run['errors']:>8}"
+            )
@@ -0,0 +1,81 @@
+import io
+import json
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from myapp.models import Order
+from myapp.renderers import (
+    MessagePackParser,
+    MessagePackRenderer,
+    ORJSONParser,
+    ORJSONRenderer,
+)
+from myapp.serializers import OrderSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare response size and encode/decode time of the JSON, orjson and "
+        "MessagePack formats on a serialized order list."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--expand",
+            default="customer,products",
+            help="Comma-separated relations to nest, as in ?expand=.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = (
+            Order.objects.select_related("customer")
+            .prefetch_related("products")
+            .order_by("id")[: options["orders"]]
+        )
+        expand = [field for field in options["expand"].split(",") if field]
+        data = OrderSerializer(queryset, many=True, context={"expand": expand}).data
+        if not data:
+            raise CommandError("Run populate_sample_data first.")
+
+        formats = (
+            ("json (stdlib)", JSONRenderer(), lambda body: json.loads(body)),
+            ("json (orjson)", ORJSONRenderer(), ORJSONParser()),
+            ("msgpack", MessagePackRenderer(), MessagePackParser()),
+        )
+        self.stdout.write(f"{len(data)} orders, expand={','.join(expand) or '-'}")
+        self.stdout.write(
+            f"{'format':<16}{'bytes':>12}{'encode ms':>12}{'decode ms':>12}"
+            f"{'MB/s':>10}"
+        )
+        reference = None
+        for name, renderer, parser in formats:
+            encode_ms, body = self.measure(
+                lambda: renderer.render(data), options["repeat"]
+            )
+            decode_ms, _ = self.measure(
+                lambda: self.parse(parser, body), options["repeat"]
+            )
+            self.stdout.write(
+                f"{name:<16}{len(body):>12}{encode_ms:>12.2f}{decode_ms:>12.2f}"
+                f"{len(body) / 1000 / encode_ms:>10.1f}"
+            )
+            if name.startswith("json"):
+                if reference is not None and body != reference:
+                    raise CommandError(f"{name} output differs from stdlib JSON.")
+                reference = body
+
+    def measure(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), result
+
+    def parse(self, parser, body):
+        if callable(parser):
+            return parser(body)
+        return parser.parse(io.BytesIO(body))
@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from myapp.filters import RankedSearchFilter
+from myapp.models import Product
+
+ADJECTIVES = ["Red", "Blue", "Green", "Large", "Small", "Classic", "Modern", "Soft"]
+NOUNS = ["shirt", "socks", "jacket", "lamp", "table", "chair", "mug", "backpack"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare product search latency with and without the trigram index "
+        "at a given catalog size. Products are added in a transaction that "
+        "is rolled back once the benchmark is done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=10_000,
+            help="Catalog size to measure at, e.g. 1000000 for a large catalog.",
+        )
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        self.seed_products(options["products"], options["batch_size"], rng)
+
+        # Half common word prefixes, half rare catalog numbers.
+        terms = [
+            (
+                rng.choice(NOUNS + ADJECTIVES)[: rng.randint(3, 6)].lower()
+                if index % 2
+                else str(rng.randrange(10**5))
+            )
+            for index in range(options["queries"])
+        ]
+        modes = (
+            ("icontains, no index", "legacy"),
+            ("icontains, trigram", "indexed"),
+            ("ranked, trigram", "ranked"),
+        )
+        if connection.vendor != "postgresql":
+            # The trigram index and similarity ranking need pg_trgm.
+            modes = modes[:1]
+        self.stdout.write(f"{'search':<24}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, mode in modes:
+            timings = self.measure(terms, options["page_size"], mode)
+            p50, p99 = self.percentiles(timings)
+            self.stdout.write(f"{name:<24}{p50:>10.2f}{p99:>10.2f}")
+
+    def seed_products(self, count, batch_size, rng):
+        missing = count - Product.objects.count()
+        while missing > 0:
+            size = min(batch_size, missing)
+            Product.objects.bulk_create(
+                Product(
+                    name=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randrange(10**6)}",
+                    price=rng.randint(1, 99999) / 100,
+                    available=rng.random() > 0.1,
+                )
+                for _ in range(size)
+            )
+            missing -= size
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Product._meta.db_table}")
+
+    def measure(self, terms, page_size, mode):
+        search = RankedSearchFilter()
+        timings = []
+        for term in terms:
+            queryset = Product.objects.filter(name__icontains=term)
+            if mode == "ranked":
+                rank = search.get_rank(["name"], [term])
+                queryset = queryset.annotate(search_rank=rank).order_by(
+                    "-search_rank", "id"
+                )
+            else:
+                queryset = queryset.order_by("id")
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                if mode == "legacy" and connection.vendor == "postgresql":
+                    # What the SearchFilter query cost before the index existed.
+                    cursor.execute("SET LOCAL enable_bitmapscan = off")
+                started = time.perf_counter()
+                list(queryset[:page_size])
+                timings.append((time.perf_counter() - started) * 1000)
+                # Rolling back the savepoint also undoes SET LOCAL.
+                transaction.set_rollback(True)
+        return timings
+
+    def percentiles(self, timings):
+        if len(timings) < 2:
+            return timings[0], timings[0]
+        cuts = statistics.quantiles(timings, n=100, method="inclusive")
+        return statistics.median(timings), cuts[98]
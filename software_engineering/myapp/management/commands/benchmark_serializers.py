@@ -0,0 +1,78 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from myapp.models import Customer, Order, Product
+from myapp.renderers import ORJSONRenderer
+from myapp.serializers import (
+    CustomerSerializer,
+    OrderSerializer,
+    ProductSerializer,
+    ValuesSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ModelSerializer and ValuesSerializer on large lists, from the "
+        "query to the serialized rows, and check both give the same output."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        orders = (
+            Order.objects.select_related("customer")
+            .prefetch_related(
+                Prefetch("products", queryset=Product.objects.order_by("id"))
+            )
+            .order_by("id")
+        )
+        cases = (
+            ("products", ProductSerializer(), Product.objects.order_by("id")),
+            ("customers", CustomerSerializer(), Customer.objects.order_by("id")),
+            ("orders", OrderSerializer(), orders),
+            (
+                "orders expanded",
+                OrderSerializer(context={"expand": ["customer", "products"]}),
+                orders,
+            ),
+        )
+        renderer = ORJSONRenderer()
+        self.stdout.write(
+            f"{'list':<18}{'rows':>8}{'model ms':>11}{'values ms':>11}{'speedup':>9}"
+        )
+        for name, serializer, queryset in cases:
+            queryset = queryset[:rows]
+            values_serializer = ValuesSerializer(serializer)
+            model_ms, model_data = self.measure(
+                lambda: type(serializer)(
+                    queryset, many=True, context=serializer.context
+                ).data,
+                options["repeat"],
+            )
+            values_ms, values_data = self.measure(
+                lambda: values_serializer.to_representation(
+                    values_serializer.values(queryset)
+                ),
+                options["repeat"],
+            )
+            if not model_data:
+                raise CommandError("Run populate_sample_data first.")
+            if renderer.render(model_data) != renderer.render(values_data):
+                raise CommandError(f"{name}: ValuesSerializer output differs.")
+            self.stdout.write(
+                f"{name:<18}{len(model_data):>8}{model_ms:>11.2f}{values_ms:>11.2f}"
+                f"{model_ms / values_ms:>8.1f}x"
+            )
+
+    def measure(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), result
@@ -0,0 +1,168 @@
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the development server (runserver with DEBUG on) with the "
+        "production profile (gunicorn with production_settings): the time "
+        "from launch to the first response, then requests per second and "
+        "latency of --clients concurrent clients fetching --path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/api/orders/?page_size=100")
+        parser.add_argument(
+            "--username", help="User to fetch as; the first superuser by default."
+        )
+        parser.add_argument("--clients", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument(
+            "--workers", type=int, help="gunicorn workers (WEB_CONCURRENCY)."
+        )
+        parser.add_argument(
+            "--threads", type=int, help="gunicorn threads (GUNICORN_THREADS)."
+        )
+        parser.add_argument("--accept-encoding", default="br, gzip")
+        parser.add_argument("--port", type=int, default=8765)
+
+    def handle(self, *args, **options):
+        if options["username"]:
+            user = User.objects.filter(username=options["username"]).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by("pk").first()
+        if user is None:
+            raise CommandError("No such user; pass --username or create a superuser.")
+
+        address = f"127.0.0.1:{options['port']}"
+        url = f"http://{address}{options['path']}"
+        headers = {
+            "Authorization": f"Bearer {AccessToken.for_user(user)}",
+            "Accept": "application/json",
+            "Accept-Encoding": options["accept_encoding"],
+        }
+        env = {
+            **os.environ,
+            "DJANGO_ALLOWED_HOSTS": "127.0.0.1 localhost",
+            # The servers must accept the token signed here.
+            "DJANGO_SECRET": settings.SECRET_KEY,
+            # The clients would otherwise spend the budget in a second.
+            "API_THROTTLE_READ_RATE": "1000000/s",
+            "API_THROTTLE_EXPORT_RATE": "1000000/s",
+        }
+        gunicorn_env = {
+            **env,
+            "DJANGO_SETTINGS_MODULE": "software_engineering.production_settings",
+            "GUNICORN_BIND": address,
+        }
+        if options["workers"]:
+            gunicorn_env["WEB_CONCURRENCY"] = str(options["workers"])
+        if options["threads"]:
+            gunicorn_env["GUNICORN_THREADS"] = str(options["threads"])
+        servers = (
+            (
+                "runserver",
+                [sys.executable, "manage.py", "runserver", "--noreload", address],
+                {
+                    **env,
+                    "DJANGO_SETTINGS_MODULE": "software_engineering.settings",
+                    "DEBUG": "1",
+                },
+            ),
+            (
+                "gunicorn",
+                [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py"],
+                gunicorn_env,
+            ),
+        )
+
+        self.stdout.write(
+            f"{'server':<12}{'startup s':>10}{'req/s':>9}{'p50 ms':>9}"
+            f"{'p99 ms':>9}{'errors':>8}{'bytes':>9}"
+        )
+        for name, command, server_env in servers:
+            process = subprocess.Popen(
+                command,
+                cwd=settings.BASE_DIR,
+                env=server_env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                startup = self.wait_for_first_response(process, url, headers)
+                latencies, sizes, errors, elapsed = self.load(
+                    url, headers, options["clients"], options["duration"]
+                )
+            finally:
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            if not latencies:
+                raise CommandError(f"{name}: no request succeeded.")
+            self.stdout.write(
+                f"{name:<12}{startup:>10.2f}{len(latencies) / elapsed:>9.0f}"
+                f"{statistics.median(latencies):>9.1f}"
+                f"{statistics.quantiles(latencies, n=100)[98]:>9.1f}"
+                f"{errors:>8}{statistics.mean(sizes):>9.0f}"
+            )
+
+    def wait_for_first_response(self, process, url, headers, timeout=60):
+        started = time.perf_counter()
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise CommandError(f"The server exited with {process.returncode}.")
+            try:
+                self.fetch(url, headers)
+                return time.perf_counter() - started
+            except urllib.error.HTTPError:
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise CommandError(f"No response from {url} in {timeout} seconds.")
+
+    def load(self, url, headers, clients, duration):
+        # A new connection per request, as runserver closes them anyway.
+        latencies, sizes = [], []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def client():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    size = self.fetch(url, headers)
+                except OSError:
+                    with lock:
+                        errors += 1
+                    continue
+                latency = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(latency)
+                    sizes.append(size)
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, sizes, errors, time.perf_counter() - started
+
+    def fetch(self, url, headers):
+        request = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return len(response.read())
@@ -1,32 +1,250 @@
-from django.core.management.base import BaseCommand
+import csv
+import io
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
 from myapp.models import Product, Customer, Order
-from datetime import date
+
+STREETS = ["Main", "Elm", "Oak", "Pine", "Maple", "Cedar", "Lake", "Hill"]
+
 
 class Command(BaseCommand):
-    def handle(self, *args, **kwargs):
-        # Delete existing entries
-        Product.objects.all().delete()
-        Customer.objects.all().delete()
-        Order.objects.all().delete()
-
-        # Create Product entries
-        product1 = Product.objects.create(name='Product 1', price=19.99, available=True)
-        product2 = Product.objects.create(name='Product 2', price=29.99, available=True)
-        product3 = Product.objects.create(name='Product 3', price=39.99, available=False)
-
-        # Create Customer entries
-        customer1 = Customer.objects.create(name='Customer 1', address='123 Main St')
-        customer2 = Customer.objects.create(name='Customer 2', address='456 Elm St')
-        customer3 = Customer.objects.create(name='Customer 3', address='789 Oak St')
-
-        # Create Order entries
-        order1 = Order.objects.create(customer=customer1, date=date.today(), status='New')
-        order2 = Order.objects.create(customer=customer2, date=date.today(), status='In Process')
-        order3 = Order.objects.create(customer=customer3, date=date.today(), status='Completed')
-
-        # Add products to orders
-        order1.products.add(product1, product2)
-        order2.products.add(product2, product3)
-        order3.products.add(product1, product3)
-
-        self.stdout.write("Data created successfully.")
\ No newline at end of file
+    help = (
+        "Populate the database with generated products, customers and orders. "
+        "Rows are written in batches with bulk_create, or with COPY on "
+        "PostgreSQL, so large datasets can be built for load testing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=3)
+        parser.add_argument("--customers", type=int, default=3)
+        parser.add_argument("--orders", type=int, default=3)
+        parser.add_argument("--products-per-order", type=int, default=2)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int)
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Load rows with PostgreSQL COPY instead of bulk_create.",
+        )
+        parser.add_argument(
+            "--keep-existing",
+            action="store_true",
+            help="Add to the existing data instead of deleting it first.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("--copy requires PostgreSQL.")
+        if options["orders"] and not (options["products"] and options["customers"]):
+            raise CommandError("Orders need at least one product and one customer.")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.use_copy = options["copy"]
+        self.now = timezone.now()
+
+        started = time.perf_counter()
+        if not options["keep_existing"]:
+            self.flush()
+        products = self.create_products(options["products"])
+        customers = self.create_customers(options["customers"])
+        rows = len(products) + len(customers)
+        rows += self.create_orders(
+            options["orders"], options["products_per_order"], products, customers
+        )
+        self.reset_sequences()
+        self.report("rows in total", rows, time.perf_counter() - started)
+
+        self.stdout.write("Data created successfully.")
+
+    def flush(self):
+        models = [Order.products.through, Order, Customer, Product]
+        dependents = self.get_dependents(models)
+        if dependents:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Also deleting every row of "
+                    + ", ".join(model._meta.label for model in dependents)
+                    + ", which reference the deleted rows."
+                )
+            )
+        if connection.vendor == "postgresql":
+            # Model.delete() would load every row to run the signal receivers.
+            # Every table is listed, so TRUNCATE fails rather than cascading
+            # into one it was not told about.
+            tables = ", ".join(
+                connection.ops.quote_name(model._meta.db_table)
+                for model in dependents + models
+            )
+            with connection.cursor() as cursor:
+                # TRUNCATE refuses to run while deferred FK checks are pending.
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                cursor.execute(f"TRUNCATE {tables} RESTART IDENTITY")
+        else:
+            for model in models:
+                model.objects.all().delete()
+
+    def get_dependents(self, models):
+        # Models whose rows Model.delete() would cascade to, outside `models`.
+        dependents = []
+        pending = list(models)
+        while pending:
+            for relation in pending.pop()._meta.related_objects:
+                model = relation.related_model
+                if model not in models and model not in dependents:
+                    dependents.append(model)
+                    pending.append(model)
+        return dependents
+
+    def create_products(self, count):
+        first_id = self.next_id(Product)
+        products = []
+        for product_id in range(first_id, first_id + count):
+            price = Decimal(self.rng.randint(100, 99999)).scaleb(-2)
+            available = self.rng.random() > 0.1
+            products.append((product_id, price, available))
+
+        rows = (
+            (product_id, f"Product {product_id}", price, available, self.now)
+            for product_id, price, available in products
+        )
+        self.load(Product, ("id", "name", "price", "available", "updated_at"), rows)
+        return products
+
+    def create_customers(self, count):
+        first_id = self.next_id(Customer)
+        customers = list(range(first_id, first_id + count))
+        rows = (
+            (
+                customer_id,
+                f"Customer {customer_id}",
+                f"{self.rng.randint(1, 999)} {self.rng.choice(STREETS)} St",
+                self.now,
+            )
+            for customer_id in customers
+        )
+        self.load(Customer, ("id", "name", "address", "updated_at"), rows)
+        return customers
+
+    def create_orders(self, count, products_per_order, products, customers):
+        # Links go straight into the through table, so the denormalized totals
+        # are computed here instead of by the m2m_changed receiver.
+        first_id = self.next_id(Order)
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+        size = min(products_per_order, len(products))
+        order_fields = (
+            "id",
+            "customer_id",
+            "date",
+            "status",
+            "updated_at",
+            "cached_total",
+            "item_count",
+            "is_fulfillable",
+        )
+        links = []
+
+        def generate():
+            today = date.today()
+            for order_id in range(first_id, first_id + count):
+                items = self.rng.sample(products, size)
+                links.extend((order_id, product_id) for product_id, _, _ in items)
+                yield (
+                    order_id,
+                    self.rng.choice(customers),
+                    today - timedelta(days=self.rng.randrange(365)),
+                    self.rng.choice(statuses),
+                    self.now,
+                    sum((price for _, price, _ in items), Decimal("0.00")),
+                    len(items),
+                    all(available for _, _, available in items),
+                )
+
+        started = time.perf_counter()
+        for batch in self.batches(generate()):
+            with transaction.atomic():
+                self.insert(Order, order_fields, batch)
+                self.insert(Order.products.through, ("order_id", "product_id"), links)
+            links.clear()
+        elapsed = time.perf_counter() - started
+        self.report("orders", count, elapsed)
+        self.report("order items", count * size, elapsed)
+        return count + count * size
+
+    def load(self, model, fields, rows):
+        started = time.perf_counter()
+        count = 0
+        for batch in self.batches(rows):
+            self.insert(model, fields, batch)
+            count += len(batch)
+        self.report(
+            model._meta.verbose_name_plural, count, time.perf_counter() - started
+        )
+
+    def batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def insert(self, model, fields, rows):
+        if not rows:
+            return
+        if self.use_copy:
+            self.copy(model, fields, rows)
+        else:
+            model.objects.bulk_create(
+                (model(**dict(zip(fields, row))) for row in rows),
+                batch_size=self.batch_size,
+            )
+
+    def copy(self, model, fields, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        columns = ", ".join(
+            connection.ops.quote_name(model._meta.get_field(field).column)
+            for field in fields
+        )
+        sql = (
+            f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) "
+            "FROM STDIN WITH (FORMAT csv)"
+        )
+        with connection.cursor() as cursor:
+            if hasattr(cursor, "copy_expert"):
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
+            else:
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    def next_id(self, model):
+        # Ids are assigned here so order items can be linked without reading
+        # generated keys back; the sequences are moved past them afterwards.
+        return (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+    def reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Product, Customer, Order]
+        )
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    def report(self, label, count, elapsed):
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Created {count} {label} in {elapsed:.2f}s ({rate:,.0f} rows/sec)."
+        )
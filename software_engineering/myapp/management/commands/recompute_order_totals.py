@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from myapp.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the denormalized cached_total, item_count and is_fulfillable "
+        "columns of every order, one id range per transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        bounds = Order.objects.aggregate(first=Min("id"), last=Max("id"))
+        if bounds["first"] is None:
+            self.stdout.write("No orders to recompute.")
+            return
+
+        updated = 0
+        for start in range(bounds["first"], bounds["last"] + 1, batch_size):
+            with transaction.atomic():
+                updated += Order.objects.filter(
+                    id__gte=start, id__lt=start + batch_size
+                ).refresh_totals()
+            self.stdout.write(
+                f"Recomputed {updated} orders (up to id {start + batch_size - 1})."
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Recomputed totals for {updated} orders.")
+        )
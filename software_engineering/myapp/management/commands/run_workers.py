@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from myapp.jobs import run_worker
+
+# The pool workers' shutdown Event. A multiprocessing Event reaches a
+# child only by inheritance, through the pool's initializer, not pickled
+# along with a submitted call.
+shutdown = None
+
+
+def init_worker(event):
+    global shutdown
+    shutdown = event
+
+
+def run_pool_worker(poll_interval, burst):
+    return run_worker(poll_interval, burst, shutdown=shutdown)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background job workers, one per process. Workers claim jobs with "
+        "SELECT ... FOR UPDATE SKIP LOCKED, so any number of them, on any "
+        "number of hosts, can share the queue. SIGINT or SIGTERM stops them "
+        "once their current job is done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL
+        )
+        parser.add_argument(
+            "--burst", action="store_true", help="Exit once the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        worker_args = (options["poll_interval"], options["burst"])
+        self.stdout.write(f"Starting {processes} worker(s).")
+        if processes == 1:
+            processed = run_worker(*worker_args)
+        else:
+            context = multiprocessing.get_context("fork")
+            shutdown = context.Event()
+            # docker stop signals only this process, so it tells the workers.
+            previous = {
+                signum: signal.signal(signum, lambda *args: shutdown.set())
+                for signum in (signal.SIGINT, signal.SIGTERM)
+            }
+            # Forked workers must open their own connections, and their own
+            # pools: a pool's threads do not survive the fork.
+            connections.close_all()
+            for connection in connections.all(initialized_only=True):
+                if hasattr(connection, "close_pool"):
+                    connection.close_pool()
+            try:
+                with ProcessPoolExecutor(
+                    processes,
+                    mp_context=context,
+                    initializer=init_worker,
+                    initargs=(shutdown,),
+                ) as pool:
+                    futures = [
+                        pool.submit(run_pool_worker, *worker_args)
+                        for _ in range(processes)
+                    ]
+                    processed = sum(future.result() for future in futures)
+            finally:
+                for signum, handler in previous.items():
+                    signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Ran {processed} jobs."))
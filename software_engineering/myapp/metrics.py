@@ -0,0 +1,392 @@
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:  # Windows: no SharedDirectory
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """In-process Prometheus-style histogram, one series per label set."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=("view", "action")):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key) or ([0] * (len(self.buckets) + 1), 0)
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    def collect(self):
+        with self._lock:
+            return {
+                key: (list(counts), total)
+                for key, (counts, total) in self._series.items()
+            }
+
+    def add(self, value, other):
+        return [a + b for a, b in zip(value[0], other[0])], value[1] + other[1]
+
+    def samples(self, series):
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield "_bucket", key + (_format_value(bound),), ("le",), cumulative
+            yield "_sum", key, (), total
+            yield "_count", key, (), cumulative
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=("view", "action")):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return dict(self._series)
+
+    def add(self, value, other):
+        return value + other
+
+    def value(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._series.get(key, 0)
+
+    def samples(self, series):
+        for key, value in sorted(series.items()):
+            yield "", key, (), value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self):
+        # {metric name: {label values: value}} for this process.
+        return {metric.name: metric.collect() for metric in self.metrics}
+
+    def merge(self, series, other):
+        for metric in self.metrics:
+            target = series.setdefault(metric.name, {})
+            for key, value in other.get(metric.name, {}).items():
+                target[key] = metric.add(target[key], value) if key in target else value
+        return series
+
+    def render(self, series=None):
+        if series is None:
+            series = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, values, extra_names, value in metric.samples(
+                series.get(metric.name, {})
+            ):
+                names = metric.labelnames + extra_names
+                labels = ",".join(
+                    f'{name}="{_escape(label)}"' for name, label in zip(names, values)
+                )
+                lines.append(
+                    f"{metric.name}{suffix}{{{labels}}} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+class SharedDirectory:
+    """
+    Adds up the series of every process recording into `path`, such as the
+    workers of one gunicorn server, so a scrape of any of them sees the
+    totals. Each process rewrites its own file at most every `interval`
+    seconds after a request, and on flush(), so a scrape can lag by that
+    much. Files of processes that have exited are folded into one, so
+    totals do not drop when a worker is recycled.
+    """
+
+    def __init__(self, registry, path, interval=5.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.pid = None
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.forked)
+
+    def forked(self):
+        if self.pid is not None:
+            # The parent reports the series the child inherited.
+            self.lock_file.close()
+            self.registry.clear()
+            self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.pid is not None:
+            return
+        self.pid = os.getpid()
+        self.next_write = 0.0
+        name = f"{self.pid}-{uuid.uuid4().hex}"
+        self.file = os.path.join(self.path, f"{name}.json")
+        os.makedirs(self.path, exist_ok=True)
+        with self.guard():
+            # Held for as long as this process lives; see fold_exited().
+            self.lock_file = open(os.path.join(self.path, f"{name}.lock"), "w")
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+    def guard(self):
+        return _FileLock(os.path.join(self.path, "collect.lock"))
+
+    def write(self, force=False):
+        if not self.lock.acquire(blocking=force):
+            return
+        try:
+            self.start()
+            now = time.monotonic()
+            if force or now >= self.next_write:
+                self.next_write = now + self.interval
+                _write_series(self.file, self.registry.collect())
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        if self.pid is not None:
+            self.write(force=True)
+
+    def collect(self):
+        self.write(force=True)
+        with self.guard():
+            self.fold_exited()
+            series = {}
+            for entry in os.scandir(self.path):
+                if entry.name.endswith(".json"):
+                    self.registry.merge(series, _read_series(entry.path))
+        return series
+
+    def fold_exited(self):
+        archive = os.path.join(self.path, "exited.json")
+        folded = None
+        for entry in os.scandir(self.path):
+            name, extension = os.path.splitext(entry.name)
+            if extension != ".lock" or name == "collect":
+                continue
+            with open(entry.path) as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+            if folded is None:
+                folded = _read_series(archive)
+            self.registry.merge(
+                folded, _read_series(os.path.join(self.path, f"{name}.json"))
+            )
+            _write_series(archive, folded)
+            for path in (os.path.join(self.path, f"{name}.json"), entry.path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.file = open(self.path, "w")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+
+def _write_series(path, series):
+    # Written aside and renamed, so readers never see half a file.
+    data = {
+        name: [[list(key), value] for key, value in values.items()]
+        for name, values in series.items()
+    }
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(descriptor, "w") as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+def _read_series(path):
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return {}
+    return {
+        name: {tuple(key): value for key, value in values}
+        for name, values in data.items()
+    }
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+
+@functools.lru_cache
+def get_shared_directory(path):
+    # API_METRICS_DIR; unset, each process reports only its own series.
+    if not path:
+        return None
+    if fcntl is None:
+        raise ImproperlyConfigured("API_METRICS_DIR needs fcntl file locks.")
+    return SharedDirectory(registry, path)
+
+
+request_duration = registry.register(
+    Histogram(
+        "api_request_duration_seconds",
+        "Time spent handling the request.",
+        LATENCY_BUCKETS,
+    )
+)
+request_db_duration = registry.register(
+    Histogram(
+        "api_request_db_duration_seconds",
+        "Time spent executing SQL for the request.",
+        LATENCY_BUCKETS,
+    )
+)
+request_render_duration = registry.register(
+    Histogram(
+        "api_request_render_duration_seconds",
+        "Time spent rendering the response body.",
+        LATENCY_BUCKETS,
+    )
+)
+request_serialize_duration = registry.register(
+    Histogram(
+        "api_request_serialize_duration_seconds",
+        "Time spent in serializers, including the queries they trigger.",
+        LATENCY_BUCKETS,
+    )
+)
+request_queries = registry.register(
+    Histogram(
+        "api_request_queries",
+        "SQL queries executed for the request.",
+        QUERY_BUCKETS,
+    )
+)
+request_duplicate_queries = registry.register(
+    Histogram(
+        "api_request_duplicate_queries",
+        "Queries whose fingerprint already ran earlier in the same request.",
+        QUERY_BUCKETS,
+    )
+)
+requests_total = registry.register(
+    Counter(
+        "api_requests_total",
+        "Sampled requests.",
+        labelnames=("view", "action", "status"),
+    )
+)
+
+
+read_cache_hits = registry.register(
+    Counter(
+        "read_cache_hits_total",
+        "ReadCache lookups answered from the cache, for every request.",
+        labelnames=("cache",),
+    )
+)
+read_cache_misses = registry.register(
+    Counter(
+        "read_cache_misses_total",
+        "ReadCache lookups that missed, for every request.",
+        labelnames=("cache",),
+    )
+)
+
+
+class SerializeTimer:
+    def __init__(self):
+        self.duration = 0.0
+        self.running = False
+
+
+# The sampled request's SerializeTimer, set by RequestMetricsMiddleware.
+current_serialize_timer = ContextVar("current_serialize_timer", default=None)
+
+
+def timed_serialization(function):
+    """
+    Adds the time spent in `function` to the current request's serializer
+    time. Calls made from inside another timed call, such as nested
+    serializers, are already counted by the outer one.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        timer = current_serialize_timer.get()
+        if timer is None or timer.running:
+            return function(*args, **kwargs)
+        timer.running = True
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timer.duration += time.perf_counter() - started
+            timer.running = False
+
+    return wrapper
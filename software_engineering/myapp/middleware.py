@@ -0,0 +1,390 @@
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+from . import metrics
+from .routers import RoutingState, routing_state
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# "IN (%s, %s, %s)" fingerprints the same however many ids are passed.
+IN_LIST_RE = re.compile(r"\((?:%s, )*%s\)")
+ACCEPTS_BROTLI_RE = re.compile(r"\bbr\b")
+
+
+class QueryRecorder:
+    """execute_wrapper that counts, times and fingerprints every query."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[IN_LIST_RE.sub("(%s)", sql)] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.fingerprints.values())
+
+
+# Under ASGI the ORM runs in sync_to_async worker threads, each with its own
+# connections, so async requests publish their recorder through a context
+# variable those threads inherit.
+current_recorder = ContextVar("current_recorder", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, SQL count and time, duplicate queries, serializer and
+    render time per resolved view and action into myapp.metrics, for a
+    sample of requests. Streamed responses are recorded once their body has
+    been sent. With API_METRICS_DIR set, the series are also written there
+    for /metrics to add up across processes. Requests slower than
+    API_SLOW_REQUEST_MS are logged.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.API_METRICS_SAMPLE_RATE
+        self.slow_request_ms = settings.API_SLOW_REQUEST_MS
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_sampled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = self.start(request)
+        token = metrics.current_serialize_timer.set(request._serialize_timer)
+        try:
+            with self.record_queries(recorder):
+                response = self.get_response(request)
+        finally:
+            metrics.current_serialize_timer.reset(token)
+        return self.finish_or_stream(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not self.is_sampled():
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = self.start(request)
+        token = current_recorder.set(recorder)
+        timer_token = metrics.current_serialize_timer.set(request._serialize_timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_serialize_timer.reset(timer_token)
+            current_recorder.reset(token)
+        return self.finish_or_stream(request, response, recorder, started)
+
+    def is_sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def start(self, request):
+        request._render_started = None
+        request._serialize_timer = metrics.SerializeTimer()
+        return time.perf_counter()
+
+    def record_queries(self, recorder):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        return stack
+
+    def finish_or_stream(self, request, response, recorder, started):
+        if response.streaming and not response.is_async:
+            # Exports query and serialize their rows while the body is sent.
+            response.streaming_content = self.record_stream(
+                request, response, response.streaming_content, recorder, started
+            )
+        else:
+            self.finish(request, response, recorder, started)
+        return response
+
+    def record_stream(self, request, response, content, recorder, started):
+        token = metrics.current_serialize_timer.set(request._serialize_timer)
+        try:
+            with self.record_queries(recorder):
+                yield from content
+        finally:
+            metrics.current_serialize_timer.reset(token)
+            self.finish(request, response, recorder, started)
+
+    def finish(self, request, response, recorder, started):
+        finished = time.perf_counter()
+        view, action = self.get_view_labels(request)
+        labels = {"view": view, "action": action}
+        duration = finished - started
+        metrics.request_duration.observe(duration, **labels)
+        metrics.request_db_duration.observe(recorder.duration, **labels)
+        metrics.request_queries.observe(recorder.count, **labels)
+        metrics.request_duplicate_queries.observe(recorder.duplicates, **labels)
+        metrics.request_serialize_duration.observe(
+            request._serialize_timer.duration, **labels
+        )
+        if request._render_started is not None:
+            metrics.request_render_duration.observe(
+                finished - request._render_started, **labels
+            )
+        metrics.requests_total.inc(status=response.status_code, **labels)
+        shared = metrics.get_shared_directory(settings.API_METRICS_DIR)
+        if shared is not None:
+            shared.write()
+
+        if duration * 1000 >= self.slow_request_ms:
+            self.log_slow_request(request, response, view, action, duration, recorder)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns.
+        request._render_started = time.perf_counter()
+        return response
+
+    def get_view_labels(self, request):
+        match = request.resolver_match
+        if match is None:
+            return "unresolved", ""
+        view_class = getattr(match.func, "cls", None)
+        if view_class is None:
+            return match.func.__name__, request.method.lower()
+        actions = getattr(match.func, "actions", None) or {}
+        return view_class.__name__, actions.get(
+            request.method.lower(), request.method.lower()
+        )
+
+    def log_slow_request(self, request, response, view, action, duration, recorder):
+        repeated = ""
+        if recorder.duplicates:
+            sql, count = recorder.fingerprints.most_common(1)[0]
+            repeated = f"; most repeated query ({count}x): {sql}"
+        logger.warning(
+            "Slow request %s %s -> %s (%s.%s): %.1f ms, %d queries in %.1f ms, "
+            "%d duplicates%s",
+            request.method,
+            request.get_full_path(),
+            response.status_code,
+            view,
+            action,
+            duration * 1000,
+            recorder.count,
+            recorder.duration * 1000,
+            recorder.duplicates,
+            repeated,
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets ReplicaRouter send safe-method reads of the myapp views to a random
+    replica. A request that writes pins its session, identified by its
+    credentials or session cookie, to the primary for
+    DATABASE_REPLICA_STICKY_SECONDS so it reads its own writes despite
+    replication lag.
+    """
+
+    sync_capable = True
+    async_capable = True
+    pin_prefix = "replica-pin"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cache = caches[settings.API_CACHE_ALIAS]
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        if state.wrote:
+            self.pin_session(request)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        if state.wrote:
+            self.pin_session(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = routing_state.get()
+        view_class = getattr(view_func, "cls", None)
+        if (
+            state is not None
+            and settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and view_class is not None
+            and view_class.__module__.startswith("myapp.")
+            and not self.is_pinned(request)
+        ):
+            state.read_database = random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def get_pin_key(self, request):
+        credentials = request.META.get("HTTP_AUTHORIZATION") or request.COOKIES.get(
+            settings.SESSION_COOKIE_NAME
+        )
+        if not credentials:
+            return None
+        digest = hashlib.sha256(credentials.encode()).hexdigest()
+        return f"{self.pin_prefix}:{digest}"
+
+    def is_pinned(self, request):
+        key = self.get_pin_key(request)
+        return key is not None and self.cache.get(key) is not None
+
+    def pin_session(self, request):
+        key = self.get_pin_key(request)
+        if key is not None:
+            self.cache.set(key, True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Reports the budget TokenBucketThrottle left on the request in
+    RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset (seconds until
+    the bucket is full again) headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        rate_limit = getattr(request, "rate_limit", None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response.headers.setdefault("RateLimit-Limit", str(limit))
+            response.headers.setdefault("RateLimit-Remaining", str(remaining))
+            response.headers.setdefault("RateLimit-Reset", str(reset))
+        return response
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses responses of at least API_COMPRESSION_MIN_SIZE bytes, and
+    streamed ones, with Brotli when the client accepts "br" and the brotli
+    package is installed, and with gzip otherwise.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = settings.API_COMPRESSION_MIN_SIZE
+        self.brotli_quality = settings.API_BROTLI_QUALITY
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        if (
+            brotli is None
+            or response.has_header("Content-Encoding")
+            or not ACCEPTS_BROTLI_RE.search(
+                request.META.get("HTTP_ACCEPT_ENCODING", "")
+            )
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if response.streaming:
+            response.streaming_content = self.compress_stream(response)
+            del response.headers["Content-Length"]
+        else:
+            content = brotli.compress(response.content, quality=self.brotli_quality)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers["Content-Length"] = str(len(content))
+        # Same as GZipMiddleware: the encoded body is not byte-identical.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
+
+    def compress_stream(self, response):
+        # One compressor for the whole stream, so chunks share a window.
+        content = response.streaming_content
+        compressor = brotli.Compressor(quality=self.brotli_quality)
+        if response.is_async:
+
+            async def stream():
+                async for chunk in content:
+                    if data := compressor.process(chunk):
+                        yield data
+                yield compressor.finish()
+
+        else:
+
+            def stream():
+                for chunk in content:
+                    if data := compressor.process(chunk):
+                        yield data
+                yield compressor.finish()
+
+        return stream()
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:08
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Serves the UPPER(name) LIKE '%term%' queries behind icontains. GIN trigram
+# indexes only exist on PostgreSQL, so the index is created here rather than
+# in Product.Meta, whose state other backends would rebuild tables from.
+CREATE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS product_name_trgm_idx "
+    'ON myapp_product USING gin ((UPPER("name")) gin_trgm_ops)'
+)
+DROP_INDEX = "DROP INDEX IF EXISTS product_name_trgm_idx"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0006_order_date_id_idx"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:23
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import (
+    Count,
+    DecimalField,
+    Exists,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    # Same UPDATE as OrderQuerySet.refresh_totals(), without touching updated_at.
+    Order = apps.get_model("myapp", "Order")
+    items = (
+        Order.products.through.objects.filter(order=OuterRef("pk"))
+        .order_by()
+        .values("order")
+    )
+    Order.objects.using(schema_editor.connection.alias).update(
+        total_price=Coalesce(
+            Subquery(
+                items.annotate(total=Sum("product__price")).values("total"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            Value(Decimal("0.00")),
+        ),
+        item_count=Coalesce(
+            Subquery(items.annotate(count=Count("pk")).values("count")), 0
+        ),
+        is_fulfillable=~Exists(items.filter(product__available=False)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0008_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="is_fulfillable",
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="item_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="total_price",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), editable=False, max_digits=12
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["total_price", "id"], name="order_total_price_id_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0009_order_totals"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderTransition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("from_status", models.CharField(max_length=50)),
+                ("to_status", models.CharField(max_length=50)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="transitions",
+                        to="myapp.order",
+                    ),
+                ),
+            ],
+        ),
+    ]
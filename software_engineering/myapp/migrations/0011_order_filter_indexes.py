@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0010_order_transition"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["status", "date", "id"], name="order_status_date_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["customer", "date", "id"], name="order_customer_date_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("status__in", ["New", "In Process", "Sent"])),
+                fields=["date", "id"],
+                name="order_open_date_id_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="customer",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="myapp.customer",
+            ),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0011_order_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportDay",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("order_count", models.PositiveIntegerField()),
+                ("last_updated_at", models.DateTimeField()),
+                ("refreshed_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("New", "New"),
+                            ("In Process", "In Process"),
+                            ("Sent", "Sent"),
+                            ("Completed", "Completed"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("order_count", models.PositiveIntegerField()),
+                ("item_count", models.PositiveIntegerField()),
+                ("revenue", models.DecimalField(decimal_places=2, max_digits=14)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "status"), name="daily_sales_date_status_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyCustomerSales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("order_count", models.PositiveIntegerField()),
+                ("revenue", models.DecimalField(decimal_places=2, max_digits=14)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="myapp.customer"
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "customer"), name="daily_customer_sales_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyProductSales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("order_count", models.PositiveIntegerField()),
+                ("revenue", models.DecimalField(decimal_places=2, max_digits=14)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="myapp.product"
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "product"), name="daily_product_sales_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0013_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="stock",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0014_product_stock"),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name="order",
+            new_name="order_cached_total_id_idx",
+            old_name="order_total_price_id_idx",
+        ),
+        migrations.RenameField(
+            model_name="order",
+            old_name="total_price",
+            new_name="cached_total",
+        ),
+        # The database index follows the renamed column; the state's does not.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name="order",
+                    name="order_cached_total_id_idx",
+                ),
+                migrations.AddIndex(
+                    model_name="order",
+                    index=models.Index(
+                        fields=["cached_total", "id"],
+                        name="order_cached_total_id_idx",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0015_rename_order_total_price_cached_total"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reportday",
+            name="stale",
+            field=models.BooleanField(default=False),
+        ),
+    ]
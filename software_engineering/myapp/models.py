@@ -1,8 +1,73 @@
+from contextlib import nullcontext
 from decimal import Decimal
-from django.db import models
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, router, transaction
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 
 
+class ProductUnavailable(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f"Products not available: {sorted(product_ids)}")
+        self.product_ids = set(product_ids)
+
+
+class ProductQuerySet(models.QuerySet):
+    def reserve(self, quantities):
+        """
+        Takes `quantities` ({product id: units}) out of stock, all or
+        nothing, inside the caller's transaction. The rows are locked in id
+        order, so checkouts sharing products wait for each other rather than
+        deadlock, and checkouts of other products are not held up. Raises
+        ProductUnavailable with the ids that are unavailable, missing or
+        short of stock; products without a stock count are only checked for
+        availability. Negative quantities put units back and are never
+        refused.
+        """
+        products = {
+            product.pk: product
+            for product in self.filter(pk__in=quantities)
+            .select_for_update(no_key=True)
+            .order_by("pk")
+            .only("available", "stock")
+        }
+        unavailable = [
+            pk
+            for pk, quantity in quantities.items()
+            if quantity > 0
+            and (
+                pk not in products
+                or not products[pk].available
+                or (products[pk].stock is not None and products[pk].stock < quantity)
+            )
+        ]
+        if unavailable:
+            raise ProductUnavailable(unavailable)
+        tracked = [pk for pk, product in products.items() if product.stock is not None]
+        if tracked:
+            self.filter(pk__in=tracked).update(
+                stock=F("stock")
+                - Case(*[When(pk=pk, then=Value(quantities[pk])) for pk in tracked]),
+                updated_at=timezone.now(),
+            )
+        return list(products.values())
+
+
 class Product(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=255)
@@ -10,12 +75,127 @@ class Product(models.Model):
         max_digits=5, decimal_places=2, validators=[MinValueValidator(0.01)]
     )
     available = models.BooleanField(default=True)
+    # Units left to sell, taken by OrderSerializer as orders are placed;
+    # null when stock is not tracked.
+    stock = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # product_name_trgm_idx, a PostgreSQL-only trigram index on UPPER(name),
+    # is created by migration 0007 outside the model state.
+    objects = ProductQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Lets post_save tell whether price or availability actually changed.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
 
 class Customer(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
     address = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        return self.annotate(products_total=Sum("products__price"))
+
+    def with_fulfillability(self):
+        return self.annotate(
+            unavailable_products=Count("products", filter=Q(products__available=False))
+        )
+
+    def release_stock(self):
+        """
+        Puts back into stock the unit of each product that OrderSerializer
+        reserved for these orders. Called by the pre_delete receiver, so it
+        covers admin deletes and customer cascades too. Returns the products,
+        as ProductQuerySet.reserve() does.
+        """
+        quantities = dict(
+            Order.products.through.objects.filter(order__in=self)
+            .values("product")
+            .annotate(count=Count("pk"))
+            .values_list("product", "count")
+        )
+        if not quantities:
+            return []
+        return Product.objects.reserve({pk: -count for pk, count in quantities.items()})
+
+    def refresh_totals(self):
+        # Recomputes the denormalized columns in a single UPDATE.
+        items = (
+            Order.products.through.objects.filter(order=OuterRef("pk"))
+            .order_by()
+            .values("order")
+        )
+        return self.update(
+            cached_total=Coalesce(
+                Subquery(
+                    items.annotate(total=Sum("product__price")).values("total"),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+                Value(Decimal("0.00")),
+            ),
+            item_count=Coalesce(
+                Subquery(items.annotate(count=Count("pk")).values("count")), 0
+            ),
+            is_fulfillable=~Exists(items.filter(product__available=False)),
+            updated_at=timezone.now(),
+        )
+
+    def transition(self, source, target, log=False):
+        """
+        Moves the orders still in `source` to `target` with one conditional
+        UPDATE and returns the ids that moved. Orders another request moved
+        first are left alone. With `log`, an OrderTransition row is written
+        for each moved order in the same transaction.
+        """
+        if not Order.can_transition(source, target):
+            raise ValueError(f"Orders cannot go from {source!r} to {target!r}.")
+        using = self._db or router.db_for_write(self.model)
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        now = timezone.now()
+        subquery, params = (
+            self.filter(status=source)
+            .order_by()
+            .values("pk")
+            .query.get_compiler(using)
+            .as_sql()
+        )
+        sql = (
+            f"UPDATE {quote(meta.db_table)} "
+            f"SET {quote(meta.get_field('status').column)} = %s, "
+            f"{quote(meta.get_field('updated_at').column)} = %s "
+            f"WHERE {quote(meta.get_field('status').column)} = %s "
+            f"AND {quote(meta.pk.column)} IN ({subquery}) "
+            f"RETURNING {quote(meta.pk.column)}"
+        )
+        updated_at = meta.get_field("updated_at").get_db_prep_value(now, connection)
+        # The UPDATE alone is atomic; the log has to commit with it.
+        with transaction.atomic(using=using) if log else nullcontext():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [target, updated_at, source, *params])
+                ids = [row[0] for row in cursor.fetchall()]
+            if log:
+                OrderTransition.objects.using(using).bulk_create(
+                    [
+                        OrderTransition(
+                            order_id=pk,
+                            from_status=source,
+                            to_status=target,
+                            created_at=now,
+                        )
+                        for pk in ids
+                    ],
+                    batch_size=5000,
+                )
+        return ids
 
 
 class Order(models.Model):
@@ -27,13 +207,197 @@ class Order(models.Model):
     ]
 
     id = models.AutoField(primary_key=True)
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    # Indexed by order_customer_date_id_idx.
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, db_index=False)
     products = models.ManyToManyField(Product)
     date = models.DateField()
     status = models.CharField(max_length=50, choices=STATUS_CHOICES)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Denormalized from products, kept up to date by myapp.signals.
+    cached_total = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00"), editable=False
+    )
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    is_fulfillable = models.BooleanField(default=True, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    TOTAL_FIELDS = ("cached_total", "item_count", "is_fulfillable", "updated_at")
+
+    # Legal status changes; see OrderQuerySet.transition().
+    TRANSITIONS = {
+        "New": ("In Process",),
+        "In Process": ("Sent",),
+        "Sent": ("Completed",),
+        "Completed": (),
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "id"], name="order_date_id_idx"),
+            models.Index(
+                fields=["cached_total", "id"], name="order_cached_total_id_idx"
+            ),
+            models.Index(
+                fields=["status", "date", "id"], name="order_status_date_id_idx"
+            ),
+            models.Index(
+                fields=["customer", "date", "id"], name="order_customer_date_id_idx"
+            ),
+            # Open orders are what dashboards page through; completed ones pile up.
+            models.Index(
+                fields=["date", "id"],
+                name="order_open_date_id_idx",
+                condition=Q(status__in=["New", "In Process", "Sent"]),
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Lets the report signals tell when an order moves to another day.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_date = dict(zip(field_names, values)).get("date")
+        return instance
+
+    def refresh_totals(self):
+        Order.objects.filter(pk=self.pk).refresh_totals()
+        self.refresh_from_db(fields=self.TOTAL_FIELDS)
+
+    @classmethod
+    def can_transition(cls, source, target):
+        return target in cls.TRANSITIONS.get(source, ())
+
+    @classmethod
+    def get_transition_sources(cls, target):
+        return [
+            source for source, targets in cls.TRANSITIONS.items() if target in targets
+        ]
+
+    def transition(self, target, log=False):
+        moved = Order.objects.filter(pk=self.pk).transition(
+            self.status, target, log=log
+        )
+        if moved:
+            self.refresh_from_db(fields=("status", "updated_at"))
+        return bool(moved)
 
     def total_price(self):
-        return sum([product.price for product in self.products.all()])
+        if hasattr(self, "products_total"):
+            total = self.products_total
+        else:
+            total = self.products.aggregate(total=Sum("price"))["total"]
+        return total or Decimal("0.00")
 
     def can_be_fullfilled(self):
-        return all([product.available for product in self.products.all()])
+        if hasattr(self, "unavailable_products"):
+            return self.unavailable_products == 0
+        return self.is_fulfillable
+
+
+class OrderTransition(models.Model):
+    # Written in bulk by OrderQuerySet.transition(log=True).
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="transitions"
+    )
+    from_status = models.CharField(max_length=50)
+    to_status = models.CharField(max_length=50)
+    created_at = models.DateTimeField()
+
+
+# Daily sales rollups behind /api/reports/, rebuilt by myapp.reports for the
+# days whose orders changed. Revenue is summed from Product.price, like
+# Order.cached_total.
+
+
+class ReportDay(models.Model):
+    # What the rollups of `date` were built from; see get_stale_dates().
+    date = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField()
+    last_updated_at = models.DateTimeField()
+    refreshed_at = models.DateTimeField()
+    # Set when an order leaves the day, which no updated_at records.
+    stale = models.BooleanField(default=False)
+
+
+class DailySales(models.Model):
+    date = models.DateField()
+    status = models.CharField(max_length=50, choices=Order.STATUS_CHOICES)
+    order_count = models.PositiveIntegerField()
+    item_count = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "status"], name="daily_sales_date_status_uniq"
+            ),
+        ]
+
+
+class DailyCustomerSales(models.Model):
+    date = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    order_count = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "customer"], name="daily_customer_sales_uniq"
+            ),
+        ]
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    order_count = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "product"], name="daily_product_sales_uniq"
+            ),
+        ]
+
+
+class Job(models.Model):
+    """
+    A deferred API request, replayed by a run_workers process; see
+    myapp.jobs.
+    """
+
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    # Method, path, query string, host and Accept header of the request.
+    request = models.JSONField()
+    data = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    result = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    # Streamed responses such as exports are written to JOB_RESULT_DIR.
+    result_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim from here; finished jobs stay out of it.
+            models.Index(
+                fields=["id"],
+                name="job_pending_idx",
+                condition=Q(status__in=["queued", "running"]),
+            ),
+        ]
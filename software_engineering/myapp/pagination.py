@@ -0,0 +1,200 @@
+import json
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, LimitOffsetPagination
+
+
+class AdminOffsetPagination(LimitOffsetPagination):
+    default_limit = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    max_limit = settings.API_MAX_PAGE_SIZE
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that stores the whole boundary row in the cursor, so
+    composite orderings such as ("date", "id") are paged with a single range
+    condition instead of an offset. The last ordering field must be unique.
+
+    Staff users can opt in to offset pagination with ?offset=/?limit=.
+    """
+
+    ordering = ("id",)
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_MAX_PAGE_SIZE
+    offset_pagination_class = AdminOffsetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.offset_paginator = None
+        if self.use_offset_pagination(request):
+            self.offset_paginator = self.offset_pagination_class()
+            return self.offset_paginator.paginate_queryset(queryset, request, view)
+
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    def get_page_queryset(self, queryset, request, view):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        # values() rows must carry the ordering columns for the cursor, even
+        # when ?fields= leaves them out of the response.
+        selected = queryset.query.values_select
+        if selected:
+            missing = [
+                name
+                for name in (field.lstrip("-") for field in self.ordering)
+                if name not in selected and name not in queryset.query.annotation_select
+            ]
+            if missing:
+                queryset = queryset.values(
+                    *selected, *queryset.query.annotation_select, *missing
+                )
+
+        if self.cursor is not None and self.cursor.reverse:
+            queryset = queryset.order_by(*map(_invert_ordering, self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.cursor is not None:
+            position = self.decode_position(queryset.model, self.cursor.position)
+            queryset = queryset.filter(
+                self.get_boundary_filter(position, self.cursor.reverse)
+            )
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        self.page = results[: self.page_size]
+        has_following = len(results) > self.page_size
+        if self.cursor is not None and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def use_offset_pagination(self, request):
+        offset_params = (
+            self.offset_pagination_class.offset_query_param,
+            self.offset_pagination_class.limit_query_param,
+        )
+        return request.user.is_staff and any(
+            param in request.query_params for param in offset_params
+        )
+
+    def get_ordering(self, request, queryset, view):
+        # Like CursorPagination, let a filter backend such as a ranked search
+        # choose the ordering for this request.
+        for backend in getattr(view, "filter_backends", ()):
+            if hasattr(backend, "get_ordering"):
+                ordering = backend().get_ordering(request, queryset, view)
+                if ordering:
+                    return tuple(ordering)
+        if isinstance(self.ordering, str):
+            return (self.ordering,)
+        return tuple(self.ordering)
+
+    def get_boundary_filter(self, position, reverse):
+        # (a, b) > (x, y) expands to a >= x AND (a > x OR (a = x AND b > y)),
+        # which keeps the leading column usable as an index range.
+        names = [field.lstrip("-") for field in self.ordering]
+        descending = [field.startswith("-") != reverse for field in self.ordering]
+
+        conditions = []
+        for index, name in enumerate(names):
+            lookup = "lt" if descending[index] else "gt"
+            equal = {prefix: position[prefix] for prefix in names[:index]}
+            conditions.append(Q(**equal, **{f"{name}__{lookup}": position[name]}))
+
+        leading_lookup = "lte" if descending[0] else "gte"
+        leading = Q(**{f"{names[0]}__{leading_lookup}": position[names[0]]})
+        return leading & reduce(or_, conditions)
+
+    def encode_position(self, instance):
+        # ValuesListMixin pages over values() rows rather than instances.
+        if isinstance(instance, dict):
+            instance = _ValuesRow(instance)
+        values = []
+        for name in self.ordering:
+            field = _get_model_field(self.model, name.lstrip("-"))
+            if field is None:
+                values.append(getattr(instance, name.lstrip("-")))
+            else:
+                values.append(field.value_to_string(instance))
+        return json.dumps(values)
+
+    def decode_position(self, model, position):
+        try:
+            values = json.loads(position)
+            if len(values) != len(self.ordering):
+                raise ValueError
+            decoded = {}
+            for name, value in zip(self.ordering, values):
+                field = _get_model_field(model, name.lstrip("-"))
+                decoded[name.lstrip("-")] = (
+                    value if field is None else field.to_python(value)
+                )
+            return decoded
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = Cursor(
+            offset=0, reverse=False, position=self.encode_position(self.page[-1])
+        )
+        return self.encode_cursor(cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        cursor = Cursor(
+            offset=0, reverse=True, position=self.encode_position(self.page[0])
+        )
+        return self.encode_cursor(cursor)
+
+    def get_paginated_response(self, data):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.get_html_context()
+        return super().get_html_context()
+
+
+class OrderKeysetPagination(KeysetPagination):
+    ordering = ("date", "id")
+
+
+class _ValuesRow:
+    # Attribute access to a values() row, for Field.value_to_string().
+    def __init__(self, row):
+        self.__dict__.update(row)
+
+
+def _get_model_field(model, name):
+    # Annotations such as a search rank are not model fields.
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _invert_ordering(field):
+    return field[1:] if field.startswith("-") else f"-{field}"
@@ -0,0 +1,150 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+from .models import (
+    DailyCustomerSales,
+    DailyProductSales,
+    DailySales,
+    Order,
+    ReportDay,
+)
+
+ROLLUP_MODELS = (DailySales, DailyCustomerSales, DailyProductSales)
+
+
+def get_order_days(dates=None):
+    # {date: (order count, latest updated_at)}, from one GROUP BY over the
+    # orders of `dates`, or of every day.
+    rows = Order.objects.order_by()
+    if dates is not None:
+        rows = rows.filter(date__in=dates)
+    rows = rows.values("date").annotate(
+        order_count=Count("pk"), last_updated_at=Max("updated_at")
+    )
+    return {row["date"]: (row["order_count"], row["last_updated_at"]) for row in rows}
+
+
+def get_changed_dates():
+    """
+    Days that may have changed since the last refresh, or None before the
+    first one. Every write to an order moves its updated_at, including
+    status transitions and total refreshes after product price changes, so
+    the updated_at index finds the days of orders written after the latest
+    updated_at the rollups were built from. Looking back
+    REPORT_REFRESH_OVERLAP seconds more catches writes that committed after
+    a later one. The days orders were deleted from or moved away from are
+    marked stale by myapp.signals.
+    """
+    watermark = ReportDay.objects.aggregate(Max("last_updated_at"))[
+        "last_updated_at__max"
+    ]
+    if watermark is None:
+        return None
+    since = watermark - timedelta(seconds=settings.REPORT_REFRESH_OVERLAP)
+    updated = Order.objects.filter(updated_at__gt=since).order_by().values("date")
+    return set(updated.distinct().values_list("date", flat=True)) | set(
+        ReportDay.objects.filter(stale=True).values_list("date", flat=True)
+    )
+
+
+def get_stale_dates(order_days, dates=None):
+    """
+    Days among `dates`, or all days, whose rollups no longer match their
+    orders: their order count or latest updated_at differs from ReportDay,
+    or they were marked stale.
+    """
+    built = ReportDay.objects.all()
+    if dates is not None:
+        built = built.filter(date__in=dates)
+    built = {
+        day.date: None if day.stale else (day.order_count, day.last_updated_at)
+        for day in built
+    }
+    stale = {date for date, state in order_days.items() if built.get(date) != state}
+    return sorted(stale | (built.keys() - order_days.keys()))
+
+
+def mark_stale(dates):
+    ReportDay.objects.filter(date__in=dates, stale=False).update(stale=True)
+
+
+def refresh_days(dates, order_days):
+    """
+    Rebuilds the rollups of `dates` from GROUP BY aggregates in one
+    transaction. `order_days` is the state the days are recorded as built
+    from; it is read before the aggregates, so a write that lands in between
+    leaves the day stale for the next refresh rather than lost.
+    """
+    orders = Order.objects.filter(date__in=dates).order_by()
+    items = Order.products.through.objects.filter(order__date__in=dates).order_by()
+    now = timezone.now()
+    with transaction.atomic():
+        for model in (*ROLLUP_MODELS, ReportDay):
+            model.objects.filter(date__in=dates).delete()
+        insert_rollups(
+            DailySales,
+            orders.values("date", "status").annotate(
+                order_count=Count("pk"),
+                item_count=Sum("item_count"),
+                revenue=Sum("cached_total"),
+            ),
+        )
+        insert_rollups(
+            DailyCustomerSales,
+            orders.values("date", "customer").annotate(
+                order_count=Count("pk"), revenue=Sum("cached_total")
+            ),
+        )
+        insert_rollups(
+            DailyProductSales,
+            items.annotate(date=F("order__date"))
+            .values("date", "product")
+            .annotate(order_count=Count("pk"), revenue=Sum("product__price")),
+        )
+        ReportDay.objects.bulk_create(
+            ReportDay(
+                date=date,
+                order_count=order_days[date][0],
+                last_updated_at=order_days[date][1],
+                refreshed_at=now,
+            )
+            for date in dates
+            if date in order_days
+        )
+
+
+def insert_rollups(model, rows):
+    # INSERT ... SELECT, so the aggregated rows never leave the database.
+    # Columns follow the SELECT: values() fields, then annotations.
+    using = router.db_for_write(model)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    query = rows.query
+    columns = [
+        model._meta.get_field(name).column
+        for name in (*query.values_select, *query.annotation_select)
+    ]
+    sql, params = query.get_compiler(using).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(model._meta.db_table)} "
+            f"({', '.join(map(quote, columns))}) {sql}",
+            params,
+        )
+
+
+def refresh_reports(full=False, batch_days=31):
+    """Refreshes the stale days, or every day with `full`; returns the days."""
+    changed = None if full else get_changed_dates()
+    order_days = get_order_days(changed)
+    if full:
+        dates = sorted(
+            order_days.keys() | set(ReportDay.objects.values_list("date", flat=True))
+        )
+    else:
+        dates = get_stale_dates(order_days, changed)
+    for start in range(0, len(dates), batch_days):
+        refresh_days(dates[start : start + batch_days], order_days)
+    return dates
@@ -0,0 +1,42 @@
+from contextvars import ContextVar
+from django.conf import settings
+
+# Set per request by ReplicaRoutingMiddleware.
+routing_state = ContextVar("routing_state", default=None)
+
+
+class RoutingState:
+    def __init__(self):
+        self.read_database = None
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """
+    Sends myapp reads to the replica ReplicaRoutingMiddleware picked for the
+    request, if any. Everything else, and every read after a write in the
+    same request, goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or model._meta.app_label != "myapp":
+            return None
+        return state.read_database
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None and model._meta.app_label == "myapp":
+            state.read_database = None
+            state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        return db not in settings.DATABASE_REPLICAS
@@ -1,20 +1,593 @@
-from rest_framework import serializers
-from .models import Product, Customer, Order
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.urls import reverse
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .cache import product_cache
+from .metrics import timed_serialization
+from .models import Product, Customer, Order, Job, ProductUnavailable
+from .signals import post_bulk_save
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        # BulkListSerializer loads every referenced row up front, so validating
+        # a list of items does not cost one query per relation per item.
+        loaded = getattr(self.root, "related_objects", {})
+        instance = loaded.get(self.get_queryset().model, {}).get(str(data))
+        if instance is not None:
+            return instance
+        return super().to_internal_value(data)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    batch_size = 1000
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("max_length", settings.API_MAX_BULK_SIZE)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def model(self):
+        return self.child.Meta.model
+
+    @property
+    def many_to_many_fields(self):
+        return [field.name for field in self.model._meta.many_to_many]
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.related_objects = self.load_related_objects(data)
+        return super().to_internal_value(data)
+
+    def load_related_objects(self, data):
+        related_objects = {}
+        for name, field in self.child.fields.items():
+            relation = getattr(field, "child_relation", field)
+            if field.read_only or not isinstance(relation, BulkPrimaryKeyRelatedField):
+                continue
+            queryset = relation.get_queryset()
+            pks = set()
+            for item in data:
+                value = item.get(name) if isinstance(item, dict) else None
+                for pk in value if isinstance(value, list) else [value]:
+                    try:
+                        pks.add(queryset.model._meta.pk.to_python(pk))
+                    except (DjangoValidationError, TypeError):
+                        continue
+            pks.discard(None)
+            objects = related_objects.setdefault(queryset.model, {})
+            for pk, instance in queryset.in_bulk(pks).items():
+                objects[str(pk)] = instance
+        return related_objects
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            instance = self.get_child_instance(data)
+            if instance is None:
+                raise serializers.ValidationError({"id": ["Not found."]})
+            self.child.instance = instance
+            self.child.initial_data = data
+        return super().run_child_validation(data)
+
+    def get_child_instance(self, data):
+        if not hasattr(self, "instance_map"):
+            self.instance_map = {
+                str(instance.pk): instance for instance in self.instance
+            }
+        if not isinstance(data, dict):
+            return None
+        return self.instance_map.get(str(data.get("id")))
+
+    def create(self, validated_data):
+        instances = []
+        relations = []
+        for attrs in validated_data:
+            attrs = dict(attrs)
+            relations.append(self.pop_many_to_many(attrs))
+            instances.append(self.model(**attrs))
+
+        with transaction.atomic():
+            self.reserve_related([None] * len(instances), relations)
+            instances = self.model.objects.bulk_create(
+                instances, batch_size=self.batch_size
+            )
+            self.set_many_to_many(instances, relations, replace=False)
+        post_bulk_save.send(sender=self.model, instances=instances, created=True)
+        return instances
+
+    def update(self, instance, validated_data):
+        instances = [self.get_child_instance(item) for item in self.initial_data]
+        relations = []
+        # bulk_update() does not run pre_save(), so refresh auto_now fields here.
+        auto_now_fields = [
+            field
+            for field in self.model._meta.concrete_fields
+            if getattr(field, "auto_now", False)
+        ]
+        fields = {field.name for field in auto_now_fields}
+        for target, attrs in zip(instances, validated_data):
+            attrs = dict(attrs)
+            relations.append(self.pop_many_to_many(attrs))
+            for attr, value in attrs.items():
+                setattr(target, attr, value)
+            for field in auto_now_fields:
+                field.pre_save(target, add=False)
+            fields.update(attrs)
+
+        with transaction.atomic():
+            self.reserve_related(instances, relations)
+            if fields:
+                self.model.objects.bulk_update(
+                    instances, fields, batch_size=self.batch_size
+                )
+            self.set_many_to_many(instances, relations)
+        post_bulk_save.send(sender=self.model, instances=instances, created=False)
+        return instances
+
+    def reserve_related(self, instances, relations):
+        # Lets the child check and reserve related rows in the save's
+        # transaction, as OrderSerializer does for products.
+        if hasattr(self.child, "reserve_related"):
+            self.child.reserve_related(instances, relations)
+
+    def pop_many_to_many(self, attrs):
+        return {
+            name: attrs.pop(name) for name in self.many_to_many_fields if name in attrs
+        }
+
+    def set_many_to_many(self, instances, relations, replace=True):
+        # Write the through table directly: one DELETE and one batched INSERT
+        # per relation instead of a .set() call for every instance.
+        for name in self.many_to_many_fields:
+            field = self.model._meta.get_field(name)
+            through = field.remote_field.through
+            source = f"{field.m2m_field_name()}_id"
+            target = f"{field.m2m_reverse_field_name()}_id"
+            changed = [
+                (instance, related[name])
+                for instance, related in zip(instances, relations)
+                if name in related
+            ]
+            if not changed:
+                continue
+            if replace:
+                through.objects.filter(
+                    **{f"{source}__in": [instance.pk for instance, _ in changed]}
+                ).delete()
+            through.objects.bulk_create(
+                [
+                    through(**{source: instance.pk, target: related.pk})
+                    for instance, objects in changed
+                    for related in dict.fromkeys(objects)
+                ],
+                batch_size=self.batch_size,
+            )
+
+
+class SparseFieldsMixin:
+    """
+    Keeps only the fields named in the context's "fields" list and drops
+    those in its "omit" list. Applies to the top-level serializer, not to
+    expanded relations.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        selected = self.context.get("fields")
+        omitted = self.context.get("omit") or ()
+        return {
+            name: field
+            for name, field in fields.items()
+            if (selected is None or name in selected) and name not in omitted
+        }
+
+
+class TimedSerializerMixin:
+    """Counts to_representation() in the request's serializer time."""
+
+    @timed_serialization
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+
+class ProductSerializer(
+    TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Product
         fields = "__all__"
+        list_serializer_class = BulkListSerializer
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(
+    TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Customer
         fields = "__all__"
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(
+    TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer
+):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+    total_price = serializers.DecimalField(
+        source="cached_total", max_digits=12, decimal_places=2, read_only=True
+    )
+
     class Meta:
         model = Order
-        fields = "__all__"
+        fields = (
+            "id",
+            "date",
+            "status",
+            "updated_at",
+            "total_price",
+            "item_count",
+            "is_fulfillable",
+            "customer",
+            "products",
+        )
+        list_serializer_class = BulkListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = self.context.get("expand", ())
+        if "customer" in expand and "customer" in fields:
+            fields["customer"] = CustomerSerializer(read_only=True)
+        if "products" in expand and "products" in fields:
+            fields["products"] = ProductSerializer(many=True, read_only=True)
+        return fields
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            self.reserve_related([None], [validated_data])
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self.reserve_related([instance], [validated_data])
+            return super().update(instance, validated_data)
+
+    def reserve_related(self, instances, items):
+        """
+        Reserves the products each order gains and releases those it loses
+        with one ProductQuerySet.reserve(), in the save's transaction.
+        Orders that gain an unavailable or sold-out product get a "products"
+        error.
+        """
+        current = defaultdict(set)
+        saved = [instance.pk for instance in instances if instance is not None]
+        if saved:
+            links = Order.products.through.objects.filter(order_id__in=saved)
+            for order_id, product_id in links.values_list("order_id", "product_id"):
+                current[order_id].add(product_id)
+        added = [
+            [
+                product.pk
+                for product in dict.fromkeys(item.get("products", ()))
+                if product.pk not in current[getattr(instance, "pk", None)]
+            ]
+            for instance, item in zip(instances, items)
+        ]
+        quantities = Counter(pk for pks in added for pk in pks)
+        for instance, item in zip(instances, items):
+            if instance is not None and "products" in item:
+                kept = {product.pk for product in item["products"]}
+                for pk in current[instance.pk] - kept:
+                    quantities[pk] -= 1
+        quantities = {pk: quantity for pk, quantity in quantities.items() if quantity}
+        if not quantities:
+            return
+        try:
+            products = Product.objects.reserve(quantities)
+        except ProductUnavailable as exc:
+            errors = [
+                (
+                    {
+                        "products": [
+                            f"Product {pk} is unavailable or out of stock."
+                            for pk in pks
+                            if pk in exc.product_ids
+                        ]
+                    }
+                    if exc.product_ids.intersection(pks)
+                    else {}
+                )
+                for pks in added
+            ]
+            raise serializers.ValidationError(
+                errors[0] if self.parent is None else errors
+            )
+        if any(product.stock is not None for product in products):
+            product_cache.invalidate_on_commit()
+
+    def validate_status(self, value):
+        if (
+            self.instance is not None
+            and value != self.instance.status
+            and not Order.can_transition(self.instance.status, value)
+        ):
+            raise serializers.ValidationError(
+                f'Cannot change status from "{self.instance.status}" to "{value}".'
+            )
+        return value
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=settings.API_MAX_BULK_SIZE,
+    )
+    log = serializers.BooleanField(default=False)
+
+    def validate_status(self, value):
+        if not Order.get_transition_sources(value):
+            raise serializers.ValidationError(f'No order can move to "{value}".')
+        return value
+
+    def validate(self, attrs):
+        # Without either, every order in a source status would move.
+        if "ids" not in attrs and not self.context.get("filtered"):
+            raise serializers.ValidationError(
+                "Select the orders with ids or a filter such as ?status=."
+            )
+        return attrs
+
+
+class ReportQuerySerializer(serializers.Serializer):
+    date_after = serializers.DateField(required=False)
+    date_before = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=10)
+
+
+class DailyReportSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    order_count = serializers.IntegerField()
+    item_count = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class StatusReportSerializer(serializers.Serializer):
+    status = serializers.CharField()
+    order_count = serializers.IntegerField()
+    item_count = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class CustomerReportSerializer(serializers.Serializer):
+    customer = serializers.IntegerField()
+    name = serializers.CharField()
+    order_count = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class ProductReportSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    order_count = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    method = serializers.CharField(source="request.method")
+    path = serializers.CharField(source="request.path")
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "url",
+            "status",
+            "method",
+            "path",
+            "status_code",
+            "result",
+            "download",
+            "error",
+            "attempts",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+        read_only_fields = fields
+
+    def get_url(self, job):
+        return self.build_url("job-detail", job)
+
+    def get_download(self, job):
+        return self.build_url("job-download", job) if job.result_file else None
+
+    def build_url(self, view_name, job):
+        # Unlike DRF's reverse(), leaves out the ?format= of deferred exports.
+        return self.context["request"].build_absolute_uri(
+            reverse(view_name, kwargs={"pk": job.pk})
+        )
+
+
+class ValuesSerializer:
+    """
+    Read-only counterpart of a ModelSerializer for list responses. Rows come
+    from QuerySet.values(), each many-to-many relation from one query on its
+    through table, and every value is converted the way its serializer field
+    would, so the output equals serializer.data without model instances or
+    per-field get_attribute()/to_representation() calls. Related items are
+    ordered by id, like the views' prefetches.
+    """
+
+    VALUE, ROW, MANY = range(3)
+
+    def __init__(self, serializer, prefix=""):
+        self.model = serializer.Meta.model
+        self.pk_key = prefix + self.model._meta.pk.name
+        keys = [self.pk_key]
+        self.fields = []
+        self.relations = {}
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if "." in field.source or field.source == "*":
+                raise TypeError(f"{name}: dotted sources are not supported.")
+            if isinstance(
+                field, (serializers.ManyRelatedField, serializers.ListSerializer)
+            ):
+                if prefix:
+                    raise TypeError(f"{name}: nested to-many fields are not supported.")
+                self.relations[name] = self.get_relation(field)
+                self.fields.append((name, self.pk_key, None, self.MANY))
+            elif isinstance(field, serializers.ModelSerializer):
+                nested = ValuesSerializer(field, prefix=f"{prefix}{field.source}__")
+                keys += nested.keys
+                self.fields.append((name, nested.pk_key, nested.build, self.ROW))
+            else:
+                keys.append(prefix + field.source)
+                self.fields.append(
+                    (name, prefix + field.source, get_converter(field), self.VALUE)
+                )
+        self.keys = list(dict.fromkeys(keys))
+
+    def get_relation(self, field):
+        model_field = self.model._meta.get_field(field.source)
+        if not model_field.many_to_many or model_field.auto_created:
+            raise TypeError(f"{field.source}: only forward many-to-many is supported.")
+        target = model_field.m2m_reverse_field_name()
+        if isinstance(field, serializers.ListSerializer):
+            return model_field, ValuesSerializer(field.child, prefix=f"{target}__")
+        if get_converter(field.child_relation) is not None:
+            raise TypeError(f"{field.source}: only primary keys are supported.")
+        return model_field, None
+
+    def values(self, queryset):
+        # Annotations such as a search rank stay available to the paginator.
+        return queryset.prefetch_related(None).values(
+            *self.keys, *queryset.query.annotations
+        )
+
+    @timed_serialization
+    def to_representation(self, rows):
+        rows = list(rows)
+        pks = [row[self.pk_key] for row in rows]
+        related = {
+            name: self.load_relation(pks, model_field, serializer)
+            for name, (model_field, serializer) in self.relations.items()
+        }
+        return [self.build(row, related) for row in rows]
+
+    def build(self, row, related=None):
+        item = {}
+        for name, key, convert, kind in self.fields:
+            value = row[key]
+            if value is None:
+                item[name] = None
+            elif kind == self.VALUE:
+                item[name] = value if convert is None else convert(value)
+            elif kind == self.ROW:
+                item[name] = convert(row)
+            else:
+                item[name] = related[name].get(value, [])
+        return item
+
+    def load_relation(self, pks, model_field, serializer):
+        loaded = {}
+        if not pks:
+            return loaded
+        source = model_field.m2m_field_name()
+        target = model_field.m2m_reverse_field_name()
+        queryset = model_field.remote_field.through.objects.filter(
+            **{f"{source}__in": pks}
+        ).order_by(f"{target}_id")
+        if serializer is None:
+            for pk, related_pk in queryset.values_list(source, target):
+                loaded.setdefault(pk, []).append(related_pk)
+        else:
+            for row in queryset.values(source, *serializer.keys):
+                loaded.setdefault(row[source], []).append(serializer.build(row))
+        return loaded
+
+
+def get_converter(field):
+    # None where the field would return the database value unchanged.
+    method = type(field).to_representation
+    if method in (
+        serializers.IntegerField.to_representation,
+        serializers.CharField.to_representation,
+        serializers.BooleanField.to_representation,
+    ):
+        return None
+    if method is serializers.PrimaryKeyRelatedField.to_representation:
+        if field.pk_field is None:
+            return None
+        return field.to_representation
+    if method is serializers.ChoiceField.to_representation:
+        choices = field.choice_strings_to_values
+        return lambda value: choices.get(str(value), value)
+    if method is serializers.DecimalField.to_representation:
+        return get_decimal_converter(field)
+    if method is serializers.DateField.to_representation:
+        output_format = getattr(field, "format", api_settings.DATE_FORMAT)
+        if output_format is not None and output_format.lower() == ISO_8601:
+            return lambda value: value.isoformat()
+        return field.to_representation
+    if method is serializers.DateTimeField.to_representation:
+        return get_datetime_converter(field)
+    raise TypeError(f"{field.field_name}: {type(field).__name__} is not supported.")
+
+
+def get_decimal_converter(field):
+    coerce_to_string = getattr(
+        field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+    )
+    if (
+        field.decimal_places is None
+        or not coerce_to_string
+        or field.localize
+        or field.normalize_output
+    ):
+        return field.to_representation
+    exponent = -field.decimal_places
+
+    def convert(value):
+        # Column values already have the field's scale, so quantize() is a no-op.
+        if value.as_tuple().exponent == exponent:
+            return f"{value:f}"
+        return field.to_representation(value)
+
+    return convert
+
+
+def get_datetime_converter(field):
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    # Looked up once rather than per value, as enforce_timezone() does.
+    field_timezone = (
+        field.timezone if hasattr(field, "timezone") else field.default_timezone()
+    )
+    if (
+        output_format is None
+        or output_format.lower() != ISO_8601
+        or field_timezone is None
+    ):
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    return convert
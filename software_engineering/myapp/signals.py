@@ -0,0 +1,155 @@
+import os
+from functools import partial
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from rest_framework_simplejwt.settings import api_settings
+from .cache import product_cache, user_cache
+from .models import Job, Order, Product
+from .reports import mark_stale
+
+# Sent by BulkListSerializer, whose bulk_create/bulk_update skip post_save.
+post_bulk_save = Signal()
+
+# Product fields that feed the denormalized Order totals.
+ORDER_TOTAL_SOURCES = ("price", "available")
+
+
+@receiver([post_save, post_delete, post_bulk_save], sender=Product)
+def invalidate_product_cache(sender, **kwargs):
+    product_cache.invalidate_on_commit()
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_user_cache(sender, instance, **kwargs):
+    # Password, is_active and is_staff changes must reach authentication
+    # right away, for token revocation and permissions.
+    user_cache.invalidate_on_commit(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def refresh_orders_on_products_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    # Product links feed the order totals and are part of the order
+    # representation, so they also move Order.updated_at for ETag /
+    # Last-Modified validation.
+    if action == "pre_clear" and reverse:
+        instance._cleared_order_ids = list(
+            instance.order_set.values_list("pk", flat=True)
+        )
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        instance.refresh_totals()
+    elif action == "post_clear":
+        Order.objects.filter(pk__in=instance._cleared_order_ids).refresh_totals()
+    else:
+        Order.objects.filter(pk__in=pk_set).refresh_totals()
+
+
+@receiver(post_save, sender=Product)
+def refresh_orders_on_product_save(sender, instance, created, **kwargs):
+    if created:
+        return
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is not None and all(
+        loaded.get(field) == getattr(instance, field) for field in ORDER_TOTAL_SOURCES
+    ):
+        return
+    Order.objects.filter(products=instance).refresh_totals()
+    instance._loaded_values = {
+        field: getattr(instance, field) for field in ORDER_TOTAL_SOURCES
+    }
+
+
+@receiver(pre_delete, sender=Product)
+def remember_orders_on_product_delete(sender, instance, **kwargs):
+    # The cascade removes the links without sending m2m_changed.
+    instance._order_ids = list(instance.order_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_orders_on_product_delete(sender, instance, **kwargs):
+    Order.objects.filter(pk__in=instance._order_ids).refresh_totals()
+
+
+@receiver(post_bulk_save, sender=Product)
+def refresh_orders_on_products_bulk_save(sender, instances, created, **kwargs):
+    if not created:
+        Order.objects.filter(products__in=instances).refresh_totals()
+
+
+@receiver(post_bulk_save, sender=Order)
+def refresh_orders_on_bulk_save(sender, instances, **kwargs):
+    # Bulk saves write the through table directly.
+    Order.objects.filter(pk__in=[order.pk for order in instances]).refresh_totals()
+
+
+@receiver(post_bulk_save, sender=Order)
+def mark_report_days_on_bulk_move(sender, instances, created, **kwargs):
+    if created:
+        return
+    left = {
+        order._loaded_date
+        for order in instances
+        if getattr(order, "_loaded_date", None) is not None
+        and str(order._loaded_date) != str(order.date)
+    }
+    if left:
+        mark_stale(left)
+    for order in instances:
+        order._loaded_date = order.date
+
+
+@receiver(pre_save, sender=Order)
+def mark_report_day_on_order_move(sender, instance, **kwargs):
+    # The day an order leaves keeps no updated_at that shows the change.
+    if instance._state.adding:
+        return
+    loaded = getattr(instance, "_loaded_date", None)
+    if loaded is None:
+        loaded = Order.objects.filter(pk=instance.pk).values_list("date", flat=True)
+        loaded = loaded.first()
+    if loaded is not None and str(loaded) != str(instance.date):
+        mark_stale([loaded])
+
+
+@receiver(post_save, sender=Order)
+def remember_order_date(sender, instance, **kwargs):
+    instance._loaded_date = instance.date
+
+
+@receiver(post_delete, sender=Order)
+def mark_report_day_on_order_delete(sender, instance, **kwargs):
+    mark_stale([instance.date])
+
+
+@receiver(pre_delete, sender=Order)
+def release_stock_on_order_delete(sender, instance, **kwargs):
+    # Sent for API, admin and cascade deletes alike, in the delete's
+    # transaction and while the product links still exist.
+    products = Order.objects.filter(pk=instance.pk).release_stock()
+    if any(product.stock is not None for product in products):
+        product_cache.invalidate_on_commit()
+
+
+def delete_result_file(name):
+    try:
+        os.remove(os.path.join(settings.JOB_RESULT_DIR, name))
+    except FileNotFoundError:
+        pass
+
+
+@receiver(post_delete, sender=Job)
+def delete_job_result_file(sender, instance, **kwargs):
+    # Expired jobs and the jobs of deleted users alike.
+    if instance.result_file:
+        transaction.on_commit(partial(delete_result_file, instance.result_file))
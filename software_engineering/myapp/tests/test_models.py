@@ -1,5 +1,17 @@
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from unittest import skipUnless
+from django.db import connection, transaction
 from django.test import TestCase
-from myapp.models import Product, Customer, Order
+from django.utils import timezone
+from myapp.models import (
+    Product,
+    Customer,
+    Order,
+    OrderTransition,
+    ProductUnavailable,
+)
 from django.core.exceptions import ValidationError
 from django.db.utils import IntegrityError, DataError
 
@@ -83,6 +95,41 @@ class ProductModelTest(TestCase):
             temp_product.full_clean()
 
 
+class ProductReserveTest(TestCase):
+    def setUp(self):
+        self.tracked = Product.objects.create(
+            name="Tracked product", price=1.99, available=True, stock=3
+        )
+        self.untracked = Product.objects.create(
+            name="Untracked product", price=2.99, available=True
+        )
+        self.unavailable = Product.objects.create(
+            name="Unavailable product", price=3.99, available=False
+        )
+
+    def test_reserve_takes_stock(self):
+        with transaction.atomic():
+            Product.objects.reserve({self.tracked.id: 2, self.untracked.id: 5})
+        self.tracked.refresh_from_db()
+        self.untracked.refresh_from_db()
+        self.assertEqual(self.tracked.stock, 1)
+        self.assertIsNone(self.untracked.stock)
+
+    def test_reserve_is_all_or_nothing(self):
+        for quantities, unavailable in (
+            ({self.tracked.id: 4, self.untracked.id: 1}, {self.tracked.id}),
+            ({self.tracked.id: 1, self.unavailable.id: 1}, {self.unavailable.id}),
+            ({self.tracked.id: 1, 0: 1}, {0}),
+        ):
+            with self.subTest(quantities=quantities):
+                with self.assertRaises(ProductUnavailable) as raised:
+                    with transaction.atomic():
+                        Product.objects.reserve(quantities)
+                self.assertEqual(raised.exception.product_ids, unavailable)
+                self.tracked.refresh_from_db()
+                self.assertEqual(self.tracked.stock, 3)
+
+
 class CustomerModelTest(TestCase):
     def test_create_customer_with_valid_data(self):
         temp_customer = Customer.objects.create(
@@ -209,3 +256,207 @@ class OrderModelTest(TestCase):
         )
 
         self.assertFalse(temp_order.can_be_fullfilled())
+
+    def test_order_annotated_totals_and_fulfillability(self):
+        temp_order = Order.objects.create(
+            customer=self.temp_customer,
+            date="2025-01-01",
+            status="New",
+        )
+        temp_order.products.set(
+            [self.temp_product1, self.temp_product2, self.temp_product3]
+        )
+
+        annotated_order = (
+            Order.objects.with_totals().with_fulfillability().get(id=temp_order.id)
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(annotated_order.total_price(), Decimal("8.97"))
+            self.assertFalse(annotated_order.can_be_fullfilled())
+
+    def test_order_annotated_totals_with_no_products(self):
+        Order.objects.create(
+            customer=self.temp_customer,
+            date="2025-01-01",
+            status="New",
+        )
+
+        annotated_order = Order.objects.with_totals().with_fulfillability().get()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(annotated_order.total_price(), Decimal("0.00"))
+            self.assertTrue(annotated_order.can_be_fullfilled())
+
+    def test_order_list_with_annotations_uses_constant_queries(self):
+        for _ in range(5):
+            temp_order = Order.objects.create(
+                customer=self.temp_customer,
+                date="2025-01-01",
+                status="New",
+            )
+            temp_order.products.set([self.temp_product1, self.temp_product3])
+
+        with self.assertNumQueries(1):
+            orders = list(Order.objects.with_totals().with_fulfillability())
+            for order in orders:
+                self.assertEqual(order.total_price(), Decimal("5.98"))
+                self.assertFalse(order.can_be_fullfilled())
+
+    def test_order_totals_follow_product_links(self):
+        temp_order = Order.objects.create(
+            customer=self.temp_customer,
+            date="2025-01-01",
+            status="New",
+        )
+        temp_order.products.add(self.temp_product1, self.temp_product3)
+        self.assertEqual(temp_order.cached_total, Decimal("5.98"))
+        self.assertEqual(temp_order.item_count, 2)
+        self.assertFalse(temp_order.is_fulfillable)
+
+        self.temp_product3.order_set.remove(temp_order)
+        temp_order.refresh_from_db()
+        self.assertEqual(temp_order.cached_total, Decimal("1.99"))
+        self.assertEqual(temp_order.item_count, 1)
+        self.assertTrue(temp_order.is_fulfillable)
+
+        self.temp_product1.order_set.clear()
+        temp_order.refresh_from_db()
+        self.assertEqual(temp_order.cached_total, Decimal("0.00"))
+        self.assertEqual(temp_order.item_count, 0)
+
+    def test_order_totals_follow_product_changes(self):
+        temp_order = Order.objects.create(
+            customer=self.temp_customer,
+            date="2025-01-01",
+            status="New",
+        )
+        temp_order.products.set([self.temp_product1, self.temp_product2])
+
+        product = Product.objects.get(pk=self.temp_product1.pk)
+        product.price = Decimal("10.00")
+        product.available = False
+        product.save()
+        temp_order.refresh_from_db()
+        self.assertEqual(temp_order.cached_total, Decimal("12.99"))
+        self.assertFalse(temp_order.is_fulfillable)
+
+        product.delete()
+        temp_order.refresh_from_db()
+        self.assertEqual(temp_order.cached_total, Decimal("2.99"))
+        self.assertEqual(temp_order.item_count, 1)
+        self.assertTrue(temp_order.is_fulfillable)
+
+    def test_product_save_without_total_changes_skips_orders(self):
+        product = Product.objects.get(pk=self.temp_product1.pk)
+        product.name = "Renamed product"
+
+        with self.assertNumQueries(1):
+            product.save()
+
+    def test_recompute_order_totals_command(self):
+        temp_order = Order.objects.create(
+            customer=self.temp_customer,
+            date="2025-01-01",
+            status="New",
+        )
+        temp_order.products.set([self.temp_product2, self.temp_product3])
+        Order.objects.update(cached_total=0, item_count=0, is_fulfillable=True)
+
+        call_command("recompute_order_totals", batch_size=1, stdout=StringIO())
+
+        temp_order.refresh_from_db()
+        self.assertEqual(temp_order.cached_total, Decimal("6.98"))
+        self.assertEqual(temp_order.item_count, 2)
+        self.assertFalse(temp_order.is_fulfillable)
+
+    def test_order_transition_moves_only_orders_in_source_status(self):
+        orders = [
+            Order.objects.create(
+                customer=self.temp_customer, date="2025-01-01", status=status
+            )
+            for status in ("New", "New", "Sent")
+        ]
+
+        with self.assertNumQueries(1):
+            moved = Order.objects.transition("New", "In Process")
+
+        self.assertCountEqual(moved, [orders[0].id, orders[1].id])
+        self.assertEqual(Order.objects.filter(status="In Process").count(), 2)
+        self.assertEqual(Order.objects.transition("New", "In Process"), [])
+        self.assertFalse(OrderTransition.objects.exists())
+
+    def test_order_transition_is_validated_and_logged(self):
+        order = Order.objects.create(
+            customer=self.temp_customer, date="2025-01-01", status="New"
+        )
+        with self.assertRaises(ValueError):
+            Order.objects.transition("New", "Completed")
+
+        stale = Order.objects.get(pk=order.pk)
+        self.assertTrue(order.transition("In Process", log=True))
+        self.assertEqual(order.status, "In Process")
+        self.assertFalse(stale.transition("In Process", log=True))
+
+        transition = order.transitions.get()
+        self.assertEqual(
+            (transition.from_status, transition.to_status), ("New", "In Process")
+        )
+
+
+class PopulateSampleDataTest(TestCase):
+    def populate(self, **options):
+        call_command(
+            "populate_sample_data",
+            products=20,
+            customers=5,
+            orders=50,
+            products_per_order=3,
+            batch_size=7,
+            seed=1,
+            stdout=StringIO(),
+            **options,
+        )
+
+    def assert_populated(self):
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(Customer.objects.count(), 5)
+        self.assertEqual(Order.objects.count(), 50)
+        self.assertEqual(Order.products.through.objects.count(), 150)
+        for order in Order.objects.with_totals().with_fulfillability():
+            self.assertEqual(order.cached_total, order.products_total)
+            self.assertEqual(order.item_count, 3)
+            self.assertEqual(order.is_fulfillable, order.unavailable_products == 0)
+
+    def test_populate_with_bulk_create(self):
+        self.populate()
+        self.assert_populated()
+
+    @skipUnless(connection.vendor == "postgresql", "COPY is PostgreSQL-only")
+    def test_populate_with_copy(self):
+        self.populate(copy=True)
+        self.assert_populated()
+
+    def test_populate_reports_dependent_tables(self):
+        self.populate()
+        OrderTransition.objects.create(
+            order=Order.objects.first(),
+            from_status="New",
+            to_status="In Process",
+            created_at=timezone.now(),
+        )
+        stdout = StringIO()
+        call_command("populate_sample_data", orders=0, stdout=stdout)
+        self.assertIn("myapp.OrderTransition", stdout.getvalue())
+        self.assertIn("myapp.DailyCustomerSales", stdout.getvalue())
+        self.assertFalse(OrderTransition.objects.exists())
+
+    def test_populate_is_reproducible_and_resets_sequences(self):
+        self.populate()
+        first = list(Order.objects.values_list("customer", "date", "cached_total"))
+        self.populate()
+        self.assertEqual(
+            list(Order.objects.values_list("customer", "date", "cached_total")), first
+        )
+        product = Product.objects.create(name="Extra product", price=1.99)
+        self.assertEqual(product.id, 21)
@@ -1,8 +1,60 @@
+import brotli
+import csv
+import glob
+import gzip
+import json
+import msgpack
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import urllib.error
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, router, transaction
+from django.db.models import Prefetch
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from myapp.models import Product, Customer, Order
+from django.utils import timezone
+from myapp.cache import product_cache, user_cache
+from myapp.filters import RankedSearchFilter
+from myapp.jobs import claim_job, expire_jobs, run_job
+from myapp.throttling import get_store
+from myapp.metrics import (
+    Counter,
+    Registry,
+    SerializeTimer,
+    SharedDirectory,
+    current_serialize_timer,
+    registry,
+    timed_serialization,
+)
+from myapp.middleware import QueryRecorder, ReplicaRoutingMiddleware
+from myapp.models import Product, Customer, Order, Job
+from myapp.pagination import KeysetPagination
+from myapp.renderers import ORJSONRenderer
+from myapp.reports import refresh_reports
+from myapp.serializers import (
+    CustomerSerializer,
+    OrderSerializer,
+    ProductSerializer,
+    ValuesSerializer,
+)
+from myapp.views import OrderViewSet, ProductViewSet
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import AccessToken
 
 
@@ -30,20 +82,20 @@ class ProductApiTest(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
         response = self.client.get(self.product_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["name"], "Temporary product")
-        self.assertEqual(response.data[0]["price"], "1.99")
-        self.assertTrue(response.data[0]["available"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["name"], "Temporary product")
+        self.assertEqual(response.data["results"][0]["price"], "1.99")
+        self.assertTrue(response.data["results"][0]["available"])
 
     def test_get_all_products_as_admin(self):
         self.token = str(AccessToken.for_user(self.admin))
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
         response = self.client.get(self.product_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["name"], "Temporary product")
-        self.assertEqual(response.data[0]["price"], "1.99")
-        self.assertTrue(response.data[0]["available"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["name"], "Temporary product")
+        self.assertEqual(response.data["results"][0]["price"], "1.99")
+        self.assertTrue(response.data["results"][0]["available"])
 
     def test_get_single_product_as_regular_user(self):
         self.token = str(AccessToken.for_user(self.regular_user))
@@ -129,3 +181,2304 @@ class ProductApiTest(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
         response = self.client.get(self.invalid_url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderApiTest(APITestCase):
+    def setUp(self):
+        self.regular_user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        self.product1 = Product.objects.create(
+            name="Temporary product 1", price=1.99, available=True
+        )
+        self.product2 = Product.objects.create(
+            name="Temporary product 2", price=2.99, available=False
+        )
+        self.order = Order.objects.create(
+            customer=self.customer, date="2025-01-01", status="New"
+        )
+        self.order.products.set([self.product1, self.product2])
+        self.order_list_url = reverse("order-list")
+        self.order_detail_url = reverse("order-detail", kwargs={"pk": self.order.id})
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.regular_user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def authenticate_admin(self):
+        admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(admin)}"
+        )
+
+    def create_orders(self, count):
+        orders = Order.objects.bulk_create(
+            Order(customer=self.customer, date="2025-01-01", status="New")
+            for _ in range(count)
+        )
+        Order.products.through.objects.bulk_create(
+            Order.products.through(order_id=order.id, product_id=product.id)
+            for order in orders
+            for product in (self.product1, self.product2)
+        )
+
+    def test_get_single_order(self):
+        response = self.client.get(self.order_detail_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["customer"], self.customer.id)
+        self.assertCountEqual(
+            response.data["products"], [self.product1.id, self.product2.id]
+        )
+
+    def test_get_single_order_expanded(self):
+        response = self.client.get(
+            self.order_detail_url, {"expand": "customer,products"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["customer"]["name"], "Temporary customer")
+        self.assertCountEqual(
+            [product["name"] for product in response.data["products"]],
+            ["Temporary product 1", "Temporary product 2"],
+        )
+
+    def test_get_all_orders_ignores_unknown_expand_fields(self):
+        response = self.client.get(self.order_list_url, {"expand": "date,unknown"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["customer"], self.customer.id)
+        self.assertEqual(response.data["results"][0]["date"], "2025-01-01")
+
+    def test_get_all_orders_uses_constant_queries(self):
+        # Caches the user, leaving ETag aggregate, orders, prefetched products
+        self.client.get(self.order_list_url)
+        for count in (10, 100, 1000):
+            with self.subTest(count=count):
+                Order.objects.all().delete()
+                self.create_orders(count)
+                with self.assertNumQueries(3):
+                    response = self.client.get(
+                        self.order_list_url, {"page_size": count}
+                    )
+                self.assertEqual(len(response.data["results"]), count)
+
+    def test_get_all_orders_expanded_uses_constant_queries(self):
+        self.client.get(self.order_list_url)
+        for count in (10, 100, 1000):
+            with self.subTest(count=count):
+                Order.objects.all().delete()
+                self.create_orders(count)
+                with self.assertNumQueries(3):
+                    response = self.client.get(
+                        self.order_list_url,
+                        {"expand": "customer,products", "page_size": count},
+                    )
+                self.assertEqual(len(response.data["results"]), count)
+                self.assertEqual(len(response.data["results"][0]["products"]), 2)
+
+    def test_update_order_status_follows_transitions(self):
+        self.authenticate_admin()
+        response = self.client.patch(
+            self.order_detail_url, {"status": "Completed"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("status", response.data)
+
+        response = self.client.patch(
+            self.order_detail_url, {"status": "In Process"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "In Process")
+
+    def test_transition_orders(self):
+        self.authenticate_admin()
+        self.create_orders(2)
+        sent = Order.objects.create(
+            customer=self.customer, date="2025-01-01", status="Sent"
+        )
+        ids = list(
+            Order.objects.filter(status="New")
+            .order_by("id")
+            .values_list("pk", flat=True)
+        )
+        response = self.client.post(
+            reverse("order-transition"),
+            {"status": "In Process", "ids": [*ids, sent.id, 0], "log": True},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["transitioned"], 3)
+        self.assertEqual(
+            response.data["results"],
+            [{"id": pk, "result": "transitioned"} for pk in ids]
+            + [
+                {"id": sent.id, "result": "rejected", "current_status": "Sent"},
+                {"id": 0, "result": "not_found"},
+            ],
+        )
+        self.assertEqual(Order.objects.filter(status="In Process").count(), 3)
+        self.assertEqual(self.order.transitions.count(), 1)
+
+        response = self.client.post(
+            f"{reverse('order-transition')}?status=In Process",
+            {"status": "Sent"},
+            format="json",
+        )
+        self.assertEqual(response.data["transitioned"], 3)
+        self.assertEqual(Order.objects.filter(status="Sent").count(), 4)
+
+    def test_transition_orders_validation(self):
+        response = self.client.post(
+            reverse("order-transition"), {"status": "In Process"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.authenticate_admin()
+        for data in (
+            {"status": "New"},
+            {"status": "Lost"},
+            {"ids": [1]},
+            {"status": "In Process"},
+            {"status": "In Process", "ids": []},
+        ):
+            with self.subTest(data=data):
+                response = self.client.post(
+                    reverse("order-transition"), data, format="json"
+                )
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_order_checks_product_availability(self):
+        self.authenticate_admin()
+        data = {
+            "customer": self.customer.id,
+            "products": [self.product1.id, self.product2.id],
+            "date": "2025-01-02",
+            "status": "New",
+        }
+        response = self.client.post(self.order_list_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["products"],
+            [f"Product {self.product2.id} is unavailable or out of stock."],
+        )
+
+        # Products an order already has are not checked again.
+        response = self.client.patch(
+            self.order_detail_url, {"date": "2025-01-03"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_create_order_reserves_stock(self):
+        self.authenticate_admin()
+        Product.objects.filter(pk=self.product1.pk).update(stock=1)
+        data = {
+            "customer": self.customer.id,
+            "products": [self.product1.id],
+            "date": "2025-01-02",
+            "status": "New",
+        }
+        response = self.client.post(self.order_list_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 0)
+
+        response = self.client.post(self.order_list_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_removed_products_and_deleted_orders_release_stock(self):
+        self.authenticate_admin()
+        Product.objects.filter(pk=self.product1.pk).update(stock=2)
+        other = Product.objects.create(name="Other product", price=3.99, stock=1)
+        untracked = Product.objects.create(name="Untracked product", price=4.99)
+
+        def place_order():
+            response = self.client.post(
+                self.order_list_url,
+                {
+                    "customer": self.customer.id,
+                    "products": [self.product1.id],
+                    "date": "2025-01-02",
+                    "status": "New",
+                },
+                format="json",
+            )
+            return reverse("order-detail", args=[response.data["id"]])
+
+        def stock():
+            return list(
+                Product.objects.filter(pk__in=[self.product1.pk, other.pk])
+                .order_by("pk")
+                .values_list("stock", flat=True)
+            )
+
+        first, second = place_order(), place_order()
+        self.assertEqual(stock(), [0, 1])
+        response = self.client.patch(first, {"products": [other.id]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(stock(), [1, 0])
+        self.client.patch(first, {"date": "2025-01-03"}, format="json")
+        self.assertEqual(stock(), [1, 0])
+
+        # Products that became unavailable can still be removed.
+        Product.objects.filter(pk=self.product1.pk).update(available=False)
+        response = self.client.patch(
+            second, {"products": [untracked.id]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(stock(), [2, 0])
+
+        self.assertEqual(self.client.delete(first).status_code, 204)
+        self.assertEqual(stock(), [2, 1])
+        self.client.patch(second, {"products": [other.id]}, format="json")
+        self.assertEqual(stock(), [2, 0])
+        response = self.client.delete(
+            reverse("order-bulk"), [int(second.split("/")[-2])], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(stock(), [2, 1])
+
+    def test_customer_delete_releases_stock_of_its_orders(self):
+        self.authenticate_admin()
+        Product.objects.filter(pk=self.product1.pk).update(stock=2)
+        customer = Customer.objects.create(
+            name="Leaving customer", address="Swidnicka 3, 50-345 Wroclaw"
+        )
+        for _ in range(2):
+            response = self.client.post(
+                self.order_list_url,
+                {
+                    "customer": customer.id,
+                    "products": [self.product1.id],
+                    "date": "2025-01-02",
+                    "status": "New",
+                },
+                format="json",
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 0)
+
+        response = self.client.delete(reverse("customer-detail", args=[customer.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Order.objects.filter(customer=customer.id).exists())
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 2)
+
+    def test_filter_orders(self):
+        other_customer = Customer.objects.create(
+            name="Other customer", address="Swidnicka 3, 50-345 Wroclaw"
+        )
+        sent = Order.objects.create(
+            customer=other_customer, date="2025-02-01", status="Sent"
+        )
+        sent.products.set([self.product1])
+        completed = Order.objects.create(
+            customer=self.customer, date="2025-03-01", status="Completed"
+        )
+        completed.products.set([self.product2])
+
+        cases = (
+            ("status=New,Sent", [self.order.id, sent.id]),
+            ("status=Completed", [completed.id]),
+            (f"customer={other_customer.id}", [sent.id]),
+            (f"product={self.product1.id}", [self.order.id, sent.id]),
+            (
+                f"product={self.product1.id},{self.product2.id}",
+                [
+                    self.order.id,
+                    sent.id,
+                    completed.id,
+                ],
+            ),
+            ("date_after=2025-02-01", [sent.id, completed.id]),
+            ("date_after=2025-01-15&date_before=2025-02-01", [sent.id]),
+            (
+                f"status=New,Completed&customer={self.customer.id}&ordering=-date",
+                [completed.id, self.order.id],
+            ),
+        )
+        for query, expected in cases:
+            with self.subTest(query=query):
+                response = self.client.get(f"{self.order_list_url}?{query}")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    [order["id"] for order in response.data["results"]], expected
+                )
+
+    def test_filter_orders_validation(self):
+        for query in ("status=Lost", "customer=abc", "date_after=yesterday"):
+            with self.subTest(query=query):
+                response = self.client.get(f"{self.order_list_url}?{query}")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn(query.split("=")[0], response.data)
+
+    def test_filter_transition_orders(self):
+        self.authenticate_admin()
+        other_customer = Customer.objects.create(
+            name="Other customer", address="Swidnicka 3, 50-345 Wroclaw"
+        )
+        other = Order.objects.create(
+            customer=other_customer, date="2025-01-01", status="New"
+        )
+        response = self.client.post(
+            f"{reverse('order-transition')}?customer={other_customer.id}",
+            {"status": "In Process"},
+            format="json",
+        )
+        self.assertEqual(response.data["transitioned"], 1)
+        other.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(other.status, "In Process")
+        self.assertEqual(self.order.status, "New")
+
+    @skipUnless(connection.vendor == "postgresql", "uses PostgreSQL EXPLAIN")
+    def test_filtered_order_queries_can_use_indexes(self):
+        cases = (
+            (
+                Order.objects.filter(status__in=["Completed"], date__gte="2025-01-01"),
+                ["order_status_date_id_idx"],
+            ),
+            (
+                # The partial index only wins over the status one on big tables.
+                Order.objects.filter(status__in=["New", "Sent"]),
+                ["order_open_date_id_idx", "order_status_date_id_idx"],
+            ),
+            (
+                Order.objects.filter(customer_id__in=[self.customer.id]),
+                ["order_customer_date_id_idx"],
+            ),
+        )
+        for queryset, indexes in cases:
+            with self.subTest(indexes=indexes):
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                    plan = queryset.order_by("date", "id").explain()
+                self.assertTrue(any(name in plan for name in indexes), plan)
+
+    def test_create_order_with_expand_accepts_primary_keys(self):
+        admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(admin)}"
+        )
+        data = {
+            "customer": self.customer.id,
+            "products": [self.product1.id],
+            "date": "2025-01-02",
+            "status": "New",
+        }
+        response = self.client.post(
+            f"{self.order_list_url}?expand=customer", data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["customer"], self.customer.id)
+
+
+class PaginationApiTest(APITestCase):
+    def setUp(self):
+        self.regular_user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=1.99, available=True)
+            for i in range(5)
+        ]
+        customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        dates = ["2025-01-02", "2025-01-01", "2025-01-02", "2025-01-01", "2025-01-03"]
+        self.orders = [
+            Order.objects.create(customer=customer, date=date, status="New")
+            for date in dates
+        ]
+        self.product_list_url = reverse("product-list")
+        self.order_list_url = reverse("order-list")
+        self.client = APIClient()
+        self.authenticate(self.regular_user)
+
+    def authenticate(self, user):
+        self.token = str(AccessToken.for_user(user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def collect_pages(self, url, link="next"):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([item["id"] for item in response.data["results"]])
+            url = response.data[link]
+        return pages
+
+    def test_products_are_paginated_by_id(self):
+        pages = self.collect_pages(f"{self.product_list_url}?page_size=2")
+        ids = [product.id for product in self.products]
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:5]])
+
+    def test_orders_are_paginated_by_date_and_id(self):
+        pages = self.collect_pages(f"{self.order_list_url}?page_size=2")
+        ids = [order.id for order in self.orders]
+        self.assertEqual(pages, [[ids[1], ids[3]], [ids[0], ids[2]], [ids[4]]])
+
+    def test_orders_are_paginated_by_total_price(self):
+        for order, count in zip(self.orders, [1, 3, 0, 3, 2]):
+            order.products.set(self.products[:count])
+        pages = self.collect_pages(
+            f"{self.order_list_url}?ordering=-total_price&page_size=2"
+        )
+        ids = [order.id for order in self.orders]
+        self.assertEqual(pages, [[ids[3], ids[1]], [ids[4], ids[0]], [ids[2]]])
+
+    def test_orders_previous_links_walk_back(self):
+        url = f"{self.order_list_url}?page_size=2"
+        last_page_url = None
+        while url:
+            last_page_url = url
+            url = self.client.get(url).data["next"]
+
+        pages = self.collect_pages(last_page_url, link="previous")
+        ids = [order.id for order in self.orders]
+        self.assertEqual(pages, [[ids[4]], [ids[0], ids[2]], [ids[1], ids[3]]])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, "max_page_size", 3):
+            response = self.client.get(self.product_list_url, {"page_size": 100})
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertIsNotNone(response.data["next"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.order_list_url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_uses_constant_queries(self):
+        next_url = self.client.get(self.product_list_url, {"page_size": 2}).data["next"]
+        # the user is cached by the first request
+        with self.assertNumQueries(1):
+            self.client.get(next_url)
+
+    def test_offset_pagination_as_admin(self):
+        self.authenticate(self.admin)
+        response = self.client.get(self.product_list_url, {"offset": 1, "limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            [self.products[1].id, self.products[2].id],
+        )
+
+    def test_offset_pagination_ignored_for_regular_user(self):
+        response = self.client.get(self.product_list_url, {"offset": 1, "limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(response.data["results"][0]["id"], self.products[0].id)
+
+
+class ExportApiTest(APITestCase):
+    def setUp(self):
+        self.regular_user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        self.product1 = Product.objects.create(
+            name="Temporary product 1", price=1.99, available=True
+        )
+        self.product2 = Product.objects.create(
+            name="Other product", price=2.99, available=False
+        )
+        for _ in range(5):
+            order = Order.objects.create(
+                customer=self.customer, date="2025-01-01", status="New"
+            )
+            order.products.set([self.product1, self.product2])
+        self.order_export_url = reverse("order-export")
+        self.product_export_url = reverse("product-export")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.regular_user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def read_lines(self, response):
+        content = b"".join(response.streaming_content).decode()
+        return content.splitlines()
+
+    def test_export_orders_as_ndjson(self):
+        response = self.client.get(self.order_export_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+        rows = [json.loads(line) for line in self.read_lines(response)]
+        self.assertEqual(len(rows), 5)
+        self.assertCountEqual(rows[0]["products"], [self.product1.id, self.product2.id])
+
+    def test_export_orders_expanded(self):
+        response = self.client.get(self.order_export_url, {"expand": "customer"})
+        row = json.loads(self.read_lines(response)[0])
+        self.assertEqual(row["customer"]["name"], "Temporary customer")
+
+    def test_export_products_as_csv(self):
+        response = self.client.get(self.product_export_url, HTTP_ACCEPT="text/csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        rows = list(csv.DictReader(self.read_lines(response)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["name"], "Temporary product 1")
+        self.assertEqual(rows[0]["price"], "1.99")
+
+    def test_export_products_respects_search(self):
+        response = self.client.get(self.product_export_url, {"search": "Other"})
+        rows = [json.loads(line) for line in self.read_lines(response)]
+        self.assertEqual([row["name"] for row in rows], ["Other product"])
+
+    def test_export_orders_queries_per_chunk(self):
+        with mock.patch.object(OrderViewSet, "export_chunk_size", 2):
+            response = self.client.get(self.order_export_url)
+            # one server-side cursor for orders, one products query per chunk
+            with self.assertNumQueries(1 + 3):
+                lines = self.read_lines(response)
+        self.assertEqual(len(lines), 5)
+
+    def test_export_with_unsupported_accept_header(self):
+        response = self.client.get(self.order_export_url, HTTP_ACCEPT="text/html")
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+    def test_export_without_credentials(self):
+        self.client.credentials()
+        response = self.client.get(self.order_export_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BulkApiTest(APITestCase):
+    def setUp(self):
+        self.regular_user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=1.99, available=True)
+            for i in range(3)
+        ]
+        self.product_bulk_url = reverse("product-bulk")
+        self.order_bulk_url = reverse("order-bulk")
+        self.client = APIClient()
+        self.authenticate(self.admin)
+
+    def authenticate(self, user):
+        self.token = str(AccessToken.for_user(user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def order_payload(self, count):
+        return [
+            {
+                "customer": self.customer.id,
+                "products": [self.products[0].id, self.products[1].id],
+                "date": "2025-01-01",
+                "status": "New",
+            }
+            for _ in range(count)
+        ]
+
+    def test_bulk_create_products(self):
+        data = [
+            {"name": "Bulk product 1", "price": 4.99, "available": True},
+            {"name": "Bulk product 2", "price": 5.99, "available": False},
+        ]
+        response = self.client.post(self.product_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [product["name"] for product in response.data],
+            ["Bulk product 1", "Bulk product 2"],
+        )
+        self.assertEqual(Product.objects.count(), 5)
+
+    def test_bulk_create_products_as_regular_user(self):
+        self.authenticate(self.regular_user)
+        data = [{"name": "Bulk product", "price": 4.99, "available": True}]
+        response = self.client.post(self.product_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_create_products_reports_errors_per_item(self):
+        data = [
+            {"name": "Bulk product 1", "price": 4.99, "available": True},
+            {"name": "", "price": -1, "available": True},
+        ]
+        response = self.client.post(self.product_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("name", response.data[1])
+        self.assertIn("price", response.data[1])
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_bulk_partial_update_products(self):
+        data = [
+            {"id": self.products[0].id, "price": "9.99"},
+            {"id": self.products[1].id, "available": False},
+        ]
+        response = self.client.patch(self.product_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.products[0].refresh_from_db()
+        self.products[1].refresh_from_db()
+        self.assertEqual(str(self.products[0].price), "9.99")
+        self.assertTrue(self.products[0].available)
+        self.assertEqual(str(self.products[1].price), "1.99")
+        self.assertFalse(self.products[1].available)
+
+    def test_bulk_update_products_with_unknown_id(self):
+        data = [
+            {"id": self.products[0].id, "price": "9.99"},
+            {"id": 0, "price": "9.99"},
+        ]
+        response = self.client.patch(self.product_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[1], {"id": ["Not found."]})
+        self.products[0].refresh_from_db()
+        self.assertEqual(str(self.products[0].price), "1.99")
+
+    def test_bulk_delete_products(self):
+        data = [self.products[0].id, self.products[1].id]
+        response = self.client.delete(self.product_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Product.objects.all()), [self.products[2]])
+
+    def test_bulk_delete_products_with_unknown_id(self):
+        data = [self.products[0].id, 0]
+        response = self.client.delete(self.product_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {"id": ["Not found."]}])
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_bulk_create_orders(self):
+        response = self.client.post(
+            self.order_bulk_url, self.order_payload(3), format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 3)
+        for order in Order.objects.all():
+            self.assertCountEqual(
+                order.products.all(), [self.products[0], self.products[1]]
+            )
+
+    def test_bulk_create_orders_with_unknown_product(self):
+        data = self.order_payload(2)
+        data[1]["products"] = [0]
+        response = self.client.post(self.order_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("products", response.data[1])
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_bulk_create_orders_reserves_stock(self):
+        Product.objects.filter(pk=self.products[0].pk).update(stock=3)
+        response = self.client.post(
+            self.order_bulk_url, self.order_payload(4), format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data), 4)
+        self.assertIn("products", response.data[0])
+        self.assertEqual(Order.objects.count(), 0)
+
+        response = self.client.post(
+            self.order_bulk_url, self.order_payload(3), format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 0)
+
+    def test_bulk_update_orders_reserves_added_products(self):
+        orders = self.client.post(
+            self.order_bulk_url, self.order_payload(2), format="json"
+        ).data
+        Product.objects.filter(pk=self.products[0].pk).update(stock=0)
+        Product.objects.filter(pk=self.products[2].pk).update(stock=1)
+        data = [
+            {"id": orders[0]["id"], "products": [self.products[0].id]},
+            {
+                "id": orders[1]["id"],
+                "products": [self.products[0].id, self.products[2].id],
+            },
+        ]
+        response = self.client.patch(self.order_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.products[2].refresh_from_db()
+        self.assertEqual(self.products[2].stock, 0)
+
+    def test_bulk_create_orders_uses_constant_queries(self):
+        query_counts = []
+        # caches the user, which the first request would otherwise load
+        self.client.get(reverse("order-list"))
+        for count in (10, 100):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    self.order_bulk_url, self.order_payload(count), format="json"
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_bulk_update_order_products(self):
+        orders = self.client.post(
+            self.order_bulk_url, self.order_payload(2), format="json"
+        ).data
+        data = [
+            {"id": order["id"], "products": [self.products[2].id]} for order in orders
+        ]
+        response = self.client.patch(self.order_bulk_url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [order["products"] for order in response.data],
+            [[self.products[2].id], [self.products[2].id]],
+        )
+        self.assertEqual(
+            [(order["total_price"], order["item_count"]) for order in response.data],
+            [("1.99", 1), ("1.99", 1)],
+        )
+
+    def test_bulk_update_product_prices_updates_order_totals(self):
+        orders = self.client.post(
+            self.order_bulk_url, self.order_payload(2), format="json"
+        ).data
+        data = [{"id": self.products[0].id, "price": "9.99", "available": False}]
+        self.client.patch(self.product_bulk_url, data, format="json")
+        for order in Order.objects.filter(id__in=[order["id"] for order in orders]):
+            self.assertEqual(str(order.cached_total), "11.98")
+            self.assertFalse(order.is_fulfillable)
+
+
+class ProductCacheApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.product = Product.objects.create(
+            name="Temporary product", price=1.99, available=True
+        )
+        self.product_list_url = reverse("product-list")
+        self.product_detail_url = reverse(
+            "product-detail", kwargs={"pk": self.product.id}
+        )
+        self.product_bulk_url = reverse("product-bulk")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.admin))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_list_is_served_from_cache(self):
+        stats = product_cache.stats()
+        response = self.client.get(self.product_list_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get(self.product_list_url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["results"][0]["name"], "Temporary product")
+        self.assertEqual(product_cache.stats()["hits"], stats["hits"] + 1)
+        self.assertEqual(product_cache.stats()["misses"], stats["misses"] + 1)
+        response = APIClient().get(reverse("metrics"))
+        self.assertIn(
+            f'read_cache_hits_total{{cache="products"}} {stats["hits"] + 1}',
+            response.content.decode(),
+        )
+
+    def test_retrieve_is_served_from_cache(self):
+        self.client.get(self.product_detail_url)
+        response = self.client.get(self.product_detail_url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["name"], "Temporary product")
+
+    def test_search_is_cached_separately(self):
+        self.client.get(self.product_list_url)
+        response = self.client.get(self.product_list_url, {"search": "missing"})
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"], [])
+
+    def test_update_invalidates_cache(self):
+        self.client.get(self.product_detail_url)
+        self.client.patch(
+            self.product_detail_url, {"name": "Modified Product"}, format="json"
+        )
+        response = self.client.get(self.product_detail_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["name"], "Modified Product")
+
+    def test_delete_invalidates_cache(self):
+        self.client.get(self.product_list_url)
+        self.product.delete()
+        response = self.client.get(self.product_list_url)
+        self.assertEqual(response.data["results"], [])
+
+    def test_bulk_update_invalidates_cache(self):
+        self.client.get(self.product_list_url)
+        data = [{"id": self.product.id, "available": False}]
+        self.client.patch(self.product_bulk_url, data, format="json")
+        response = self.client.get(self.product_list_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertFalse(response.data["results"][0]["available"])
+
+    def test_staff_and_users_are_cached_separately(self):
+        params = {"offset": 0, "limit": 1}
+        response = self.client.get(self.product_list_url, params)
+        self.assertEqual(response.data["count"], 1)
+
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        response = self.client.get(self.product_list_url, params)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertNotIn("count", response.data)
+
+    def test_not_found_is_not_cached(self):
+        url = reverse("product-detail", kwargs={"pk": 0})
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("X-Cache", response)
+
+
+class ProductSearchApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.regular_user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        names = ["Blue shirt", "Shirt, blue", "Red T-shirt", "Socks", "Shirts pack"]
+        self.products = {
+            name: Product.objects.create(name=name, price=1.99, available=True)
+            for name in names
+        }
+        self.product_list_url = reverse("product-list")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.regular_user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def search(self, term, **params):
+        response = self.client.get(self.product_list_url, {"search": term, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_search_matches_substrings_in_id_order(self):
+        response = self.search("shirt")
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            sorted(
+                product.id
+                for name, product in self.products.items()
+                if "shirt" in name.lower()
+            ),
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "needs pg_trgm")
+    def test_search_ranks_prefix_matches_first(self):
+        response = self.search("shirt", rank="true")
+        names = [product["name"] for product in response.data["results"]]
+        self.assertCountEqual(
+            names, ["Blue shirt", "Shirt, blue", "Red T-shirt", "Shirts pack"]
+        )
+        self.assertCountEqual(names[:2], ["Shirt, blue", "Shirts pack"])
+        self.assertEqual(names[2], "Blue shirt")
+
+    def test_search_ranked_results_are_paginated(self):
+        url = f"{self.product_list_url}?search=shirt&rank=true&page_size=1"
+        names = []
+        while url:
+            response = self.client.get(url)
+            names.extend(product["name"] for product in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(
+            names,
+            [
+                product["name"]
+                for product in self.search("shirt", rank="true").data["results"]
+            ],
+        )
+
+    def test_search_with_multiple_terms(self):
+        response = self.search("blue shirt")
+        names = [product["name"] for product in response.data["results"]]
+        self.assertCountEqual(names, ["Blue shirt", "Shirt, blue"])
+
+    def test_search_without_ranking_support(self):
+        with mock.patch.object(
+            RankedSearchFilter, "supports_ranking", return_value=False
+        ):
+            response = self.search("shirt", rank="true")
+        self.assertEqual(
+            [product["id"] for product in response.data["results"]],
+            sorted(
+                product.id
+                for name, product in self.products.items()
+                if "shirt" in name.lower()
+            ),
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "needs pg_trgm")
+    def test_search_query_can_use_trigram_index(self):
+        queryset = Product.objects.filter(name__icontains="shirt")
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+        self.assertIn("product_name_trgm_idx", plan)
+
+
+class ConditionalGetApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        self.product1 = Product.objects.create(
+            name="Temporary product 1", price=1.99, available=True
+        )
+        self.product2 = Product.objects.create(
+            name="Temporary product 2", price=2.99, available=True
+        )
+        self.order = Order.objects.create(
+            customer=self.customer, date="2025-01-01", status="New"
+        )
+        self.order.products.set([self.product1])
+        self.order_detail_url = reverse("order-detail", kwargs={"pk": self.order.id})
+        self.customer_list_url = reverse("customer-list")
+        self.product_list_url = reverse("product-list")
+        self.product_bulk_url = reverse("product-bulk")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.admin))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_detail_not_modified_skips_serialization(self):
+        response = self.client.get(self.order_detail_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+
+        with mock.patch.object(OrderSerializer, "to_representation") as serialize:
+            not_modified = self.client.get(
+                self.order_detail_url, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+        serialize.assert_not_called()
+
+    def test_detail_if_modified_since(self):
+        response = self.client.get(self.order_detail_url)
+        not_modified = self.client.get(
+            self.order_detail_url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_etag_changes_with_order_products(self):
+        etag = self.client.get(self.order_detail_url)["ETag"]
+        self.order.products.add(self.product2)
+        response = self.client.get(self.order_detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_expanded_detail_etag_changes_with_related_rows(self):
+        params = {"expand": "products"}
+        etag = self.client.get(self.order_detail_url, params)["ETag"]
+        self.assertNotEqual(etag, self.client.get(self.order_detail_url)["ETag"])
+        Product.objects.filter(pk=self.product1.pk).update(
+            updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        response = self.client.get(
+            self.order_detail_url, params, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_collection_etag_changes_on_create_and_delete(self):
+        etag = self.client.get(self.customer_list_url)["ETag"]
+        not_modified = self.client.get(self.customer_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        customer = Customer.objects.create(name="Other customer", address="Street")
+        created_etag = self.client.get(self.customer_list_url)["ETag"]
+        self.assertNotEqual(created_etag, etag)
+
+        customer.delete()
+        response = self.client.get(
+            self.customer_list_url, HTTP_IF_NONE_MATCH=created_etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Last-Modified", response)
+
+    def test_product_collection_etag_changes_on_bulk_update(self):
+        etag = self.client.get(self.product_list_url)["ETag"]
+        # validated from the cache version
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                self.product_list_url, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        updated_at = self.product1.updated_at
+        data = [{"id": self.product1.id, "available": False}]
+        self.client.patch(self.product_bulk_url, data, format="json")
+        response = self.client.get(self.product_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.product1.refresh_from_db()
+        self.assertGreater(self.product1.updated_at, updated_at)
+
+
+class AuthenticationApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.url = reverse("product-list")
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query for query in queries if "auth_user" in query["sql"]]
+
+    def test_user_is_loaded_once(self):
+        self.assertEqual(len(self.user_queries(self.url)), 1)
+        self.assertEqual(self.user_queries(self.url), [])
+
+    def test_saved_user_is_reloaded(self):
+        self.client.get(self.url)
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.post(self.url, {"name": "Product", "price": 1.99})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_only_authentication_fields_are_cached(self):
+        self.client.get(self.url)
+        entry = cache.get(user_cache.make_key(self.user.id))
+        self.assertNotIn(self.user.password, repr(entry))
+
+        user = user_cache.get(self.user.id)
+        self.assertEqual((user.pk, user.is_staff), (self.user.pk, True))
+        self.assertIn("password", user.get_deferred_fields())
+
+    @mock.patch.object(jwt_settings, "CHECK_REVOKE_TOKEN", True)
+    def test_changed_password_revokes_cached_user(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.client.get(self.url)
+        # The revocation check needs no password from the database.
+        self.assertEqual(self.user_queries(self.url), [])
+        User.objects.filter(pk=self.user.pk).update(password="changed")
+        user_cache.set(self.user.id, User.objects.get(pk=self.user.pk))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(API_USER_CACHE_TIMEOUT=0)
+    def test_user_cache_can_be_turned_off(self):
+        self.assertEqual(len(self.user_queries(self.url)), 1)
+        self.assertEqual(len(self.user_queries(self.url)), 1)
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get(self.url)
+        self.user.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RendererApiTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        customer = Customer.objects.create(
+            name="Klient \u2028 Łódź", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        product = Product.objects.create(name="Product", price=1.99, available=True)
+        order = Order.objects.create(customer=customer, date="2025-01-01")
+        order.products.set([product])
+        self.order_list_url = reverse("order-list")
+        self.product_list_url = reverse("product-list")
+        self.client = APIClient()
+        token = str(AccessToken.for_user(self.admin))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_orjson_matches_json_renderer(self):
+        data = self.client.get(
+            self.order_list_url, {"expand": "customer,products"}
+        ).data
+        data["extra"] = {
+            "price": Decimal("1.10"),
+            "date": date(2025, 1, 1),
+            "updated_at": timezone.now(),
+            1: "non-string key",
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_as_msgpack(self):
+        json_response = self.client.get(self.order_list_url, {"expand": "customer"})
+        response = self.client.get(
+            self.order_list_url,
+            {"expand": "customer"},
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), json_response.json())
+        self.assertNotEqual(response["ETag"], json_response["ETag"])
+
+    def test_create_from_msgpack(self):
+        response = self.client.post(
+            self.product_list_url,
+            msgpack.packb({"name": "Packed product", "price": "2.50"}),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(msgpack.unpackb(response.content)["price"], "2.50")
+
+    def test_malformed_bodies_are_rejected(self):
+        for content_type, body in (
+            ("application/msgpack", b"\x92\x01"),
+            ("application/json", b'{"name": '),
+        ):
+            with self.subTest(content_type=content_type):
+                response = self.client.post(
+                    self.product_list_url, body, content_type=content_type
+                )
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ValuesSerializerTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        customers = [
+            Customer.objects.create(name=f"Customer {i}", address=f"Street {i}")
+            for i in range(2)
+        ]
+        products = [
+            Product.objects.create(
+                name=f"Product {i}", price=Decimal("10.50") * i + 1, available=i % 2
+            )
+            for i in range(4)
+        ]
+        for i, status_value in enumerate(["New", "Sent", "Completed"]):
+            order = Order.objects.create(
+                customer=customers[i % 2], date=f"2025-01-0{i + 1}", status=status_value
+            )
+            order.products.set(products[i:][::-1])
+        Order.objects.create(customer=customers[0], date="2025-01-04", status="New")
+        self.client = APIClient()
+        token = str(AccessToken.for_user(self.admin))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_output_is_identical_to_model_serializer(self):
+        orders = Order.objects.select_related("customer").prefetch_related(
+            Prefetch("products", queryset=Product.objects.order_by("id"))
+        )
+        cases = (
+            (ProductSerializer(), Product.objects.all()),
+            (CustomerSerializer(), Customer.objects.all()),
+            (OrderSerializer(), orders),
+            (OrderSerializer(context={"expand": ["customer"]}), orders),
+            (OrderSerializer(context={"expand": ["customer", "products"]}), orders),
+        )
+        renderer = ORJSONRenderer()
+        for serializer, queryset in cases:
+            with self.subTest(serializer=type(serializer).__name__):
+                queryset = queryset.order_by("id")
+                expected = type(serializer)(
+                    queryset, many=True, context=serializer.context
+                ).data
+                values_serializer = ValuesSerializer(serializer)
+                with self.assertNumQueries(1 + len(values_serializer.relations)):
+                    data = values_serializer.to_representation(
+                        values_serializer.values(queryset)
+                    )
+                self.assertEqual(renderer.render(data), renderer.render(expected))
+
+    def test_list_pages_over_values_rows(self):
+        url = reverse("order-list")
+        params = {"expand": "customer,products", "ordering": "-total_price"}
+        response = self.client.get(url, {**params, "page_size": 2})
+        results = response.data["results"]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            results += response.data["results"]
+        self.assertEqual(
+            results, self.client.get(url, {**params, "page_size": 10}).data["results"]
+        )
+        self.assertEqual(len(results), 4)
+        for order in results:
+            detail = self.client.get(
+                reverse("order-detail", args=[order["id"]]), params
+            )
+            self.assertEqual(order, detail.data)
+
+    def test_unsupported_fields_are_rejected(self):
+        class ProductWithMethodSerializer(ProductSerializer):
+            label = serializers.SerializerMethodField()
+
+        with self.assertRaises(TypeError):
+            ValuesSerializer(ProductWithMethodSerializer())
+
+
+class SparseFieldsetApiTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        self.product = Product.objects.create(
+            name="Product", price=1.99, available=True
+        )
+        self.orders = []
+        for date in ["2025-01-02", "2025-01-01", "2025-01-03"]:
+            order = Order.objects.create(customer=customer, date=date, status="New")
+            order.products.set([self.product])
+            self.orders.append(order)
+        self.client = APIClient()
+        token = str(AccessToken.for_user(self.admin))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The first request also loads the user.
+        return response, [
+            query["sql"] for query in queries if "auth_user" not in query["sql"]
+        ]
+
+    def test_product_list_selects_only_requested_columns(self):
+        response, queries = self.get(
+            reverse("product-list"), {"fields": "id,name,price"}
+        )
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": self.product.id, "name": "Product", "price": "1.99"}],
+        )
+        self.assertNotIn('"available"', queries[-1])
+
+    def test_order_list_without_products_skips_prefetch(self):
+        for params in ({"fields": "id,status"}, {"omit": "products,customer"}):
+            with self.subTest(params=params):
+                response, queries = self.get(
+                    reverse("order-list"), {**params, "page_size": 2}
+                )
+                results = response.json()["results"]
+                while response.json()["next"]:
+                    response, next_queries = self.get(response.json()["next"])
+                    results += response.json()["results"]
+                    queries += next_queries
+                self.assertFalse(any("myapp_order_products" in sql for sql in queries))
+                self.assertEqual(
+                    [order["id"] for order in results],
+                    [self.orders[1].id, self.orders[0].id, self.orders[2].id],
+                )
+                self.assertNotIn("products", results[0])
+                self.assertNotIn("customer", results[0])
+
+    def test_retrieve_loads_only_requested_columns(self):
+        url = reverse("order-detail", args=[self.orders[0].id])
+        response, queries = self.get(url, {"fields": "id,status"})
+        self.assertEqual(response.json(), {"id": self.orders[0].id, "status": "New"})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"cached_total"', queries[0])
+
+        response, queries = self.get(
+            url, {"fields": "id,customer", "expand": "customer,products"}
+        )
+        self.assertEqual(list(response.json()), ["id", "customer"])
+        self.assertEqual(response.json()["customer"]["name"], "Temporary customer")
+        self.assertEqual(len(queries), 1)
+
+    def test_export_selects_fields(self):
+        response = self.client.get(
+            reverse("order-export"), {"fields": "id,status", "format": "csv"}
+        )
+        rows = list(
+            csv.reader(b"".join(response.streaming_content).decode().splitlines())
+        )
+        self.assertEqual(rows[0], ["id", "status"])
+        self.assertEqual(len(rows), 4)
+
+
+class ReportApiTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.client.force_authenticate(self.user)
+        self.alice = Customer.objects.create(name="Alice", address="Address 1")
+        self.bob = Customer.objects.create(name="Bob", address="Address 2")
+        self.pen = Product.objects.create(name="Pen", price="2.00", available=True)
+        self.book = Product.objects.create(name="Book", price="10.00", available=True)
+        self.first = self.create_order(self.alice, "2025-01-01", "New", self.pen)
+        self.second = self.create_order(
+            self.alice, "2025-01-01", "Sent", self.pen, self.book
+        )
+        self.third = self.create_order(self.bob, "2025-01-02", "New", self.book)
+
+    def create_order(self, customer, date, status, *products):
+        order = Order.objects.create(customer=customer, date=date, status=status)
+        order.products.set(products)
+        return order
+
+    def get_results(self, name, query=""):
+        response = self.client.get(f"{reverse(f'report-{name}')}{query}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)["results"]
+
+    def test_reports(self):
+        call_command("refresh_reports", stdout=StringIO())
+
+        self.assertEqual(
+            self.get_results("daily"),
+            [
+                {
+                    "date": "2025-01-01",
+                    "order_count": 2,
+                    "item_count": 3,
+                    "revenue": "14.00",
+                },
+                {
+                    "date": "2025-01-02",
+                    "order_count": 1,
+                    "item_count": 1,
+                    "revenue": "10.00",
+                },
+            ],
+        )
+        self.assertEqual(
+            [row["revenue"] for row in self.get_results("daily", "?status=New")],
+            ["2.00", "10.00"],
+        )
+        self.assertEqual(
+            self.get_results("statuses", "?date_before=2025-01-01"),
+            [
+                {"status": "New", "order_count": 1, "item_count": 1, "revenue": "2.00"},
+                {
+                    "status": "Sent",
+                    "order_count": 1,
+                    "item_count": 2,
+                    "revenue": "12.00",
+                },
+            ],
+        )
+        self.assertEqual(
+            self.get_results("customers"),
+            [
+                {
+                    "customer": self.alice.id,
+                    "name": "Alice",
+                    "order_count": 2,
+                    "revenue": "14.00",
+                },
+                {
+                    "customer": self.bob.id,
+                    "name": "Bob",
+                    "order_count": 1,
+                    "revenue": "10.00",
+                },
+            ],
+        )
+        self.assertEqual(
+            self.get_results("products", "?limit=1"),
+            [
+                {
+                    "product": self.book.id,
+                    "name": "Book",
+                    "order_count": 2,
+                    "revenue": "20.00",
+                }
+            ],
+        )
+        self.assertEqual(
+            self.get_results("products", "?date_after=2025-01-02"),
+            [
+                {
+                    "product": self.book.id,
+                    "name": "Book",
+                    "order_count": 1,
+                    "revenue": "10.00",
+                }
+            ],
+        )
+
+    def test_refresh_rebuilds_changed_days_only(self):
+        first_day, second_day = date(2025, 1, 1), date(2025, 1, 2)
+        self.assertEqual(refresh_reports(), [first_day, second_day])
+        self.assertEqual(refresh_reports(), [])
+
+        self.third.transition("In Process")
+        self.assertEqual(refresh_reports(), [second_day])
+        self.assertEqual(
+            self.get_results("statuses", "?date_after=2025-01-02")[0]["status"],
+            "In Process",
+        )
+
+        self.book.price = "20.00"
+        self.book.save()
+        self.assertEqual(refresh_reports(), [first_day, second_day])
+        self.assertEqual(self.get_results("products")[0]["revenue"], "40.00")
+
+        self.first.date = "2025-01-03"
+        self.first.save()
+        self.assertEqual(refresh_reports(), [first_day, second_day + timedelta(days=1)])
+        self.second.delete()
+        self.assertEqual(refresh_reports(), [first_day])
+        self.assertEqual(
+            [row["date"] for row in self.get_results("daily")],
+            ["2025-01-02", "2025-01-03"],
+        )
+
+    def test_refresh_reads_only_recently_written_orders(self):
+        refresh_reports()
+        self.third.transition("In Process")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(refresh_reports(), [date(2025, 1, 2)])
+        order_table = connection.ops.quote_name(Order._meta.db_table)
+        reads = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith("SELECT")
+            and f"FROM {order_table}" in query["sql"]
+        ]
+        self.assertTrue(reads)
+        for sql in reads:
+            self.assertIn("WHERE", sql)
+
+    def test_refresh_drops_cascade_deleted_orders(self):
+        refresh_reports()
+        self.bob.delete()
+        self.assertEqual(refresh_reports(), [date(2025, 1, 2)])
+        self.assertEqual(
+            [row["date"] for row in self.get_results("daily")], ["2025-01-01"]
+        )
+
+    def test_refresh_follows_bulk_moved_orders(self):
+        refresh_reports()
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.patch(
+            reverse("order-bulk"),
+            [{"id": self.third.id, "date": "2025-01-01"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(refresh_reports(), [date(2025, 1, 1), date(2025, 1, 2)])
+        self.assertEqual([row["order_count"] for row in self.get_results("daily")], [3])
+
+    def test_refresh_full_matches_incremental(self):
+        refresh_reports()
+        self.third.transition("In Process")
+        self.first.delete()
+        refresh_reports()
+        incremental = [self.get_results(name) for name in ("daily", "products")]
+        refresh_reports(full=True)
+        self.assertEqual(
+            [self.get_results(name) for name in ("daily", "products")], incremental
+        )
+
+    def test_report_validation_and_permissions(self):
+        response = self.client.get(reverse("report-products"), {"limit": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("report-daily"), {"status": "Lost"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse("report-list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class JobApiTest(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        settings_override = override_settings(JOB_RESULT_DIR=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(self.directory.cleanup)
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.client.force_authenticate(self.admin)
+        self.customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        self.product = Product.objects.create(
+            name="Temporary product", price="1.99", available=True
+        )
+        self.order = Order.objects.create(
+            customer=self.customer, date="2025-01-01", status="New"
+        )
+        self.order.products.set([self.product])
+
+    def run_next_job(self):
+        job = claim_job()
+        self.assertIsNotNone(job)
+        return run_job(job)
+
+    def test_deferred_transition(self):
+        response = self.client.post(
+            f"{reverse('order-transition')}?customer={self.customer.id}",
+            {"status": "In Process"},
+            format="json",
+            HTTP_PREFER="respond-async",
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response["Preference-Applied"], "respond-async")
+        self.assertIn("Prefer", response["Vary"])
+        self.assertEqual(response["Location"], response.data["url"])
+        self.assertEqual(response.data["status"], "queued")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "New")
+
+        self.run_next_job()
+        self.assertIsNone(claim_job())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "In Process")
+
+        response = self.client.get(response["Location"])
+        self.assertEqual(response.data["status"], "succeeded")
+        self.assertEqual(response.data["status_code"], 200)
+        self.assertEqual(response.data["result"]["transitioned"], 1)
+        self.assertEqual(response.data["attempts"], 1)
+
+    def test_synchronous_request_without_preference(self):
+        response = self.client.post(
+            reverse("order-transition"),
+            {"status": "In Process", "ids": [self.order.id]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("Prefer", response["Vary"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_deferred_export_download(self):
+        response = self.client.get(
+            reverse("order-export"),
+            {"format": "csv", "fields": "id,status"},
+            HTTP_PREFER="respond-async",
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(response.content)["status"], "queued")
+        self.assertNotIn("format=", response["Location"])
+        self.run_next_job()
+
+        job = self.client.get(response["Location"]).data
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["result"]["filename"], "orders.csv")
+        response = self.client.get(job["download"], HTTP_ACCEPT="text/csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("orders.csv", response["Content-Disposition"])
+        self.assertEqual(
+            b"".join(response.streaming_content).decode().splitlines(),
+            ["id,status", f"{self.order.id},New"],
+        )
+
+    def test_expired_jobs_are_deleted_with_their_files(self):
+        for _ in range(2):
+            self.client.get(
+                reverse("order-export"),
+                {"format": "ndjson"},
+                HTTP_PREFER="respond-async",
+            )
+            self.run_next_job()
+        old, recent = Job.objects.order_by("pk")
+        Job.objects.filter(pk=old.pk).update(
+            finished_at=timezone.now() - timedelta(seconds=settings.JOB_RESULT_TTL + 1)
+        )
+        queued = Job.objects.create(user=self.admin, request={})
+        old_path = os.path.join(self.directory.name, old.result_file)
+        self.assertTrue(os.path.exists(old_path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_jobs(), 1)
+        self.assertQuerySetEqual(Job.objects.order_by("pk"), [recent, queued])
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory.name, recent.result_file))
+        )
+
+        # Deleting the user takes its jobs and their files along.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.delete()
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_deferred_bulk_create_with_invalid_data_fails(self):
+        data = [
+            {
+                "customer": self.customer.id,
+                "products": [self.product.id],
+                "date": "2025-02-01",
+                "status": "New",
+            },
+            {"customer": self.customer.id, "date": "tomorrow", "status": "New"},
+        ]
+        response = self.client.post(
+            reverse("order-bulk"), data, format="json", HTTP_PREFER="respond-async"
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = self.run_next_job()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.status_code, 400)
+        self.assertIn("date", job.result[1])
+        self.assertEqual(Order.objects.count(), 1)
+
+        data.pop()
+        self.client.post(
+            reverse("order-bulk"), data, format="json", HTTP_PREFER="respond-async"
+        )
+        job = self.run_next_job()
+        self.assertEqual(job.status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_job_runs_with_current_permissions(self):
+        response = self.client.post(
+            reverse("order-transition"),
+            {"status": "In Process", "ids": [self.order.id]},
+            format="json",
+            HTTP_PREFER="respond-async",
+        )
+        User.objects.filter(pk=self.admin.pk).update(is_staff=False)
+        job = self.run_next_job()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.status_code, 403)
+
+        regular_user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.client.force_authenticate(regular_user)
+        response = self.client.get(response["Location"])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(JOB_LEASE_SECONDS=60, JOB_MAX_ATTEMPTS=2)
+    def test_claim_retries_jobs_with_expired_lease(self):
+        job = Job.objects.create(
+            user=self.admin,
+            request={
+                "method": "GET",
+                "path": reverse("order-list"),
+                "query_string": "",
+                "host": "testserver",
+                "scheme": "http",
+                "accept": "",
+            },
+        )
+        self.assertEqual(claim_job(), job)
+        self.assertIsNone(claim_job())
+
+        Job.objects.update(started_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(claim_job().attempts, 2)
+        Job.objects.update(started_at=timezone.now() - timedelta(minutes=2))
+        self.assertIsNone(claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+
+
+@skipUnless(connection.vendor == "postgresql", "needs concurrent row locking")
+class OrderCheckoutStressTest(TransactionTestCase):
+    threads = 8
+    orders_per_thread = 6
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        self.scarce = Product.objects.create(
+            name="Scarce product", price="1.99", available=True, stock=10
+        )
+        self.limited = Product.objects.create(
+            name="Limited product", price="2.99", available=True, stock=40
+        )
+        self.untracked = Product.objects.create(
+            name="Untracked product", price="3.99", available=True
+        )
+
+    def place_orders(self, products, barrier, statuses):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        data = {
+            "customer": self.customer.id,
+            "products": [product.id for product in products],
+            "date": "2025-01-01",
+            "status": "New",
+        }
+        try:
+            barrier.wait()
+            for _ in range(self.orders_per_thread):
+                response = client.post(reverse("order-list"), data, format="json")
+                statuses.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_concurrent_checkouts_never_oversell(self):
+        # Half the threads name the products in the opposite order, which
+        # would deadlock without ordered locking.
+        orders = (self.scarce, self.limited, self.untracked)
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+        threads = [
+            threading.Thread(
+                target=self.place_orders,
+                args=(orders if i % 2 else orders[::-1], barrier, statuses),
+            )
+            for i in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        attempts = self.threads * self.orders_per_thread
+        self.assertEqual(statuses.count(status.HTTP_201_CREATED), 10)
+        self.assertEqual(statuses.count(status.HTTP_400_BAD_REQUEST), attempts - 10)
+        self.scarce.refresh_from_db()
+        self.limited.refresh_from_db()
+        self.assertEqual(self.scarce.stock, 0)
+        self.assertEqual(self.limited.stock, 30)
+        self.assertEqual(Order.objects.filter(products=self.scarce).count(), 10)
+        self.assertEqual(Order.objects.filter(products=self.untracked).count(), 10)
+
+
+class RunWorkersCommandTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.jobs = [
+            Job.objects.create(
+                user=self.user,
+                request={
+                    "method": "GET",
+                    "path": reverse("order-list"),
+                    "query_string": "",
+                    "host": "testserver",
+                    "scheme": "http",
+                    "accept": "",
+                },
+            )
+            for _ in range(3)
+        ]
+
+    @skipUnless(connection.vendor == "postgresql", "uses SKIP LOCKED")
+    def test_claim_skips_locked_jobs(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def lock_first_job():
+            with transaction.atomic():
+                Job.objects.select_for_update().get(pk=self.jobs[0].pk)
+                locked.set()
+                release.wait(5)
+            connection.close()
+
+        thread = threading.Thread(target=lock_first_job)
+        thread.start()
+        try:
+            locked.wait(5)
+            self.assertEqual(claim_job(), self.jobs[1])
+        finally:
+            release.set()
+            thread.join()
+
+    def test_run_workers_burst(self):
+        output = StringIO()
+        call_command("run_workers", "--burst", processes=1, stdout=output)
+        self.assertIn("Ran 3 jobs.", output.getvalue())
+        self.assertEqual(
+            list(Job.objects.values_list("status", "status_code").distinct()),
+            [("succeeded", 200)],
+        )
+
+    @skipUnless(
+        connection.vendor == "postgresql", "forks workers onto the test database"
+    )
+    def test_sigterm_stops_forked_workers(self):
+        # What docker stop sends to the command, running as PID 1.
+        stop = threading.Timer(1, os.kill, (os.getpid(), signal.SIGTERM))
+        # Fails the test instead of hanging it if the workers keep running.
+        watchdog = threading.Timer(
+            30, lambda: [child.kill() for child in multiprocessing.active_children()]
+        )
+        stop.start()
+        watchdog.start()
+        output = StringIO()
+        try:
+            call_command("run_workers", processes=2, poll_interval=0.05, stdout=output)
+        finally:
+            stop.cancel()
+            watchdog.cancel()
+        self.assertIn("Ran 3 jobs.", output.getvalue())
+        self.assertEqual(multiprocessing.active_children(), [])
+
+
+class ThrottlingApiTest(APITestCase):
+    rates = {
+        "anon": "2/min",
+        "read": "3/min",
+        "write": "2/min",
+        "order.export": "1/min",
+    }
+
+    def setUp(self):
+        settings_override = override_settings(
+            REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK,
+                "DEFAULT_THROTTLE_RATES": self.rates,
+            }
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_store.cache_clear()
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.client.force_authenticate(self.admin)
+        self.order_list_url = reverse("order-list")
+
+    def test_burst_then_throttled(self):
+        for remaining in (2, 1, 0):
+            response = self.client.get(self.order_list_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response["RateLimit-Limit"], "3")
+            self.assertEqual(response["RateLimit-Remaining"], str(remaining))
+        response = self.client.get(self.order_list_url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "20")
+        self.assertEqual(response["RateLimit-Remaining"], "0")
+        self.assertEqual(response["RateLimit-Reset"], "60")
+
+    def test_bucket_refills(self):
+        with mock.patch("myapp.throttling.time.time", return_value=1000.0):
+            for _ in range(3):
+                self.client.get(self.order_list_url)
+            response = self.client.get(self.order_list_url)
+            self.assertEqual(response.status_code, 429)
+        with mock.patch("myapp.throttling.time.time", return_value=1020.0):
+            self.assertEqual(self.client.get(self.order_list_url).status_code, 200)
+            self.assertEqual(self.client.get(self.order_list_url).status_code, 429)
+
+    def test_budgets_are_per_user_action_and_method(self):
+        for _ in range(3):
+            self.client.get(self.order_list_url)
+        self.assertEqual(self.client.get(self.order_list_url).status_code, 429)
+        self.assertEqual(self.client.get(reverse("product-list")).status_code, 200)
+
+        response = self.client.post(
+            reverse("order-transition"), {"status": "Sent", "ids": [1]}, format="json"
+        )
+        self.assertEqual(response["RateLimit-Limit"], "2")
+        response = self.client.get(reverse("order-export"), {"format": "csv"})
+        self.assertEqual(response["RateLimit-Limit"], "1")
+
+        other = User.objects.create_user(username="other", password="testpassword")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.order_list_url).status_code, 200)
+
+    def test_anonymous_clients_are_throttled_by_address(self):
+        self.client.force_authenticate(None)
+        url = reverse("token_obtain_pair")
+        credentials = {"username": "testadmin", "password": "wrong"}
+        for _ in range(2):
+            response = self.client.post(url, credentials, format="json")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(url, credentials, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(url, credentials, format="json")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(API_THROTTLE_STORE="myapp.throttling.CacheBucketStore")
+    def test_cache_store(self):
+        cache.clear()
+        for _ in range(3):
+            self.client.get(self.order_list_url)
+        self.assertEqual(self.client.get(self.order_list_url).status_code, 429)
+        # A new process starts with the shared buckets.
+        get_store.cache_clear()
+        self.assertEqual(self.client.get(self.order_list_url).status_code, 429)
+
+
+class CompressionApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=1.99, available=True)
+            for i in range(30)
+        ]
+        self.product_list_url = reverse("product-list")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.admin))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_brotli_preferred(self):
+        plain = self.client.get(self.product_list_url)
+        self.assertNotIn("Content-Encoding", plain)
+        response = self.client.get(
+            self.product_list_url, HTTP_ACCEPT_ENCODING="gzip, deflate, br"
+        )
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_gzip_fallback(self):
+        response = self.client.get(self.product_list_url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            len(json.loads(gzip.decompress(response.content))["results"]), 30
+        )
+
+        with mock.patch("myapp.middleware.brotli", None):
+            response = self.client.get(
+                self.product_list_url, HTTP_ACCEPT_ENCODING="br, gzip"
+            )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    @override_settings(API_COMPRESSION_MIN_SIZE=100000)
+    def test_small_responses_uncompressed(self):
+        response = self.client.get(
+            self.product_list_url, HTTP_ACCEPT_ENCODING="br, gzip"
+        )
+        self.assertNotIn("Content-Encoding", response)
+
+    def test_etag_weakened_and_still_matches(self):
+        response = self.client.get(self.product_list_url, HTTP_ACCEPT_ENCODING="br")
+        self.assertTrue(response["ETag"].startswith('W/"'))
+        not_modified = self.client.get(
+            self.product_list_url,
+            HTTP_ACCEPT_ENCODING="br",
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_streamed_export(self):
+        url = reverse("product-export")
+        plain = b"".join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertNotIn("Content-Length", response)
+        content = brotli.decompress(b"".join(response.streaming_content))
+        self.assertEqual(content, plain)
+
+
+class MetricsApiTest(APITestCase):
+    def setUp(self):
+        registry.clear()
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+        self.customer = Customer.objects.create(
+            name="Temporary customer", address="Swidnicka 2, 50-345 Wroclaw"
+        )
+        self.order_list_url = reverse("order-list")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.admin))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def get_metrics(self):
+        response = APIClient().get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode()
+
+    def test_metrics_are_recorded_per_view_and_action(self):
+        self.client.get(self.order_list_url)
+        self.client.get(self.order_list_url)
+        self.client.get(reverse("customer-detail", args=[self.customer.id]))
+
+        metrics = self.get_metrics()
+        labels = 'view="OrderViewSet",action="list"'
+        self.assertIn(f"api_request_duration_seconds_count{{{labels}}} 2", metrics)
+        self.assertIn(f'api_request_queries_bucket{{{labels},le="5"}} 2', metrics)
+        self.assertIn(
+            f"api_request_render_duration_seconds_count{{{labels}}} 2", metrics
+        )
+        self.assertIn(
+            f"api_request_serialize_duration_seconds_count{{{labels}}} 2", metrics
+        )
+        self.assertIn(f'api_requests_total{{{labels},status="200"}} 2', metrics)
+        self.assertIn(
+            'api_requests_total{view="CustomerViewSet",action="retrieve",status="200"} 1',
+            metrics,
+        )
+        self.assertIn("# TYPE api_request_db_duration_seconds histogram", metrics)
+
+    def test_metrics_are_added_up_across_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        worker_registry = Registry()
+        jobs = worker_registry.register(Counter("jobs_total", "Jobs.", labelnames=()))
+        shared = SharedDirectory(worker_registry, directory.name)
+        jobs.inc(2)
+        shared.write()
+
+        def record():
+            jobs.inc(5)
+            shared.write()
+
+        worker = multiprocessing.get_context("fork").Process(target=record)
+        worker.start()
+        worker.join()
+        jobs.inc()
+        self.assertIn("jobs_total{} 8", worker_registry.render(shared.collect()))
+        # The exited worker's totals outlive its file.
+        self.assertIn("exited.json", os.listdir(directory.name))
+        self.assertEqual(len(glob.glob(os.path.join(directory.name, "*.lock"))), 2)
+        self.assertIn("jobs_total{} 8", worker_registry.render(shared.collect()))
+
+    def test_metrics_directory_is_written_per_request(self):
+        with tempfile.TemporaryDirectory() as path, self.settings(API_METRICS_DIR=path):
+            self.client.get(self.order_list_url)
+            self.assertEqual(len(glob.glob(os.path.join(path, "*.json"))), 1)
+            self.assertIn(
+                'api_requests_total{view="OrderViewSet",action="list",status="200"} 1',
+                self.get_metrics(),
+            )
+
+    def test_nested_serialization_is_timed_once(self):
+        @timed_serialization
+        def serialize(depth):
+            return serialize(depth - 1) if depth else "done"
+
+        timer = SerializeTimer()
+        token = current_serialize_timer.set(timer)
+        try:
+            with mock.patch("myapp.metrics.time.perf_counter", side_effect=[1, 1.5]):
+                self.assertEqual(serialize(3), "done")
+        finally:
+            current_serialize_timer.reset(token)
+        self.assertEqual(timer.duration, 0.5)
+        self.assertFalse(timer.running)
+
+    def test_streamed_exports_are_recorded_once_sent(self):
+        Order.objects.create(customer=self.customer, date="2025-01-01")
+        response = self.client.get(reverse("order-export"))
+        labels = 'view="OrderViewSet",action="export"'
+        self.assertNotIn(labels, self.get_metrics())
+
+        b"".join(response.streaming_content)
+        metrics = self.get_metrics()
+        self.assertIn(f'api_requests_total{{{labels},status="200"}} 1', metrics)
+        self.assertNotIn(f'api_request_queries_bucket{{{labels},le="0"}} 1', metrics)
+        self.assertIn(
+            f"api_request_serialize_duration_seconds_count{{{labels}}} 1", metrics
+        )
+
+    def test_metrics_are_limited_to_allowed_addresses(self):
+        url = reverse("metrics")
+        response = APIClient().get(url, REMOTE_ADDR="203.0.113.7")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with self.settings(API_METRICS_ALLOWED_IPS=["203.0.113.7"]):
+            response = APIClient().get(url, REMOTE_ADDR="203.0.113.7")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(API_METRICS_TOKEN="scrape-secret")
+    def test_metrics_accept_the_scrape_token(self):
+        url = reverse("metrics")
+        response = APIClient().get(
+            url, REMOTE_ADDR="203.0.113.7", HTTP_AUTHORIZATION="Bearer scrape-secret"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = APIClient().get(
+            url, REMOTE_ADDR="203.0.113.7", HTTP_AUTHORIZATION="Bearer wrong"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(API_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        client.get(self.order_list_url)
+        self.assertNotIn("OrderViewSet", self.get_metrics())
+
+    @override_settings(API_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        with self.assertLogs("myapp.middleware", "WARNING") as logs:
+            client.get(self.order_list_url)
+        self.assertIn("GET /api/orders/ -> 200 (OrderViewSet.list)", logs.output[0])
+
+    def test_query_recorder_fingerprints_duplicates(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for product in Product.objects.bulk_create(
+                Product(name=f"Product {i}", price=1.99) for i in range(3)
+            ):
+                Order.objects.filter(products=product).count()
+            list(Product.objects.filter(id__in=[1, 2]))
+            list(Product.objects.filter(id__in=[1, 2, 3]))
+        self.assertEqual(recorder.count, 6)
+        self.assertEqual(recorder.duplicates, 3)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRoutingTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory(HTTP_AUTHORIZATION="Bearer token")
+        self.view = ProductViewSet.as_view({"get": "list", "post": "create"})
+        self.routes = []
+
+    def dispatch(self, request, write=False):
+        def get_response(request):
+            middleware.process_view(request, self.view, (), {})
+            self.routes.append(router.db_for_read(Product))
+            if write:
+                router.db_for_write(Product)
+                self.routes.append(router.db_for_read(Product))
+            self.routes.append(router.db_for_read(User))
+            return None
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        middleware(request)
+
+    def test_safe_requests_read_from_replica(self):
+        self.dispatch(self.factory.get("/api/products/"))
+        self.assertEqual(self.routes, ["replica_1", "default"])
+
+    def test_reads_after_write_go_to_primary(self):
+        self.dispatch(self.factory.get("/api/products/"), write=True)
+        self.assertEqual(self.routes, ["replica_1", "default", "default"])
+
+    def test_session_sticks_to_primary_after_write(self):
+        self.dispatch(self.factory.post("/api/products/"), write=True)
+        self.dispatch(self.factory.get("/api/products/"))
+        self.dispatch(
+            self.factory.get("/api/products/", HTTP_AUTHORIZATION="Bearer other")
+        )
+        self.assertEqual(self.routes, ["default"] * 5 + ["replica_1", "default"])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_go_to_primary(self):
+        self.dispatch(self.factory.get("/api/products/"))
+        self.assertEqual(self.routes, ["default", "default"])
+
+
+class BenchmarkApiCommandTest(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, "results.json")
+        self.admin = User.objects.create_superuser(
+            username="testadmin", password="testpassword"
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def benchmark(self, **options):
+        call_command(
+            "benchmark_api",
+            products=20,
+            customers=5,
+            orders=20,
+            requests=3,
+            host="testserver",
+            output=self.output,
+            stdout=StringIO(),
+            stderr=StringIO(),
+            **{"mode": "inprocess", **options},
+        )
+        with open(self.output) as output:
+            return json.load(output)
+
+    def test_benchmark_covers_every_endpoint(self):
+        results = self.benchmark(username="testadmin", password="testpassword")[
+            "results"
+        ]["inprocess"]
+        self.assertEqual(
+            set(results),
+            {
+                f"{resource}-{action}"
+                for resource in ("products", "customers", "orders")
+                for action in ("list", "retrieve", "create")
+            }
+            | {"products-search", "token-obtain", "token-refresh"},
+        )
+        for run in results.values():
+            self.assertEqual(run["requests"], 3)
+            self.assertEqual(run["errors"], 0)
+            self.assertEqual(run["throttled"], 0)
+            self.assertLessEqual(run["p50_ms"], run["p95_ms"])
+            self.assertLessEqual(run["p95_ms"], run["p99_ms"])
+        self.assertEqual(results["orders-list"]["max_queries"], 3)
+
+    def test_benchmark_fails_past_baseline(self):
+        baseline = self.benchmark()
+        baseline["results"]["inprocess"]["orders-list"]["max_queries"] = 1
+        baseline_path = os.path.join(self.directory.name, "baseline.json")
+        with open(baseline_path, "w") as baseline_file:
+            json.dump(baseline, baseline_file)
+
+        with self.assertRaisesMessage(CommandError, "1 results regressed"):
+            self.benchmark(no_seed=True, baseline=baseline_path, tolerance=100)
+
+    def test_benchmark_fails_when_throttled(self):
+        get_store.cache_clear()
+        self.addCleanup(get_store.cache_clear)
+        with mock.patch(
+            "myapp.management.commands.benchmark_api.THROTTLE_RATE", "1/min"
+        ):
+            with self.assertRaisesMessage(CommandError, "inprocess products-list"):
+                self.benchmark()
+
+    def test_benchmark_uses_an_existing_user(self):
+        results = self.benchmark()["results"]["inprocess"]
+        self.assertNotIn("token-obtain", results)
+        self.assertEqual(results["products-create"]["errors"], 0)
+        self.assertEqual(
+            list(User.objects.values_list("username", flat=True)), ["testadmin"]
+        )
+
+        self.admin.delete()
+        with self.assertRaisesMessage(CommandError, "No such user"):
+            self.benchmark(no_seed=True)
+        with self.assertRaisesMessage(CommandError, "not the user's password"):
+            User.objects.create_superuser(username="admin", password="secret")
+            self.benchmark(no_seed=True, password="wrong")
+
+    def test_unreachable_server_is_reported(self):
+        self.benchmark()
+        with mock.patch(
+            "urllib.request.urlopen", side_effect=urllib.error.URLError("refused")
+        ):
+            with self.assertRaisesMessage(CommandError, "refused"):
+                self.benchmark(no_seed=True, mode="server")
+
+
+class BenchmarkSearchCommandTest(APITestCase):
+    def test_seeded_products_are_removed(self):
+        Product.objects.create(name="Kept", price=1)
+        output = StringIO()
+        call_command("benchmark_search", products=50, queries=4, stdout=output)
+        self.assertIn("icontains, no index", output.getvalue())
+        self.assertQuerySetEqual(
+            Product.objects.values_list("name", flat=True), ["Kept"]
+        )
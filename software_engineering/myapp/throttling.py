@@ -0,0 +1,131 @@
+import math
+import threading
+import time
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+class LocalBucketStore:
+    """
+    Buckets in this process's memory. Exact, but each worker process keeps
+    its own, so a client gets the budget once per process.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.next_prune = 0.0
+
+    def consume(self, key, capacity, refill_rate, now):
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            full_at = now + (capacity - tokens) / refill_rate
+            self.buckets[key] = (tokens, now, full_at)
+            if now >= self.next_prune:
+                self.prune(now)
+            return allowed, tokens
+
+    def prune(self, now):
+        # A bucket that has refilled is the same as no bucket.
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items() if bucket[2] > now
+        }
+        self.next_prune = now + 60
+
+
+class CacheBucketStore:
+    """
+    Buckets in the API_THROTTLE_CACHE_ALIAS cache, shared by every process
+    that uses it. Updates are read-modify-write without a lock, so two
+    concurrent requests of one client can both take its last token.
+    """
+
+    def __init__(self):
+        self.cache = caches[settings.API_THROTTLE_CACHE_ALIAS]
+
+    def consume(self, key, capacity, refill_rate, now):
+        tokens, updated = self.cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Expires once full, when it no longer differs from a new bucket.
+        timeout = math.ceil((capacity - tokens) / refill_rate) + 1
+        self.cache.set(key, (tokens, now), timeout)
+        return allowed, tokens
+
+
+@lru_cache
+def get_store(path):
+    return import_string(path)()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket rate limiting, with a bucket per client and view action.
+    Clients are JWT users, or IP addresses when anonymous. A rate of "N/period"
+    in DEFAULT_THROTTLE_RATES allows bursts of N requests and refills at N per
+    period. Rates are looked up as "<basename>.<action>" (e.g. "order.export")
+    and then "read" or "write" by method, or "anon". The budget is kept for
+    RateLimitHeadersMiddleware to report.
+    """
+
+    durations = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+    def __init__(self):
+        self.rates = api_settings.DEFAULT_THROTTLE_RATES
+        self.store = get_store(settings.API_THROTTLE_STORE)
+        # Wall-clock time, which processes sharing a cache agree on.
+        self.timer = time.time
+
+    def allow_request(self, request, view):
+        if getattr(request, "deferred_job", None) is not None:
+            # Throttled when it was queued.
+            return True
+        scope = self.get_scope(request, view)
+        rate = self.get_rate(request, scope)
+        if rate is None:
+            return True
+        self.capacity, self.refill_rate = self.parse_rate(rate)
+
+        if request.user and request.user.is_authenticated:
+            ident = f"user:{request.user.pk}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        allowed, self.tokens = self.store.consume(
+            f"throttle:{scope}:{ident}", self.capacity, self.refill_rate, self.timer()
+        )
+        request._request.rate_limit = (
+            self.capacity,
+            int(self.tokens),
+            math.ceil((self.capacity - self.tokens) / self.refill_rate),
+        )
+        return allowed
+
+    def get_scope(self, request, view):
+        basename = getattr(view, "basename", None) or type(view).__name__
+        action = getattr(view, "action", None) or request.method.lower()
+        return f"{basename}.{action}"
+
+    def get_rate(self, request, scope):
+        if scope in self.rates:
+            return self.rates[scope]
+        if not (request.user and request.user.is_authenticated):
+            return self.rates.get("anon")
+        return self.rates.get("read" if request.method in SAFE_METHODS else "write")
+
+    def parse_rate(self, rate):
+        count, period = rate.split("/")
+        return int(count), int(count) / self.durations[period[0]]
+
+    def wait(self):
+        return (1 - self.tokens) / self.refill_rate
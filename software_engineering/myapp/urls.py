@@ -1,13 +1,20 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, CustomerViewSet, OrderViewSet
+from .views import (
+    ProductViewSet,
+    CustomerViewSet,
+    OrderViewSet,
+    ReportViewSet,
+    JobViewSet,
+)
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-
 router = DefaultRouter()
 router.register(r"products", ProductViewSet, basename="product")
 router.register(r"customers", CustomerViewSet, basename="customer")
 router.register(r"orders", OrderViewSet, basename="order")
+router.register(r"reports", ReportViewSet, basename="report")
+router.register(r"jobs", JobViewSet, basename="job")
 
 urlpatterns = [
     path("", include(router.urls)),
@@ -0,0 +1,22 @@
+from rest_framework.response import Response
+from .serializers import ValuesSerializer
+
+
+class ValuesListMixin:
+    """
+    Serves list from QuerySet.values() rows through a ValuesSerializer built
+    from the view's serializer, with the same output as the ModelSerializer.
+    """
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_values_serializer()
+        queryset = serializer.values(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+
+        return Response(serializer.to_representation(queryset))
+
+    def get_values_serializer(self):
+        return ValuesSerializer(self.get_serializer())
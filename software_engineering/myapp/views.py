@@ -1,28 +1,318 @@
+import hmac
 import json
-from rest_framework import viewsets
+import os
+from django.conf import settings
+from django.db.models import F, Max, Prefetch, Sum
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.filters import SearchFilter
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from .bulk import BulkMixin
+from .cache import CachedReadMixin, product_cache
+from .conditional import ConditionalGetMixin
+from .exports import ExportMixin
+from .fieldsets import SparseFieldsetMixin
+from .jobs import DeferredActionMixin
+from .filters import KeysetOrderingFilter, OrderFilter, RankedSearchFilter
+from .metrics import get_shared_directory, registry
+from .pagination import OrderKeysetPagination
 from .permissions import IsAdminOrReadOnly
-from .serializers import ProductSerializer, CustomerSerializer, OrderSerializer
-from .models import Product, Customer, Order
+from .renderers import PassthroughRenderer
+from .serializers import (
+    ProductSerializer,
+    CustomerSerializer,
+    OrderSerializer,
+    OrderTransitionSerializer,
+    JobSerializer,
+    ReportQuerySerializer,
+    DailyReportSerializer,
+    StatusReportSerializer,
+    CustomerReportSerializer,
+    ProductReportSerializer,
+)
+from .models import (
+    Product,
+    Customer,
+    Order,
+    Job,
+    ReportDay,
+    DailySales,
+    DailyCustomerSales,
+    DailyProductSales,
+)
+from .values import ValuesListMixin
 from .forms import ProductForm
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(
+    ConditionalGetMixin,
+    CachedReadMixin,
+    BulkMixin,
+    ExportMixin,
+    SparseFieldsetMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet,
+):
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = (SearchFilter,)
+    read_cache = product_cache
+    filter_backends = (RankedSearchFilter,)
     search_fields = ["name"]
 
+    def get_list_validators(self):
+        # Every product write bumps the cache version, so it validates the
+        # collection without a query.
+        return [self.read_cache.get_version()]
 
-class CustomerViewSet(viewsets.ModelViewSet):
+
+class CustomerViewSet(
+    ConditionalGetMixin,
+    SparseFieldsetMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet,
+):
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(
+    DeferredActionMixin,
+    ConditionalGetMixin,
+    BulkMixin,
+    ExportMixin,
+    SparseFieldsetMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet,
+):
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = OrderKeysetPagination
+    filter_backends = (OrderFilter, KeysetOrderingFilter)
+    ordering_fields = ["date", "total_price", "item_count"]
+    ordering_sources = {"total_price": "cached_total"}
+    expandable_fields = ("customer", "products")
+    deferred_actions = (
+        "bulk",
+        "bulk_update",
+        "bulk_partial_update",
+        "bulk_destroy",
+        "transition",
+        "export",
+    )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_field_selected("customer"):
+            queryset = queryset.select_related("customer")
+        if self.is_field_selected("products"):
+            queryset = queryset.prefetch_related(
+                # Ordered like ValuesSerializer's related items.
+                Prefetch("products", queryset=Product.objects.order_by("id"))
+            )
+        return queryset
+
+    def get_expand(self):
+        if self.request is None or self.action not in ("list", "retrieve", "export"):
+            return []
+        expand = self.request.query_params.get("expand", "").split(",")
+        return [
+            field
+            for field in map(str.strip, expand)
+            if field in self.expandable_fields and self.is_field_selected(field)
+        ]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["expand"] = self.get_expand()
+        if self.request is not None and self.action == "transition":
+            context["filtered"] = OrderFilter().is_filtering(self.request)
+        return context
+
+    @action(detail=False, methods=["post"], serializer_class=OrderTransitionSerializer)
+    def transition(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data["status"]
+        ids = serializer.validated_data.get("ids")
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        moved = []
+        for source in Order.get_transition_sources(target):
+            moved += queryset.transition(
+                source, target, log=serializer.validated_data["log"]
+            )
+
+        if ids is None:
+            results = [{"id": pk, "result": "transitioned"} for pk in sorted(moved)]
+        else:
+            results = self.get_transition_results(ids, set(moved))
+        return Response(
+            {"status": target, "transitioned": len(moved), "results": results}
+        )
+
+    def get_transition_results(self, ids, moved):
+        statuses = dict(
+            Order.objects.filter(pk__in=set(ids) - moved).values_list("pk", "status")
+        )
+        results = []
+        for pk in ids:
+            if pk in moved:
+                results.append({"id": pk, "result": "transitioned"})
+            elif pk in statuses:
+                results.append(
+                    {"id": pk, "result": "rejected", "current_status": statuses[pk]}
+                )
+            else:
+                results.append({"id": pk, "result": "not_found"})
+        return results
+
+    def get_last_modified_fields(self):
+        return super().get_last_modified_fields() + [
+            f"{field}__{self.last_modified_field}" for field in self.get_expand()
+        ]
+
+
+class ReportViewSet(viewsets.GenericViewSet):
+    """
+    Sales reports read from the daily rollups that refresh_reports keeps,
+    so each one aggregates a row per day (and status, customer or product)
+    rather than every order. ?date_after= and ?date_before= bound the days,
+    ?status= narrows the daily report and the customer and product reports
+    return the top ?limit= by revenue.
+    """
+
+    permission_classes = [IsAuthenticated]
+    # Each report action sets its own; the index has no rows.
+    serializer_class = ReportQuerySerializer
+    pagination_class = None
+    reports = ("daily", "statuses", "customers", "products")
+
+    def list(self, request, *args, **kwargs):
+        return Response(
+            {
+                name: reverse(
+                    f"report-{name}", request=request, format=kwargs.get("format")
+                )
+                for name in self.reports
+            }
+        )
+
+    @action(detail=False, serializer_class=DailyReportSerializer)
+    def daily(self, request, *args, **kwargs):
+        query = self.get_query()
+        rollups = self.get_rollups(DailySales, query)
+        if "status" in query:
+            rollups = rollups.filter(status=query["status"])
+        rows = (
+            rollups.values("date")
+            .annotate(**self.get_totals(), item_count=Sum("item_count"))
+            .order_by("date")
+        )
+        return self.get_report_response(rows)
+
+    @action(detail=False, serializer_class=StatusReportSerializer)
+    def statuses(self, request, *args, **kwargs):
+        rows = (
+            self.get_rollups(DailySales, self.get_query())
+            .values("status")
+            .annotate(**self.get_totals(), item_count=Sum("item_count"))
+            .order_by("status")
+        )
+        return self.get_report_response(rows)
+
+    @action(detail=False, serializer_class=CustomerReportSerializer)
+    def customers(self, request, *args, **kwargs):
+        query = self.get_query()
+        rows = (
+            self.get_rollups(DailyCustomerSales, query)
+            .values("customer", name=F("customer__name"))
+            .annotate(**self.get_totals())
+            .order_by("-revenue", "customer")[: query["limit"]]
+        )
+        return self.get_report_response(rows)
+
+    @action(detail=False, serializer_class=ProductReportSerializer)
+    def products(self, request, *args, **kwargs):
+        query = self.get_query()
+        rows = (
+            self.get_rollups(DailyProductSales, query)
+            .values("product", name=F("product__name"))
+            .annotate(**self.get_totals())
+            .order_by("-revenue", "product")[: query["limit"]]
+        )
+        return self.get_report_response(rows)
+
+    def get_query(self):
+        serializer = ReportQuerySerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def get_rollups(self, model, query):
+        rollups = model.objects.order_by()
+        if "date_after" in query:
+            rollups = rollups.filter(date__gte=query["date_after"])
+        if "date_before" in query:
+            rollups = rollups.filter(date__lte=query["date_before"])
+        return rollups
+
+    def get_totals(self):
+        return {"order_count": Sum("order_count"), "revenue": Sum("revenue")}
+
+    def get_report_response(self, rows):
+        refreshed = ReportDay.objects.aggregate(refreshed_at=Max("refreshed_at"))
+        return Response(
+            {
+                "refreshed_at": refreshed["refreshed_at"],
+                "results": self.get_serializer(rows, many=True).data,
+            }
+        )
+
+
+class JobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Status and result of the caller's deferred requests."""
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+    @action(detail=True, renderer_classes=[PassthroughRenderer])
+    def download(self, request, *args, **kwargs):
+        job = self.get_object()
+        if not job.result_file:
+            raise Http404
+        return FileResponse(
+            open(os.path.join(settings.JOB_RESULT_DIR, job.result_file), "rb"),
+            as_attachment=True,
+            filename=job.result["filename"],
+            content_type=job.result["content_type"],
+        )
+
+
+def can_read_metrics(request):
+    token = settings.API_METRICS_TOKEN
+    if token and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return True
+    return request.META.get("REMOTE_ADDR") in settings.API_METRICS_ALLOWED_IPS
+
+
+@require_GET
+def metrics(request):
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    shared = get_shared_directory(settings.API_METRICS_DIR)
+    return HttpResponse(
+        registry.render(shared.collect() if shared is not None else None),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,36 @@
+"""
+Settings for the deployed container, run by gunicorn (see gunicorn.conf.py).
+Select with DJANGO_SETTINGS_MODULE=software_engineering.production_settings.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from .settings import *  # noqa: F401, F403
+
+# Also stops every connection from keeping a copy of each query it runs.
+DEBUG = False
+
+# Signs sessions and JWTs, so the development fallback will not do.
+SECRET_KEY = os.getenv("DJANGO_SECRET")  # noqa: F405
+if not SECRET_KEY:
+    raise ImproperlyConfigured("Set DJANGO_SECRET for the production settings.")
+
+ALLOWED_HOSTS = os.getenv("DJANGO_ALLOWED_HOSTS", "localhost").split()  # noqa: F405
+
+# Compressed copies and hashed names, so WhiteNoise can serve static files
+# with far-future cache headers.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"
+    },
+}
+
+# Saving a user drops its cached copy only from the cache of the worker that
+# saved it, so the user cache stays off unless the workers share a cache.
+if CACHE_BACKEND == "django.core.cache.backends.locmem.LocMemCache":  # noqa: F405
+    API_USER_CACHE_TIMEOUT = int(os.getenv("API_USER_CACHE_TIMEOUT", 0))  # noqa: F405
+    if API_USER_CACHE_TIMEOUT:
+        raise ImproperlyConfigured(
+            "API_USER_CACHE_TIMEOUT needs a CACHE_BACKEND shared by all "
+            "workers, such as Redis or Memcached, not LocMemCache."
+        )
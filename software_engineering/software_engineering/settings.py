@@ -21,9 +21,10 @@ load_dotenv()
 SECRET_KEY = os.getenv("DJANGO_SECRET", "default_secret_key")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# production_settings turns it off whatever DEBUG is set to.
+DEBUG = os.getenv("DEBUG", "1").lower() in ("1", "true")
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = os.getenv("DJANGO_ALLOWED_HOSTS", "").split()
 
 
 # Application definition
@@ -35,12 +36,20 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "drf_yasg",
     "rest_framework",
     "myapp",
 ]
 
 MIDDLEWARE = [
+    # Serves STATIC_ROOT (browsable API and Swagger UI assets) when DEBUG
+    # is off, before the API middleware sees the request.
+    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "myapp.middleware.RequestMetricsMiddleware",
+    "myapp.middleware.CompressionMiddleware",
+    "myapp.middleware.ReplicaRoutingMiddleware",
+    "myapp.middleware.RateLimitHeadersMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -74,6 +83,8 @@ WSGI_APPLICATION = "software_engineering.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+DATABASE_POOL = os.getenv("DATABASE_POOL", "0").lower() in ("1", "true")
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -82,18 +93,153 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("DATABASE_HOST", "localhost"),
         "PORT": os.getenv("DATABASE_PORT", 5432),
+        # A pool replaces persistent connections; Django rejects both at once.
+        "CONN_MAX_AGE": (
+            0 if DATABASE_POOL else int(os.getenv("DATABASE_CONN_MAX_AGE", 60))
+        ),
+        "CONN_HEALTH_CHECKS": (
+            os.getenv("DATABASE_CONN_HEALTH_CHECKS", "1").lower() in ("1", "true")
+        ),
     }
 }
 
+if DATABASE_POOL:
+    # Needs psycopg 3 with psycopg_pool installed.
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DATABASE_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.getenv("DATABASE_POOL_MAX_SIZE", 10)),
+            "timeout": float(os.getenv("DATABASE_POOL_TIMEOUT", 10)),
+        }
+    }
+
+# Comma-separated host[:port] list of read replicas of the default database.
+DATABASE_REPLICAS = []
+for index, address in enumerate(
+    filter(None, os.getenv("DATABASE_REPLICA_HOSTS", "").split(",")), start=1
+):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica_{index}")
+
+DATABASE_ROUTERS = ["myapp.routers.ReplicaRouter"]
+
+# How long a session keeps reading from the primary after it wrote.
+DATABASE_REPLICA_STICKY_SECONDS = int(os.getenv("DATABASE_REPLICA_STICKY_SECONDS", 5))
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHE_BACKEND = os.getenv(
+    "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.getenv("CACHE_LOCATION", "software-engineering"),
+        "TIMEOUT": int(os.getenv("CACHE_TIMEOUT", 300)),
+    }
+}
+
+if CACHE_BACKEND == "django.core.cache.backends.locmem.LocMemCache":
+    CACHES["default"]["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 1000)),
+    }
+
+API_CACHE_ALIAS = "default"
+API_CACHE_TIMEOUT = int(os.getenv("API_CACHE_TIMEOUT", 60))
+# How long JWTAuthentication may reuse a user without reading it again; 0
+# turns the user cache off. With several worker processes it needs a
+# CACHE_BACKEND they all share, which production_settings enforces.
+API_USER_CACHE_TIMEOUT = int(os.getenv("API_USER_CACHE_TIMEOUT", 30))
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "myapp.authentication.JWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "myapp.renderers.ORJSONRenderer",
+        "myapp.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "myapp.renderers.ORJSONParser",
+        "myapp.renderers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    "DEFAULT_PAGINATION_CLASS": "myapp.pagination.KeysetPagination",
+    "PAGE_SIZE": int(os.getenv("API_PAGE_SIZE", 100)),
+    "DEFAULT_THROTTLE_CLASSES": [
+        "myapp.throttling.TokenBucketThrottle",
+    ],
+    # "N/period": bursts of N requests, refilled at N per period, per client
+    # and view action. "<basename>.<action>" keys override read/write.
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": os.getenv("API_THROTTLE_ANON_RATE", "60/min"),
+        "read": os.getenv("API_THROTTLE_READ_RATE", "600/min"),
+        "write": os.getenv("API_THROTTLE_WRITE_RATE", "120/min"),
+        "order.export": os.getenv("API_THROTTLE_EXPORT_RATE", "10/min"),
+        "product.export": os.getenv("API_THROTTLE_EXPORT_RATE", "10/min"),
+    },
 }
 
+# Where TokenBucketThrottle keeps its buckets: LocalBucketStore (per
+# process) or CacheBucketStore (API_THROTTLE_CACHE_ALIAS, shared by every
+# process when that cache is).
+API_THROTTLE_STORE = os.getenv(
+    "API_THROTTLE_STORE", "myapp.throttling.LocalBucketStore"
+)
+API_THROTTLE_CACHE_ALIAS = os.getenv("API_THROTTLE_CACHE_ALIAS", "default")
+
+# Smaller responses are sent uncompressed: they gain little and cost a
+# compression each. Brotli quality 11 is for static files; dynamic responses
+# want 4-5, which compress better than gzip and no slower.
+API_COMPRESSION_MIN_SIZE = int(os.getenv("API_COMPRESSION_MIN_SIZE", 1024))
+API_BROTLI_QUALITY = int(os.getenv("API_BROTLI_QUALITY", 4))
+
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 1000))
+API_MAX_BULK_SIZE = int(os.getenv("API_MAX_BULK_SIZE", 50000))
+
+# Share of requests recorded by RequestMetricsMiddleware, and the latency
+# above which a request is logged as slow.
+API_METRICS_SAMPLE_RATE = float(os.getenv("API_METRICS_SAMPLE_RATE", 1.0))
+API_SLOW_REQUEST_MS = float(os.getenv("API_SLOW_REQUEST_MS", 500))
+
+# /metrics exposes per-view latencies and SQL fingerprints, so only clients
+# at these addresses, or sending "Authorization: Bearer <API_METRICS_TOKEN>",
+# may read it.
+API_METRICS_ALLOWED_IPS = os.getenv("API_METRICS_ALLOWED_IPS", "127.0.0.1 ::1").split()
+API_METRICS_TOKEN = os.getenv("API_METRICS_TOKEN", "")
+# Directory where each worker process writes its metrics for /metrics to add
+# up. Unset, /metrics reports the series of whichever process answers it.
+# gunicorn.conf.py sets one for its workers.
+API_METRICS_DIR = os.getenv("API_METRICS_DIR", "")
+
+# refresh_reports also rescans the orders written up to this many seconds
+# before the newest one it has seen, in case their transaction committed late.
+REPORT_REFRESH_OVERLAP = int(os.getenv("REPORT_REFRESH_OVERLAP", 300))
+
+# Background jobs (myapp.jobs). The lease must outlast the longest job: a
+# job running longer is taken for lost and retried up to JOB_MAX_ATTEMPTS
+# times in all.
+JOB_RESULT_DIR = os.getenv("JOB_RESULT_DIR", str(BASE_DIR / "job_results"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 3600))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 1))
+# Finished jobs, and their result files, are deleted by the workers this
+# many seconds after they finish.
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 7 * 24 * 3600))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -130,6 +276,8 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = "static/"
+# Filled by collectstatic, which the Dockerfile runs.
+STATIC_ROOT = BASE_DIR / "staticfiles"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -20,6 +20,7 @@ from django.urls import path, include
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework.permissions import AllowAny
+from myapp.views import metrics
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -35,6 +36,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("myapp.urls")),
+    path("metrics", metrics, name="metrics"),
     path(
         "swagger/",
         schema_view.with_ui("swagger", cache_timeout=0),